@@ -0,0 +1,328 @@
+"""Helper functions to aggregate the emissions and energy consumption of
+Aimsun Microsimulations.
+
+When an emission model is enabled in Aimsun, the MISYS and MISECT tables get
+one column per pollutant with the quantity emitted during each time interval,
+next to the fuel and battery consumption columns. The network-wide quantities
+are read from MISYS with a single query per database. The quantities of groups
+of road sections (e.g. the sections of one road and direction) are aggregated
+from MISECT while streaming it in batches, so the memory used does not grow
+with the size of the network:
+    >>> emissions, group_names, time_interval_indices = \\
+    ...     get_road_group_emissions(database, {"Mission Blvd": [1053, 1054]})
+"""
+
+from __future__ import annotations
+
+import datetime
+import enum
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calibration.postprocessing_util import (
+    ALL_VEHICLE_TYPES,
+    DEFAULT_BATCH_SIZE,
+    AimsunMicroOutputDatabase,
+    MiSectColumns,
+    MiSysColumns,
+    get_axis_index,
+)
+from utils.aimsun_input_utils import InternalId
+
+
+class EmissionsColumns(enum.Enum):
+    """Column names of the pollutant and energy consumption quantities in the
+    MISYS and MISECT tables. The pollutant columns only exist when the
+    corresponding emission model was enabled in the simulation.
+
+    Attributes:
+        CO2: Carbon dioxide emitted during a time interval. Units are grams.
+        NOX: Nitrogen oxides emitted during a time interval. Units are grams.
+        VOC: Volatile organic compounds emitted during a time interval. Units
+            are grams.
+        PM: Particulate matter emitted during a time interval. Units are
+            grams.
+        FUEL_CONSUMPTION: Fuel consumed during a time interval. Units are
+            liters.
+        BATTERY_CONSUMPTION: Battery energy consumed during a time interval.
+            Units are kilowatt-hours.
+    """
+
+    CO2 = "CO2"
+    NOX = "NOx"
+    VOC = "VOC"
+    PM = "PM"
+    FUEL_CONSUMPTION = "fuelc"
+    BATTERY_CONSUMPTION = "batteryc"
+    # Add more columns as needed.
+
+
+POLLUTANT_COLUMNS = (EmissionsColumns.CO2, EmissionsColumns.NOX,
+                     EmissionsColumns.VOC, EmissionsColumns.PM)
+# Label of the metrics of the emissions table, with their column.
+EMISSION_METRICS = {column.value: column.value for column in POLLUTANT_COLUMNS}
+
+
+def get_system_emissions(
+    database: AimsunMicroOutputDatabase,
+    columns: Sequence[EmissionsColumns] = POLLUTANT_COLUMNS,
+    time_intervals: Sequence[datetime.time] = None,
+    replication_ids: Sequence[int] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the quantities emitted or consumed in the entire network at many
+    time intervals, with a single query on the MISYS table.
+
+    Args:
+        database: Output database of the scenario.
+        columns: Columns of the MISYS table to get.
+        time_intervals: Time intervals of when we want the data from. If None,
+            all time intervals of the simulation are used.
+        replication_ids: IDs of the replications to average. If None, all
+            rows of the table are averaged.
+        vehicle_type: Type of vehicles included in the data.
+    Returns:
+        data: Array of shape (columns, time intervals). Columns missing from
+            the database are set to NaN.
+        time_interval_indices: Index in the simulation output database of the
+            time interval of each column of data.
+    """
+    time_interval_indices = _get_time_interval_indices(
+        database, time_intervals)
+    column_names = [column.value for column in columns]
+    found = [i for i, column_name in enumerate(column_names) if column_name
+             in database.schema.get(database.system_table.table_name, [])]
+    data = np.full((len(column_names), len(time_interval_indices)), np.nan)
+    if found:
+        conditions = {MiSysColumns.VEHICLE_TYPE.value: vehicle_type}
+        if replication_ids is not None:
+            conditions[MiSysColumns.REPLICATION_INTERNAL_ID.value] = \
+                list(replication_ids)
+        data[found], _ = database.system_table.get_dense_arrays(
+            [column_names[i] for i in found],
+            [MiSysColumns.TIME_INTERVAL.value], conditions,
+            [time_interval_indices])
+    return data, time_interval_indices
+
+
+class SectionEmissionsAggregator:
+    """Single-pass aggregator of the quantities emitted or consumed per group
+    of road sections and time interval.
+
+    Rows of the MISECT table are added in batches with update(), e.g. while
+    streaming the table, so that networks with many road sections are
+    aggregated without loading the table in memory. The quantities of the
+    sections of each group are summed, then averaged over the replications.
+
+    Attributes:
+        column_names: Columns of the MISECT table that are aggregated.
+        group_names: Name of each group of road sections.
+        time_interval_indices: Index in the simulation output database of the
+            time intervals that are aggregated.
+    """
+
+    column_names: List[str]
+    group_names: List[str]
+    time_interval_indices: np.ndarray
+
+    def __init__(
+        self, column_names: Sequence[str],
+        section_groups: Dict[str, Sequence[InternalId]],
+        time_interval_indices: Sequence[int]
+    ):
+        self.column_names = list(column_names)
+        self.group_names = list(section_groups)
+        self.time_interval_indices = np.asarray(time_interval_indices)
+        # A section can belong to several groups: keep one (section, group)
+        # item per membership.
+        self.__section_internal_ids = np.array([
+            section_id for section_ids in section_groups.values()
+            for section_id in section_ids], dtype=np.int64)
+        self.__section_group_index = np.array([
+            i for i, section_ids in enumerate(section_groups.values())
+            for _ in section_ids], dtype=np.int64)
+        order = np.argsort(self.__section_internal_ids, kind="stable")
+        self.__section_internal_ids = self.__section_internal_ids[order]
+        self.__section_group_index = self.__section_group_index[order]
+        self.__replication_ids = set()
+        self.__total = np.zeros((len(self.column_names), len(self.group_names),
+                                 len(self.time_interval_indices)))
+
+    def update(self, batch: np.ndarray):
+        """Add a batch of rows to the aggregation.
+
+        Args:
+            batch: Structured array with the replication, section, time
+                interval and aggregated columns of the MISECT table as fields,
+                as yielded by SQLiteTable.iter_batches(). NaN values are
+                ignored.
+        """
+        _, interval = get_axis_index(
+            np.asarray(batch[MiSectColumns.TIME_INTERVAL.value]),
+            self.time_interval_indices)
+        section_ids = np.asarray(
+            batch[MiSectColumns.SECTION_INTERNAL_ID.value], dtype=np.int64)
+        first = np.searchsorted(self.__section_internal_ids, section_ids,
+                                side="left")
+        last = np.searchsorted(self.__section_internal_ids, section_ids,
+                               side="right")
+        valid = (interval >= 0) & (last > first)
+        self.__replication_ids.update(np.unique(np.asarray(
+            batch[MiSectColumns.REPLICATION_INTERNAL_ID.value])[
+            interval >= 0]).tolist())
+        if not np.any(valid):
+            return
+        # Repeat each row once per group its section belongs to.
+        num_groups = (last - first)[valid]
+        row_index = np.repeat(np.flatnonzero(valid), num_groups)
+        membership = np.repeat(first[valid] - np.cumsum(num_groups)
+                               + num_groups, num_groups) \
+            + np.arange(len(row_index))
+        flat_index = self.__section_group_index[membership] \
+            * len(self.time_interval_indices) + interval[row_index]
+        size = self.__total[0].size
+        for i, column_name in enumerate(self.column_names):
+            values = np.asarray(batch[column_name], dtype=float)[row_index]
+            self.__total[i] += np.bincount(
+                flat_index, weights=np.nan_to_num(values),
+                minlength=size).reshape(self.__total[i].shape)
+
+    def get_totals(self) -> np.ndarray:
+        """Get the aggregated quantities.
+
+        Returns:
+            totals: Array of shape (columns, groups, time intervals) with the
+                sum over the sections of each group, averaged over the
+                replications added so far.
+        """
+        return self.__total / max(len(self.__replication_ids), 1)
+
+
+def get_road_group_emissions(
+    database: AimsunMicroOutputDatabase,
+    section_groups: Dict[str, Sequence[InternalId]],
+    columns: Sequence[EmissionsColumns] = POLLUTANT_COLUMNS,
+    time_intervals: Sequence[datetime.time] = None,
+    replication_ids: Sequence[int] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Get the quantities emitted or consumed by groups of road sections at
+    many time intervals, streaming the MISECT table in batches.
+
+    Args:
+        database: Output database of the scenario.
+        section_groups: Internal IDs of the road sections of each group, keyed
+            by group name.
+        columns: Columns of the MISECT table to aggregate.
+        time_intervals: Time intervals of when we want the data from. If None,
+            all time intervals of the simulation are used.
+        replication_ids: IDs of the replications to average. If None, all
+            replications of the table are used.
+        vehicle_type: Type of vehicles included in the data.
+        batch_size: Number of rows read from the database at once.
+    Returns:
+        data: Array of shape (columns, groups, time intervals) with the sum
+            over the sections of each group, averaged over the replications.
+        group_names: Name of each group.
+        time_interval_indices: Index in the simulation output database of the
+            time interval of each item of the last axis.
+    """
+    column_names = [column.value for column in columns]
+    database.validate_columns(database.sections_table.table_name, column_names)
+    time_interval_indices = _get_time_interval_indices(
+        database, time_intervals)
+    aggregator = SectionEmissionsAggregator(
+        column_names, section_groups, time_interval_indices)
+    conditions = {
+        MiSectColumns.VEHICLE_TYPE.value: vehicle_type,
+        MiSectColumns.TIME_INTERVAL.value: time_interval_indices.tolist(),
+    }
+    if replication_ids is not None:
+        conditions[MiSectColumns.REPLICATION_INTERNAL_ID.value] = \
+            list(replication_ids)
+    for batch in database.sections_table.iter_batches(
+            [MiSectColumns.REPLICATION_INTERNAL_ID.value,
+             MiSectColumns.SECTION_INTERNAL_ID.value,
+             MiSectColumns.TIME_INTERVAL.value] + column_names,
+            conditions, batch_size,
+            {column_name: np.float64 for column_name in column_names}):
+        aggregator.update(batch)
+    return aggregator.get_totals(), aggregator.group_names, \
+        time_interval_indices
+
+
+def aggregate_section_emissions(
+    data: np.ndarray, group_masks: np.ndarray
+) -> np.ndarray:
+    """Sum quantities over the road sections of each group, for all
+    scenarios, columns and time intervals at once.
+
+    Args:
+        data: Array of shape (..., road sections, time intervals), e.g.
+            (scenarios, columns, road sections, time intervals). NaN values
+            are ignored.
+        group_masks: Boolean array of shape (groups, road sections).
+    Returns:
+        totals: Array of shape (..., groups, time intervals).
+    """
+    return np.einsum("...st,gs->...gt", np.nan_to_num(data),
+                     group_masks.astype(float))
+
+
+def get_emissions_table(
+    scenario_emissions: Dict[str, np.ndarray],
+    emission_metrics: Dict[str, str] = None,
+    column_names: Sequence[str] = None,
+) -> pd.DataFrame:
+    """Summarize the network-wide quantities of each scenario over the time
+    intervals, in the layout of data/lv/emissions.
+
+    Args:
+        scenario_emissions: Array of shape (columns, time intervals) of each
+            scenario, keyed by scenario name, as returned by
+            get_system_emissions().
+        emission_metrics: Column of each metric of the table, keyed by label.
+            Defaults to EMISSION_METRICS.
+        column_names: Column of each item of the first axis of the arrays.
+            Defaults to the columns of POLLUTANT_COLUMNS.
+    Returns:
+        table: Table with one row per metric and scenario, and columns metric,
+            scenario, mean and std (with one degree of freedom) over the time
+            intervals.
+    """
+    if emission_metrics is None:
+        emission_metrics = EMISSION_METRICS
+    if column_names is None:
+        column_names = [column.value for column in POLLUTANT_COLUMNS]
+    column_names = list(column_names)
+    index = [column_names.index(column_name)
+             for column_name in emission_metrics.values()]
+    # Array of shape (metrics, scenarios, time intervals).
+    data = np.stack([np.asarray(emissions)[index]
+                     for emissions in scenario_emissions.values()], axis=1)
+    valid = ~np.isnan(data)
+    count = valid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, data, 0.0).sum(axis=-1) / count
+        std = np.sqrt((np.where(valid, data - mean[..., np.newaxis], 0.0)
+                       ** 2).sum(axis=-1) / (count - 1))
+    return pd.DataFrame({
+        "metric": np.repeat(list(emission_metrics), len(scenario_emissions)),
+        "scenario": list(scenario_emissions) * len(emission_metrics),
+        "mean": np.where(count > 0, mean, np.nan).reshape(-1),
+        "std": np.where(count > 1, std, np.nan).reshape(-1),
+    })
+
+
+def _get_time_interval_indices(
+    database: AimsunMicroOutputDatabase,
+    time_intervals: Sequence[datetime.time] = None
+) -> np.ndarray:
+    """Convert time intervals to indices, defaulting to all time intervals of
+    the simulation when time_intervals is None."""
+    if time_intervals is None:
+        return np.arange(1, database.get_time_interval_settings()[2] + 1)
+    return np.asarray(database.convert_times_to_int(time_intervals))
@@ -0,0 +1,139 @@
+"""Tests for emissions_util."""
+
+import unittest
+
+import numpy as np
+
+from calibration.emissions_util import (
+    EmissionsColumns,
+    SectionEmissionsAggregator,
+    aggregate_section_emissions,
+    get_emissions_table,
+    get_road_group_emissions,
+    get_system_emissions,
+)
+from calibration.output_database_test_util import (
+    NUM_TIME_INTERVALS,
+    REPLICATION_IDS,
+    SECTION_INTERNAL_IDS,
+    TIME_LIST,
+    OutputDatabaseTestCase,
+)
+from calibration.postprocessing_util import AimsunMicroOutputDatabase
+
+COLUMNS = [EmissionsColumns.CO2, EmissionsColumns.NOX,
+           EmissionsColumns.FUEL_CONSUMPTION]
+
+
+def _get_emissions_queries():
+    """Get the queries that add CO2, NOx and fuel consumption columns to the
+    MISYS and MISECT tables of a test output database.
+
+    CO2 is 1000 * interval + replication in MISYS, and
+    100 * (section + 1) + interval in MISECT. NOx is a tenth of CO2 and fuel
+    consumption a hundredth.
+    """
+    queries = [(f"ALTER TABLE {table_name} ADD COLUMN {column.value} REAL", ())
+               for table_name in ["MISYS", "MISECT"] for column in COLUMNS]
+    queries.append(("UPDATE MISYS SET CO2 = 1000 * ent + did", ()))
+    for section, internal_id in enumerate(SECTION_INTERNAL_IDS):
+        queries.append(("UPDATE MISECT SET CO2 = ? + ent WHERE oid = ?",
+                        (100.0 * (section + 1), internal_id)))
+    for table_name in ["MISYS", "MISECT"]:
+        queries.append((
+            f"UPDATE {table_name} SET NOx = CO2 / 10, fuelc = CO2 / 100", ()))
+    return queries
+
+
+class TestEmissions(OutputDatabaseTestCase):
+    """Test the aggregation of emissions from an output database."""
+
+    def setUp(self):
+        super().setUp()
+        self.database_path = self.create_database(
+            "micro.sqlite", _get_emissions_queries())
+        self.database = AimsunMicroOutputDatabase(self.database_path)
+
+    def tearDown(self):
+        self.database.close()
+        super().tearDown()
+
+    def test_get_system_emissions(self):
+        """Test that replications are averaged and missing columns are NaN."""
+        data, time_interval_indices = get_system_emissions(
+            self.database, COLUMNS + [EmissionsColumns.PM])
+        self.assertEqual(time_interval_indices.tolist(), [1, 2, 3, 4])
+        co2 = 1000.0 * time_interval_indices + np.mean(REPLICATION_IDS)
+        np.testing.assert_allclose(data[0], co2)
+        np.testing.assert_allclose(data[1], co2 / 10)
+        np.testing.assert_allclose(data[2], co2 / 100)
+        self.assertTrue(np.isnan(data[3]).all())
+
+        data, time_interval_indices = get_system_emissions(
+            self.database, COLUMNS[:1], TIME_LIST[1:2], REPLICATION_IDS[:1])
+        self.assertEqual(time_interval_indices.tolist(), [2])
+        np.testing.assert_allclose(data, [[2000.0 + REPLICATION_IDS[0]]])
+
+    def test_get_road_group_emissions(self):
+        """Test the streaming aggregation per group of road sections."""
+        section_groups = {"First": SECTION_INTERNAL_IDS[:1],
+                          "Second": SECTION_INTERNAL_IDS[1:],
+                          "All": SECTION_INTERNAL_IDS}
+        intervals = np.arange(1, NUM_TIME_INTERVALS + 1)
+        first = 100.0 + intervals
+        second = 200.0 + intervals
+        for batch_size in [1, 3, 1000]:
+            data, group_names, time_interval_indices = \
+                get_road_group_emissions(self.database, section_groups,
+                                         COLUMNS, batch_size=batch_size)
+            self.assertEqual(group_names, list(section_groups))
+            self.assertEqual(time_interval_indices.tolist(),
+                             intervals.tolist())
+            np.testing.assert_allclose(
+                data[0], [first, second, first + second])
+            np.testing.assert_allclose(data[2], data[0] / 100)
+
+    def test_get_road_group_emissions_missing_column(self):
+        """Test that missing pollutant columns are reported."""
+        with self.assertRaises(ValueError):
+            get_road_group_emissions(self.database, {"All": [11]},
+                                     [EmissionsColumns.PM])
+
+    def test_aggregator_ignores_other_sections(self):
+        """Test that rows of sections outside of all groups are only used to
+        count replications."""
+        aggregator = SectionEmissionsAggregator(["CO2"], {"A": [1]}, [1, 2])
+        aggregator.update(np.array(
+            [(1, 1, 1, 10.0), (2, 1, 2, 30.0), (1, 5, 1, 99.0),
+             (2, 5, 3, 99.0), (3, 5, 3, 99.0)],
+            dtype=[("did", np.int64), ("oid", np.int64), ("ent", np.int64),
+                   ("CO2", np.float64)]))
+        np.testing.assert_allclose(aggregator.get_totals(), [[[5.0, 15.0]]])
+
+    def test_aggregate_section_emissions(self):
+        """Test the vectorized sum over groups of road sections."""
+        data = np.arange(24, dtype=float).reshape(2, 1, 3, 4)
+        data[0, 0, 1, 0] = np.nan
+        group_masks = np.array([[True, True, False], [False, False, True]])
+        totals = aggregate_section_emissions(data, group_masks)
+        self.assertEqual(totals.shape, (2, 1, 2, 4))
+        np.testing.assert_allclose(totals[0, 0, 0], [0.0, 6.0, 8.0, 10.0])
+        np.testing.assert_allclose(totals[1, 0, 1], data[1, 0, 2])
+
+    def test_get_emissions_table(self):
+        """Test the summary of the emissions of several scenarios."""
+        data, _ = get_system_emissions(self.database, COLUMNS)
+        table = get_emissions_table(
+            {"A": data, "B": 2 * data}, {"CO2": "CO2", "Fuel (L)": "fuelc"},
+            [column.value for column in COLUMNS])
+        self.assertEqual(list(table["metric"]),
+                         ["CO2", "CO2", "Fuel (L)", "Fuel (L)"])
+        self.assertEqual(list(table["scenario"]), ["A", "B", "A", "B"])
+        np.testing.assert_allclose(
+            table["mean"], [np.mean(data[0]), 2 * np.mean(data[0]),
+                            np.mean(data[2]), 2 * np.mean(data[2])])
+        np.testing.assert_allclose(table["std"][0], np.std(data[0], ddof=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
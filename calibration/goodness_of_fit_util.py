@@ -0,0 +1,307 @@
+"""Goodness-of-fit metrics between real and simulated traffic data, used to
+accept or reject a calibration.
+
+All metrics are computed in one vectorized call over aligned (detectors, time
+intervals) arrays, per detector, per time interval and pooled over both:
+    >>> per_detector, per_interval, pooled = compute_goodness_of_fit(
+    ...     real_flow, simulated_flow)
+    >>> pooled["geh_percentage"]  # Percentage of values with GEH < 5.
+
+The uncertainty of the regression slope, R-squared and GEH percentage is
+estimated by bootstrapping detectors and time intervals:
+    >>> intervals = bootstrap_confidence_intervals(real_flow, simulated_flow)
+    >>> slope = intervals[intervals["statistic"] == "slope"][0]
+    >>> passes = 0.8 <= slope["lower"] and slope["upper"] <= 1.2
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+from typing import Tuple, Union
+
+import numpy as np
+
+DEFAULT_GEH_THRESHOLD = 5.0
+DEFAULT_NUM_RESAMPLES = 2000
+DEFAULT_CONFIDENCE_LEVEL = 0.95
+# Resamples computed with a single matrix product, bounding memory use.
+BOOTSTRAP_CHUNK_SIZE = 500
+BOOTSTRAP_STATISTICS = ("slope", "r_sq", "geh_percentage")
+GOODNESS_OF_FIT_DTYPE = np.dtype([
+    ("count", np.int64),
+    ("geh_percentage", np.float64),
+    ("mean_geh", np.float64),
+    ("rmse", np.float64),
+    ("rmspe", np.float64),
+    ("mape", np.float64),
+    ("theil_u", np.float64),
+])
+
+
+def compute_geh(real: np.ndarray, simulated: np.ndarray) -> np.ndarray:
+    """Compute the GEH statistic of every pair of real and simulated hourly
+    flow.
+
+    Args:
+        real: Array of real flow in vehicles per hour.
+        simulated: Array of simulated flow in vehicles per hour, with the same
+            shape as real.
+    Returns:
+        geh: Array of GEH statistics. 0 where both flows are 0.
+    """
+    real = np.asarray(real, dtype=float)
+    simulated = np.asarray(simulated, dtype=float)
+    total = simulated + real
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, np.sqrt(
+            2 * (simulated - real) ** 2 / total), 0.0)
+
+
+def compute_goodness_of_fit(
+    real: np.ndarray, simulated: np.ndarray, weights: np.ndarray = None,
+    mask: np.ndarray = None, geh_threshold: float = DEFAULT_GEH_THRESHOLD
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute goodness-of-fit metrics between real and simulated data, per
+    detector, per time interval and pooled over all detectors and time
+    intervals.
+
+    The metrics are:
+        count: Number of values used.
+        geh_percentage: Weighted percentage of values with a GEH statistic
+            below geh_threshold.
+        mean_geh: Weighted mean of the GEH statistic.
+        rmse: Root mean square error.
+        rmspe: Root mean square percentage error, over the values with
+            non-zero real data.
+        mape: Mean absolute percentage error, over the values with non-zero
+            real data.
+        theil_u: Theil's inequality coefficient U, between 0 (perfect fit)
+            and 1.
+
+    Args:
+        real: Array of shape (detectors, time intervals) of real data, e.g.
+            hourly flow.
+        simulated: Array of simulated data, with the same shape as real.
+        weights: Non-negative weight of every value, broadcastable to the
+            shape of real. If None, all values have the same weight.
+        mask: Boolean array of the values to use, broadcastable to the shape
+            of real. Values where real or simulated data is NaN are always
+            left out.
+        geh_threshold: GEH statistic below which a value is acceptable.
+    Returns:
+        per_detector: Structured array of shape (detectors,) with one field
+            per metric.
+        per_interval: Structured array of shape (time intervals,).
+        pooled: Structured array of shape ().
+        Metrics without any value to compute them from are NaN.
+    """
+    real = np.asarray(real, dtype=float)
+    simulated = np.asarray(simulated, dtype=float)
+    assert real.ndim == 2 and real.shape == simulated.shape
+    valid = ~np.isnan(real) & ~np.isnan(simulated)
+    if mask is not None:
+        valid &= np.broadcast_to(np.asarray(mask, dtype=bool), real.shape)
+    weights = np.ones(real.shape) if weights is None else np.broadcast_to(
+        np.asarray(weights, dtype=float), real.shape)
+    weights = np.where(valid, weights, 0.0)
+    real = np.where(valid, real, 0.0)
+    simulated = np.where(valid, simulated, 0.0)
+
+    error = simulated - real
+    geh = compute_geh(real, simulated)
+    percentage_weights = np.where(real != 0, weights, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentage_error = np.where(real != 0, error / real, 0.0)
+    # Weighted sums of every term, reduced along each axis at once.
+    terms = np.stack([
+        valid.astype(float),
+        weights,
+        weights * (geh < geh_threshold),
+        weights * geh,
+        weights * error ** 2,
+        percentage_weights,
+        percentage_weights * percentage_error ** 2,
+        percentage_weights * np.abs(percentage_error),
+        weights * simulated ** 2,
+        weights * real ** 2,
+    ])
+    return tuple(_get_metrics(terms.sum(axis=axis))
+                 for axis in [2, 1, (1, 2)])
+
+
+def _get_metrics(sums: np.ndarray) -> np.ndarray:
+    """Compute the metrics from the weighted sums of the terms of
+    compute_goodness_of_fit(), stacked along the first axis."""
+    count, total_weight, geh_pass, geh, squared_error, total_percentage_weight, \
+        squared_percentage_error, absolute_percentage_error, squared_simulated, \
+        squared_real = sums
+    metrics = np.empty(count.shape, dtype=GOODNESS_OF_FIT_DTYPE)
+    metrics["count"] = count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metrics["geh_percentage"] = 100 * geh_pass / total_weight
+        metrics["mean_geh"] = geh / total_weight
+        rmse = np.sqrt(squared_error / total_weight)
+        metrics["rmse"] = rmse
+        metrics["rmspe"] = 100 * np.sqrt(
+            squared_percentage_error / total_percentage_weight)
+        metrics["mape"] = 100 * absolute_percentage_error \
+            / total_percentage_weight
+        metrics["theil_u"] = rmse / (np.sqrt(squared_simulated / total_weight)
+                                     + np.sqrt(squared_real / total_weight))
+    return metrics
+
+
+def get_bootstrap_samples(
+    real: np.ndarray, simulated: np.ndarray, num_resamples: int,
+    enforce_intercept: bool = True, resample_detectors: bool = True,
+    resample_intervals: bool = True,
+    geh_threshold: float = DEFAULT_GEH_THRESHOLD,
+    seed: Union[int, np.random.SeedSequence] = None
+) -> np.ndarray:
+    """Compute the regression slope, R-squared and GEH percentage of bootstrap
+    resamples of detectors and time intervals.
+
+    Each resample draws detectors and time intervals with replacement. It is
+    represented by how many times each detector and each time interval is
+    drawn, so the statistics of many resamples are computed from weighted
+    sums with matrix products instead of copying the data.
+
+    Args:
+        real: Array of shape (detectors, time intervals) of real flow, used
+            as x-axis data of the regression. NaN values are left out.
+        simulated: Array of simulated flow, with the same shape as real.
+        num_resamples: Number of bootstrap resamples.
+        enforce_intercept: Whether the intercept of the regression should be
+            set to 0, as in get_linear_regression().
+        resample_detectors: Whether to resample detectors.
+        resample_intervals: Whether to resample time intervals.
+        geh_threshold: GEH statistic below which a value is acceptable.
+        seed: Seed of the random number generator.
+    Returns:
+        samples: Array of shape (len(BOOTSTRAP_STATISTICS), num_resamples)
+            with the statistics of every resample.
+    """
+    real = np.asarray(real, dtype=float)
+    simulated = np.asarray(simulated, dtype=float)
+    num_detectors, num_intervals = real.shape
+    valid = ~np.isnan(real) & ~np.isnan(simulated)
+    # Shift the data before summing products to avoid cancellation. The
+    # zero-intercept regression is computed from the unshifted sums.
+    center_x = real[valid].mean() if np.any(valid) else 0.0
+    center_y = simulated[valid].mean() if np.any(valid) else 0.0
+    x = np.where(valid, real - center_x, 0.0)
+    y = np.where(valid, simulated - center_y, 0.0)
+    geh_pass = valid & (compute_geh(np.where(valid, real, 0.0), np.where(
+        valid, simulated, 0.0)) < geh_threshold)
+    terms = np.stack([valid.astype(float), x, y, x * x, x * y, y * y,
+                      geh_pass.astype(float)])
+
+    random = np.random.default_rng(seed)
+    samples = np.empty((len(BOOTSTRAP_STATISTICS), num_resamples))
+    for start in range(0, num_resamples, BOOTSTRAP_CHUNK_SIZE):
+        size = min(BOOTSTRAP_CHUNK_SIZE, num_resamples - start)
+        detector_counts = random.multinomial(
+            num_detectors, np.full(num_detectors, 1 / num_detectors), size) \
+            if resample_detectors else np.ones((size, num_detectors))
+        interval_counts = random.multinomial(
+            num_intervals, np.full(num_intervals, 1 / num_intervals), size) \
+            if resample_intervals else np.ones((size, num_intervals))
+        # Weighted sums of shape (terms, resamples): the weight of a value is
+        # the product of the counts of its detector and time interval.
+        sums = ((detector_counts @ terms) * interval_counts).sum(axis=-1)
+        samples[:, start:start + size] = _get_bootstrap_statistics(
+            sums, enforce_intercept, center_x, center_y)
+    return samples
+
+
+def _get_bootstrap_statistics(
+    sums: np.ndarray, enforce_intercept: bool, center_x: float,
+    center_y: float
+) -> np.ndarray:
+    """Compute the statistics of resamples from the weighted sums of the terms
+    of get_bootstrap_samples(), stacked along the first axis."""
+    count, sum_x, sum_y, sum_xx, sum_xy, sum_yy, geh_pass = sums
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered_yy = sum_yy - sum_y ** 2 / count
+        if enforce_intercept:
+            raw_xx = sum_xx + 2 * center_x * sum_x + count * center_x ** 2
+            raw_xy = sum_xy + center_x * sum_y + center_y * sum_x \
+                + count * center_x * center_y
+            raw_yy = sum_yy + 2 * center_y * sum_y + count * center_y ** 2
+            slope = raw_xy / raw_xx
+            residual = raw_yy - slope * raw_xy
+        else:
+            centered_xx = sum_xx - sum_x ** 2 / count
+            centered_xy = sum_xy - sum_x * sum_y / count
+            slope = centered_xy / centered_xx
+            residual = centered_yy - slope * centered_xy
+        r_sq = np.where(centered_yy > 0, 1 - residual / centered_yy, np.nan)
+        geh_percentage = 100 * geh_pass / count
+    return np.stack([slope, r_sq, geh_percentage])
+
+
+def bootstrap_confidence_intervals(
+    real: np.ndarray, simulated: np.ndarray,
+    num_resamples: int = DEFAULT_NUM_RESAMPLES,
+    confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    enforce_intercept: bool = True, resample_detectors: bool = True,
+    resample_intervals: bool = True,
+    geh_threshold: float = DEFAULT_GEH_THRESHOLD, seed: int = None,
+    max_workers: int = 1
+) -> np.ndarray:
+    """Compute percentile bootstrap confidence intervals of the regression
+    slope, R-squared and GEH percentage between real and simulated flow.
+
+    Args:
+        real: Array of shape (detectors, time intervals) of real flow.
+        simulated: Array of simulated flow, with the same shape as real.
+        num_resamples: Number of bootstrap resamples.
+        confidence_level: Probability covered by the confidence intervals.
+        enforce_intercept: Whether the intercept of the regression should be
+            set to 0.
+        resample_detectors: Whether to resample detectors.
+        resample_intervals: Whether to resample time intervals.
+        geh_threshold: GEH statistic below which a value is acceptable.
+        seed: Seed of the random number generators. The results only depend
+            on the seed and max_workers.
+        max_workers: Number of worker processes the resamples are split
+            between. 1 computes all resamples in the calling process.
+    Returns:
+        intervals: Structured array with one record per statistic of
+            BOOTSTRAP_STATISTICS, and fields statistic (name), estimate
+            (statistic of the original data), lower and upper (bounds of the
+            confidence interval).
+    """
+    assert 0 < confidence_level < 1
+    max_workers = max(min(max_workers, num_resamples), 1)
+    seed_sequences = np.random.SeedSequence(seed).spawn(max_workers)
+    shard_sizes = [len(shard) for shard in np.array_split(
+        np.arange(num_resamples), max_workers)]
+    args = (enforce_intercept, resample_detectors, resample_intervals,
+            geh_threshold)
+    if max_workers == 1:
+        samples = get_bootstrap_samples(
+            real, simulated, num_resamples, *args, seed=seed_sequences[0])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            futures = [
+                executor.submit(get_bootstrap_samples, real, simulated,
+                                shard_size, *args, seed=seed_sequence)
+                for shard_size, seed_sequence in zip(
+                    shard_sizes, seed_sequences)]
+            samples = np.concatenate(
+                [future.result() for future in futures], axis=1)
+    estimate = get_bootstrap_samples(
+        real, simulated, 1, enforce_intercept, False, False, geh_threshold)
+    alpha = (1 - confidence_level) / 2
+    lower, upper = np.nanquantile(samples, [alpha, 1 - alpha], axis=1)
+
+    intervals = np.empty(len(BOOTSTRAP_STATISTICS), dtype=[
+        ("statistic", f"U{max(len(name) for name in BOOTSTRAP_STATISTICS)}"),
+        ("estimate", np.float64), ("lower", np.float64),
+        ("upper", np.float64)])
+    intervals["statistic"] = BOOTSTRAP_STATISTICS
+    intervals["estimate"] = estimate[:, 0]
+    intervals["lower"] = lower
+    intervals["upper"] = upper
+    return intervals
@@ -0,0 +1,154 @@
+"""Tests for goodness_of_fit_util."""
+
+import unittest
+
+import numpy as np
+
+from calibration.goodness_of_fit_util import (
+    bootstrap_confidence_intervals,
+    compute_geh,
+    compute_goodness_of_fit,
+    get_bootstrap_samples,
+)
+from calibration.postprocessing_plot_util import get_linear_regression
+
+
+def _get_expected_metrics(real, simulated, weights):
+    """Compute the metrics of 1-d arrays of values one formula at a time."""
+    error = simulated - real
+    geh = np.sqrt(2 * error ** 2 / (simulated + real))
+    nonzero = real != 0
+    rmse = np.sqrt(np.average(error ** 2, weights=weights))
+    return {
+        "count": len(real),
+        "geh_percentage": 100 * np.average(geh < 5, weights=weights),
+        "mean_geh": np.average(geh, weights=weights),
+        "rmse": rmse,
+        "rmspe": 100 * np.sqrt(np.average(
+            (error[nonzero] / real[nonzero]) ** 2,
+            weights=weights[nonzero])),
+        "mape": 100 * np.average(np.abs(error[nonzero] / real[nonzero]),
+                                 weights=weights[nonzero]),
+        "theil_u": rmse / (np.sqrt(np.average(simulated ** 2,
+                                              weights=weights))
+                           + np.sqrt(np.average(real ** 2,
+                                                weights=weights))),
+    }
+
+
+class TestGoodnessOfFit(unittest.TestCase):
+    """Test the goodness-of-fit metrics against their definition."""
+
+    def setUp(self):
+        random = np.random.default_rng(0)
+        self.real = random.uniform(0, 500, (6, 4))
+        self.real[0, 0] = 0.0
+        self.simulated = np.abs(self.real + random.normal(0, 40, (6, 4)))
+        self.simulated[0, 0] = 10.0
+        self.real[2, 3] = np.nan
+        self.weights = random.uniform(0.5, 2, (6, 4))
+        self.mask = np.ones((6, 4), dtype=bool)
+        self.mask[4, 1] = False
+
+    def __assert_metrics(self, metrics, valid):
+        expected = _get_expected_metrics(
+            self.real[valid], self.simulated[valid], self.weights[valid])
+        for name, value in expected.items():
+            self.assertAlmostEqual(float(metrics[name]), value, msg=name)
+
+    def test_compute_goodness_of_fit(self):
+        """Test the metrics per detector, per interval and pooled."""
+        per_detector, per_interval, pooled = compute_goodness_of_fit(
+            self.real, self.simulated, self.weights, self.mask)
+        self.assertEqual(per_detector.shape, (6,))
+        self.assertEqual(per_interval.shape, (4,))
+        self.assertEqual(pooled.shape, ())
+        valid = self.mask & ~np.isnan(self.real)
+        self.__assert_metrics(pooled, valid)
+        for detector in range(6):
+            detector_valid = valid.copy()
+            detector_valid[np.arange(6) != detector] = False
+            self.__assert_metrics(per_detector[detector], detector_valid)
+        for interval in range(4):
+            interval_valid = valid.copy()
+            interval_valid[:, np.arange(4) != interval] = False
+            self.__assert_metrics(per_interval[interval], interval_valid)
+
+    def test_no_value(self):
+        """Test that metrics without values are NaN."""
+        mask = np.ones((6, 4), dtype=bool)
+        mask[1] = False
+        per_detector, _, _ = compute_goodness_of_fit(
+            self.real, self.simulated, mask=mask)
+        self.assertEqual(per_detector["count"][1], 0)
+        self.assertTrue(np.isnan(per_detector["rmse"][1]))
+        self.assertFalse(np.isnan(per_detector["rmse"][0]))
+
+    def test_compute_geh(self):
+        """Test the GEH statistic, including when both flows are 0."""
+        np.testing.assert_allclose(
+            compute_geh([100.0, 0.0, 400.0], [150.0, 0.0, 400.0]),
+            [np.sqrt(2 * 50 ** 2 / 250), 0.0, 0.0])
+
+
+class TestBootstrap(unittest.TestCase):
+    """Test the bootstrap confidence intervals of calibration statistics."""
+
+    def setUp(self):
+        random = np.random.default_rng(1)
+        self.real = random.uniform(100, 1000, (30, 8))
+        self.simulated = 1.05 * self.real + random.normal(0, 30, (30, 8))
+        self.real[0, 0] = np.nan
+
+    def test_samples_match_resampled_regression(self):
+        """Test that the statistics of a resample are the ones of the
+        resampled data."""
+        for enforce_intercept in [True, False]:
+            samples = get_bootstrap_samples(
+                self.real, self.simulated, 3, enforce_intercept, seed=5)
+            # Draw the same resamples again and copy the data.
+            random = np.random.default_rng(5)
+            detector_counts = random.multinomial(30, np.full(30, 1 / 30), 3)
+            interval_counts = random.multinomial(8, np.full(8, 1 / 8), 3)
+            for i in range(3):
+                real = np.repeat(np.repeat(
+                    self.real, detector_counts[i], axis=0),
+                    interval_counts[i], axis=1)
+                simulated = np.repeat(np.repeat(
+                    self.simulated, detector_counts[i], axis=0),
+                    interval_counts[i], axis=1)
+                valid = ~np.isnan(real)
+                slope, _, r_sq, _, _ = get_linear_regression(
+                    real[valid].reshape(-1, 1),
+                    simulated[valid].reshape(-1, 1), enforce_intercept)
+                self.assertAlmostEqual(samples[0, i], slope)
+                self.assertAlmostEqual(samples[1, i], r_sq)
+                _, _, pooled = compute_goodness_of_fit(real, simulated)
+                self.assertAlmostEqual(samples[2, i],
+                                       float(pooled["geh_percentage"]))
+
+    def test_confidence_intervals(self):
+        """Test that the intervals contain the estimate and are reproducible
+        with process workers."""
+        intervals = bootstrap_confidence_intervals(
+            self.real, self.simulated, 400, seed=0)
+        self.assertEqual(list(intervals["statistic"]),
+                         ["slope", "r_sq", "geh_percentage"])
+        self.assertTrue(np.all(intervals["lower"] <= intervals["estimate"]))
+        self.assertTrue(np.all(intervals["estimate"] <= intervals["upper"]))
+        slope = intervals[0]
+        self.assertTrue(0.8 <= slope["lower"] and slope["upper"] <= 1.2)
+        np.testing.assert_array_equal(
+            intervals, bootstrap_confidence_intervals(
+                self.real, self.simulated, 400, seed=0))
+        parallel_intervals = bootstrap_confidence_intervals(
+            self.real, self.simulated, 400, seed=0, max_workers=2)
+        np.testing.assert_array_equal(
+            parallel_intervals, bootstrap_confidence_intervals(
+                self.real, self.simulated, 400, seed=0, max_workers=2))
+        np.testing.assert_allclose(parallel_intervals["estimate"],
+                                   intervals["estimate"])
+
+
+if __name__ == "__main__":
+    unittest.main()
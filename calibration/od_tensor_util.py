@@ -0,0 +1,357 @@
+"""Dense tensor storage of origin-destination matrices.
+
+OriginDestinationMatrices stores every trip count as its own Python object and
+pickles the whole object graph, which is slow to load and uses a lot of memory
+for hundreds of centroids. An OriginDestinationTensor stores the same demand as
+a single array of shape (vehicle types, time intervals, origins, destinations)
+indexed by a list of centroids:
+    >>> od_tensor = OriginDestinationTensor.from_od_matrices(od_matrices)
+    >>> od_tensor.export_to_file("od_matrices.npz")
+    >>> od_tensor = OriginDestinationTensor("od_matrices.npz")
+    >>> resident_demand = od_tensor.get_matrix(
+    ...     VehicleTypeName.RESIDENT, datetime.time(14, 0))
+
+The tensor is written to a .npy file next to the .npz file holding the
+centroid index and the layout of the matrices, and is memory-mapped when
+imported, so only the slices that are used are read from disk. The conversion
+is lossless: to_od_matrices() returns matrices equal to the original ones,
+with their trip counts in the same order.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.aimsun_input_utils import (
+    CENTROID_CONFIG_EXTERNAL_ID,
+    ExternalId,
+    OriginDestinationMatrices,
+    OriginDestinationMatrix,
+    OriginDestinationTripsCount,
+    VehicleTypeName,
+)
+from utils.verification_utils import verify_filepath
+
+# Floating point types of the tensor, tried from the narrowest when no type is
+# given.
+TRIPS_DTYPES = (np.float32, np.float64)
+MATRIX_ATTRIBUTE_NAMES = ("name", "external_id", "internal_id")
+
+
+class OriginDestinationTensor:
+    """Data class for origin-destination matrices stored as a dense tensor.
+
+    To export the OriginDestinationTensor, use the following command:
+        >>> od_tensor.export_to_file(filepath)
+
+    To import the OriginDestinationTensor, use the following command:
+        >>> od_tensor = OriginDestinationTensor(filepath)
+
+    Attributes:
+        centroid_configuration_external_id: External ID of the centroid
+            configuration corresponding to the matrices.
+        centroid_external_ids: External ID of the centroid of each origin and
+            destination index of trips.
+        vehicle_types: Vehicle type of each index of the first axis of trips.
+        time_intervals: Begin and end time of each index of the second axis of
+            trips, sorted.
+        trips: Array of shape (vehicle types, time intervals, origins,
+            destinations) of the number of trips. 0 for pairs without a trip
+            count.
+    """
+
+    centroid_configuration_external_id: ExternalId
+    centroid_external_ids: List[ExternalId]
+    vehicle_types: List[VehicleTypeName]
+    time_intervals: List[Tuple[datetime.time, datetime.time]]
+    trips: np.ndarray
+
+    def __init__(self, filepath: str = "", mmap_mode: Optional[str] = "r"):
+        self.centroid_configuration_external_id = CENTROID_CONFIG_EXTERNAL_ID
+        self.centroid_external_ids = []
+        self.vehicle_types = []
+        self.time_intervals = []
+        self.trips = np.zeros((0, 0, 0, 0), dtype=TRIPS_DTYPES[0])
+        # Layout of the original matrices, to convert them back losslessly.
+        self.__matrices = []
+        self.__trip_positions = np.zeros(0, dtype=np.int64)
+        self.__trip_offsets = np.zeros(1, dtype=np.int64)
+        self.__trip_is_integer = np.zeros(0, dtype=bool)
+        if filepath:
+            self.__import_from_file(filepath, mmap_mode)
+
+    @classmethod
+    def from_od_matrices(
+        cls, od_matrices: OriginDestinationMatrices,
+        dtype: np.dtype = None
+    ) -> OriginDestinationTensor:
+        """Convert origin-destination matrices to a tensor.
+
+        Args:
+            od_matrices: Matrices to convert.
+            dtype: Floating point type of the tensor. If None, the narrowest
+                type of TRIPS_DTYPES that represents all trip counts exactly,
+                e.g. float32 for integer trip counts and float64 for 0.1.
+        Returns:
+            od_tensor: Tensor of the matrices.
+        Raises:
+            ValueError: If the matrices can not be stored in the tensor without
+                loss: two matrices share the same vehicle type and time
+                interval, a matrix has two trip counts for the same pair, or a
+                trip count is not exactly representable with dtype.
+        """
+        od_tensor = cls()
+        od_tensor.centroid_configuration_external_id = \
+            od_matrices.centroid_configuration_external_id
+        centroid_index = {}
+        vehicle_type_index = {}
+        time_intervals = set()
+        for od_matrix in od_matrices.od_matrices:
+            vehicle_type_index.setdefault(
+                _get_vehicle_type_key(od_matrix.vehicle_type),
+                len(vehicle_type_index))
+            time_intervals.add((od_matrix.begin_time_interval,
+                                od_matrix.end_time_interval))
+            for od_trip in od_matrix.od_trips_count:
+                for external_id in (od_trip.origin_centroid_external_id,
+                                    od_trip.destination_centroid_external_id):
+                    centroid_index.setdefault(external_id, len(centroid_index))
+        od_tensor.centroid_external_ids = list(centroid_index)
+        od_tensor.vehicle_types = [
+            vehicle_type for vehicle_type, _ in vehicle_type_index]
+        od_tensor.time_intervals = sorted(time_intervals)
+        time_interval_index = {time_interval: i for i, time_interval
+                               in enumerate(od_tensor.time_intervals)}
+
+        num_centroids = len(centroid_index)
+        positions, values, is_integer, offsets = [], [], [], [0]
+        matrix_indices = []
+        for i, od_matrix in enumerate(od_matrices.od_matrices):
+            matrix_index = (
+                vehicle_type_index[
+                    _get_vehicle_type_key(od_matrix.vehicle_type)],
+                time_interval_index[(od_matrix.begin_time_interval,
+                                     od_matrix.end_time_interval)])
+            if matrix_index in matrix_indices:
+                raise ValueError(
+                    f"Matrix at index {i} has the same vehicle type and time "
+                    "interval as a previous matrix.")
+            matrix_positions = np.array([
+                centroid_index[od_trip.origin_centroid_external_id]
+                * num_centroids
+                + centroid_index[od_trip.destination_centroid_external_id]
+                for od_trip in od_matrix.od_trips_count], dtype=np.int64)
+            if len(np.unique(matrix_positions)) < len(matrix_positions):
+                raise ValueError(
+                    f"Matrix at index {i} has several trip counts for the same "
+                    "origin-destination pair.")
+            matrix_values = [od_trip.num_trips
+                             for od_trip in od_matrix.od_trips_count]
+            matrix_indices.append(matrix_index)
+            positions.append(matrix_positions)
+            values += matrix_values
+            is_integer += [isinstance(value, int) for value in matrix_values]
+            offsets.append(offsets[-1] + len(matrix_positions))
+            od_tensor.__matrices.append({
+                "index": list(matrix_index),
+                "attributes": {
+                    name: getattr(od_matrix, name)
+                    for name in MATRIX_ATTRIBUTE_NAMES
+                    if hasattr(od_matrix, name)},
+            })
+        values = np.array(values, dtype=float)
+        if dtype is None:
+            dtype = next((candidate for candidate in TRIPS_DTYPES
+                          if _is_exact(values, candidate)), TRIPS_DTYPES[-1])
+        elif not _is_exact(values, dtype):
+            raise ValueError(
+                f"Some trip counts can not be represented exactly as "
+                f"{np.dtype(dtype)}. Use a larger floating point type.")
+        trips = np.zeros((len(vehicle_type_index), len(time_interval_index),
+                          num_centroids, num_centroids), dtype=dtype)
+        for matrix_index, matrix_positions, start in zip(
+                matrix_indices, positions, offsets):
+            trips[matrix_index].reshape(-1)[matrix_positions] = \
+                values[start:start + len(matrix_positions)]
+        od_tensor.trips = trips
+        od_tensor.__trip_positions = np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + positions)
+        od_tensor.__trip_offsets = np.array(offsets, dtype=np.int64)
+        od_tensor.__trip_is_integer = np.array(is_integer, dtype=bool)
+        return od_tensor
+
+    def to_od_matrices(self) -> OriginDestinationMatrices:
+        """Convert the tensor back to origin-destination matrices.
+
+        Returns:
+            od_matrices: Matrices equal to the ones the tensor was created
+                from, with the trip counts in the same order.
+        """
+        od_matrices = OriginDestinationMatrices(
+            external_id=self.centroid_configuration_external_id)
+        od_matrices.od_matrices = []
+        num_centroids = len(self.centroid_external_ids)
+        for i, matrix in enumerate(self.__matrices):
+            vehicle_type, time_interval = matrix["index"]
+            od_matrix = OriginDestinationMatrix()
+            for name, value in matrix["attributes"].items():
+                setattr(od_matrix, name, value)
+            od_matrix.begin_time_interval, od_matrix.end_time_interval = \
+                self.time_intervals[time_interval]
+            od_matrix.vehicle_type = self.vehicle_types[vehicle_type]
+            trip_slice = slice(self.__trip_offsets[i],
+                               self.__trip_offsets[i + 1])
+            positions = self.__trip_positions[trip_slice]
+            values = np.asarray(self.trips[vehicle_type, time_interval]) \
+                .reshape(-1)[positions].tolist()
+            od_matrix.od_trips_count = []
+            for position, value, is_integer in zip(
+                    positions.tolist(), values,
+                    self.__trip_is_integer[trip_slice].tolist()):
+                od_trip = OriginDestinationTripsCount()
+                od_trip.origin_centroid_external_id = \
+                    self.centroid_external_ids[position // num_centroids]
+                od_trip.destination_centroid_external_id = \
+                    self.centroid_external_ids[position % num_centroids]
+                od_trip.num_trips = int(value) if is_integer else value
+                od_matrix.od_trips_count.append(od_trip)
+            od_matrices.od_matrices.append(od_matrix)
+        return od_matrices
+
+    def get_centroid_index(
+        self, centroid_external_ids: Sequence[ExternalId]
+    ) -> np.ndarray:
+        """Get the index of centroids along the origin and destination axes.
+
+        Args:
+            centroid_external_ids: External IDs of the centroids.
+        Returns:
+            index: Index of each centroid. -1 for centroids without any trip
+                count.
+        """
+        centroid_index = {external_id: i for i, external_id
+                          in enumerate(self.centroid_external_ids)}
+        return np.array([centroid_index.get(external_id, -1)
+                         for external_id in centroid_external_ids],
+                        dtype=np.int64)
+
+    def get_matrix(
+        self, vehicle_type: VehicleTypeName,
+        begin_time_interval: datetime.time
+    ) -> np.ndarray:
+        """Get the trips of one vehicle type during one time interval.
+
+        Args:
+            vehicle_type: Vehicle type of the matrix.
+            begin_time_interval: Begin time of the time interval of the matrix.
+        Returns:
+            trips: Array of shape (origins, destinations).
+        Raises:
+            KeyError: If there is no matrix for the vehicle type and time.
+        """
+        begin_times = [begin_time for begin_time, _ in self.time_intervals]
+        if vehicle_type not in self.vehicle_types \
+                or begin_time_interval not in begin_times:
+            raise KeyError(
+                f"No matrix for vehicle type {vehicle_type} at "
+                f"{begin_time_interval}.")
+        return self.trips[self.vehicle_types.index(vehicle_type),
+                          begin_times.index(begin_time_interval)]
+
+    def export_to_file(self, filepath: str):
+        """Export the tensor. The centroid index and the layout of the
+        matrices are written to filepath, and the tensor to a .npy file with
+        the same name, so that it can be memory-mapped.
+
+        Args:
+            filepath: Location where this object should be exported to. The
+                path must point to a '.npz' file, otherwise the code will throw
+                an error.
+        """
+        verify_filepath(filepath, "npz")
+        metadata = {
+            "centroid_configuration_external_id":
+                self.centroid_configuration_external_id,
+            "vehicle_types": [
+                [str(vehicle_type.value) if isinstance(
+                    vehicle_type, VehicleTypeName) else vehicle_type,
+                 isinstance(vehicle_type, VehicleTypeName)]
+                for vehicle_type in self.vehicle_types],
+            "time_intervals": [
+                [begin_time.isoformat(), end_time.isoformat()]
+                for begin_time, end_time in self.time_intervals],
+            "matrices": self.__matrices,
+        }
+        np.save(self.__get_trips_filepath(filepath), self.trips)
+        np.savez(
+            filepath,
+            metadata=np.array(json.dumps(metadata, default=_to_json)),
+            centroid_external_ids=np.array(self.centroid_external_ids,
+                                           dtype=str),
+            trip_positions=self.__trip_positions,
+            trip_offsets=self.__trip_offsets,
+            trip_is_integer=self.__trip_is_integer,
+        )
+
+    def __import_from_file(self, filepath: str, mmap_mode: Optional[str]):
+        """Import a tensor exported with export_to_file().
+
+        Args:
+            filepath: Location where this object should be imported from. The
+                path must point to a '.npz' file, otherwise the code will throw
+                an error.
+            mmap_mode: Memory-mapping mode of the tensor, as in numpy.load().
+                None reads the whole tensor in memory.
+        """
+        verify_filepath(filepath, "npz")
+        with np.load(filepath) as arrays:
+            metadata = json.loads(str(arrays["metadata"]))
+            self.centroid_external_ids = \
+                arrays["centroid_external_ids"].tolist()
+            self.__trip_positions = arrays["trip_positions"]
+            self.__trip_offsets = arrays["trip_offsets"]
+            self.__trip_is_integer = arrays["trip_is_integer"]
+        self.centroid_configuration_external_id = \
+            metadata["centroid_configuration_external_id"]
+        self.vehicle_types = [
+            VehicleTypeName(vehicle_type) if is_enum else vehicle_type
+            for vehicle_type, is_enum in metadata["vehicle_types"]]
+        self.time_intervals = [
+            (datetime.time.fromisoformat(begin_time),
+             datetime.time.fromisoformat(end_time))
+            for begin_time, end_time in metadata["time_intervals"]]
+        self.__matrices = metadata["matrices"]
+        self.trips = np.load(self.__get_trips_filepath(filepath),
+                             mmap_mode=mmap_mode)
+
+    @staticmethod
+    def __get_trips_filepath(filepath: str) -> str:
+        """Get the path of the .npy file of the tensor."""
+        return os.path.splitext(filepath)[0] + ".npy"
+
+
+def _get_vehicle_type_key(
+    vehicle_type: VehicleTypeName
+) -> Tuple[str, bool]:
+    """Get the key of a vehicle type, which tells apart a VehicleTypeName from
+    the string of the same value."""
+    return vehicle_type, isinstance(vehicle_type, VehicleTypeName)
+
+
+def _is_exact(values: np.ndarray, dtype: np.dtype) -> bool:
+    """Check whether float64 values are represented exactly by dtype."""
+    return np.array_equal(values.astype(dtype).astype(float), values,
+                          equal_nan=True)
+
+
+def _to_json(value: Any) -> Any:
+    """Convert the NumPy scalars of matrix attributes to JSON values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON "
+                    "serializable.")
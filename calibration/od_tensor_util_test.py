@@ -0,0 +1,125 @@
+"""Tests for od_tensor_util."""
+
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from calibration.od_tensor_util import OriginDestinationTensor
+from utils.aimsun_input_utils import (
+    OriginDestinationMatrices,
+    OriginDestinationMatrix,
+    OriginDestinationTripsCount,
+    VehicleTypeName,
+)
+
+TIME_INTERVALS = [(datetime.time(14, 15), datetime.time(14, 30)),
+                  (datetime.time(14, 0), datetime.time(14, 15))]
+
+
+def _create_od_matrices(trips):
+    """Create origin-destination matrices.
+
+    Args:
+        trips: List with, for each matrix, its vehicle type, time interval
+            index and list of (origin, destination, number of trips).
+    Returns:
+        od_matrices: Matrices with the given trip counts, in order.
+    """
+    od_matrices = OriginDestinationMatrices(external_id="centroids")
+    od_matrices.od_matrices = []
+    for vehicle_type, time_interval, trip_counts in trips:
+        od_matrix = OriginDestinationMatrix()
+        od_matrix.name = f"{vehicle_type}_{time_interval}"
+        od_matrix.begin_time_interval, od_matrix.end_time_interval = \
+            TIME_INTERVALS[time_interval]
+        od_matrix.vehicle_type = vehicle_type
+        od_matrix.od_trips_count = []
+        for origin, destination, num_trips in trip_counts:
+            od_trip = OriginDestinationTripsCount()
+            od_trip.origin_centroid_external_id = origin
+            od_trip.destination_centroid_external_id = destination
+            od_trip.num_trips = num_trips
+            od_matrix.od_trips_count.append(od_trip)
+        od_matrices.od_matrices.append(od_matrix)
+    return od_matrices
+
+
+class TestOriginDestinationTensor(unittest.TestCase):
+    """Test the conversion of origin-destination matrices to a tensor and
+    back."""
+
+    def setUp(self):
+        self.od_matrices = _create_od_matrices([
+            (VehicleTypeName.TRAVELER, 0,
+             [("a", "b", 5), ("c", "d", 2.5), ("a", "d", 0.0)]),
+            (VehicleTypeName.RESIDENT, 1, [("d", "a", 1.0)]),
+            (VehicleTypeName.TRAVELER, 1, []),
+        ])
+
+    def test_tensor(self):
+        """Test the layout of the tensor."""
+        od_tensor = OriginDestinationTensor.from_od_matrices(self.od_matrices)
+        self.assertEqual(od_tensor.trips.dtype, np.float32)
+        self.assertEqual(od_tensor.trips.shape, (2, 2, 4, 4))
+        self.assertEqual(od_tensor.centroid_external_ids,
+                         ["a", "b", "c", "d"])
+        self.assertEqual(od_tensor.vehicle_types, [VehicleTypeName.TRAVELER,
+                                                   VehicleTypeName.RESIDENT])
+        self.assertEqual(od_tensor.time_intervals, sorted(TIME_INTERVALS))
+        matrix = od_tensor.get_matrix(VehicleTypeName.TRAVELER,
+                                      datetime.time(14, 15))
+        origin, destination = od_tensor.get_centroid_index(["c", "d"])
+        self.assertEqual(matrix[origin, destination], 2.5)
+        self.assertEqual(matrix.sum(), 7.5)
+        self.assertEqual(od_tensor.trips.sum(), 8.5)
+        with self.assertRaises(KeyError):
+            od_tensor.get_matrix(VehicleTypeName.RESIDENT,
+                                 datetime.time(15, 0))
+
+    def test_round_trip(self):
+        """Test that converting the tensor back gives the same matrices, also
+        after exporting and importing it."""
+        od_tensor = OriginDestinationTensor.from_od_matrices(self.od_matrices)
+        self.assertEqual(od_tensor.to_od_matrices(), self.od_matrices)
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "od_matrices.npz")
+            od_tensor.export_to_file(filepath)
+            self.assertTrue(os.path.isfile(
+                os.path.join(directory, "od_matrices.npy")))
+            imported_od_tensor = OriginDestinationTensor(filepath)
+            self.assertIsInstance(imported_od_tensor.trips, np.memmap)
+            np.testing.assert_array_equal(imported_od_tensor.trips,
+                                          od_tensor.trips)
+            self.assertEqual(imported_od_tensor.to_od_matrices(),
+                             self.od_matrices)
+            del imported_od_tensor
+            self.assertEqual(OriginDestinationTensor(
+                filepath, mmap_mode=None).to_od_matrices(), self.od_matrices)
+
+    def test_lossy_conversion(self):
+        """Test that the default type stores fractional trip counts exactly,
+        and that matrices that the tensor can not store exactly are
+        rejected."""
+        od_matrices = _create_od_matrices(
+            [(VehicleTypeName.RESIDENT, 0, [("a", "b", 0.1)])])
+        od_tensor = OriginDestinationTensor.from_od_matrices(od_matrices)
+        self.assertEqual(od_tensor.trips.dtype, np.float64)
+        self.assertEqual(od_tensor.to_od_matrices(), od_matrices)
+        with self.assertRaises(ValueError):
+            OriginDestinationTensor.from_od_matrices(
+                od_matrices, dtype=np.float32)
+
+        for trips in [
+                [(VehicleTypeName.RESIDENT, 0, [("a", "b", 1), ("a", "b", 2)])],
+                [(VehicleTypeName.RESIDENT, 0, []),
+                 (VehicleTypeName.RESIDENT, 0, [])]]:
+            with self.assertRaises(ValueError):
+                OriginDestinationTensor.from_od_matrices(
+                    _create_od_matrices(trips))
+
+
+if __name__ == "__main__":
+    unittest.main()
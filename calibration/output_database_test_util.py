@@ -0,0 +1,201 @@
+"""Test fixtures shared by the tests of the modules that read Aimsun
+microsimulation output databases.
+
+create_micro_output_database() builds a small SQLite file that mimics the
+layout of an Aimsun output database, filled with deterministic data. Tests
+that need such files derive from OutputDatabaseTestCase:
+    >>> class TestMyUtil(OutputDatabaseTestCase):
+    ...     def setUp(self):
+    ...         super().setUp()
+    ...         self.database_path = self.create_database("micro.sqlite")
+"""
+
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+from typing import Any, Sequence, Tuple
+
+START_TIME_SECONDS = 14 * 3600
+TIME_STEP_SECONDS = 900
+NUM_TIME_INTERVALS = 4
+REPLICATION_IDS = [101, 102]
+DETECTOR_EXTERNAL_IDS = ["flow_detector_1", "flow_detector_2",
+                         "flow_detector_3"]
+SECTION_INTERNAL_IDS = [11, 12]
+ORIGIN_CENTROID_IDS = [21, 22]
+DEST_CENTROID_IDS = [31, 32, 33]
+NUM_VEHICLES_PER_OD_INTERVAL = 3
+TIME_LIST = [datetime.time(14, 0), datetime.time(14, 15),
+             datetime.time(14, 30), datetime.time(14, 45)]
+
+
+def detector_flow(replication: int, detector: int, interval: int) -> float:
+    """Deterministic flow value stored in the test database."""
+    return 1000.0 * replication + 100.0 * detector + interval
+
+
+def trip_travel_time(
+    replication: int, origin: int, destination: int, interval: int,
+    vehicle: int
+) -> float:
+    """Deterministic travel time of a trip stored in the test database."""
+    return 300.0 + 60.0 * origin + 20.0 * destination + 7.0 * interval \
+        + 11.0 * vehicle + (replication - REPLICATION_IDS[0])
+
+
+def od_num_vehicles(origin: int, destination: int, interval: int) -> float:
+    """Deterministic number of vehicles between two centroids stored in the
+    test database."""
+    return 100.0 * origin + 10.0 * destination + interval
+
+
+def create_micro_output_database(
+    filepath: str, queries: Sequence[Tuple[str, Sequence[Any]]] = ()
+):
+    """Create a SQLite file with the tables of an Aimsun microsimulation output
+    database, filled with deterministic data.
+
+    Args:
+        filepath: Location of the SQLite file to create.
+        queries: Queries with their parameters, executed after the tables are
+            filled to adapt the data to a test, e.g.
+            [("UPDATE MISYS SET flow = flow + ?", (10,))].
+    """
+    database = sqlite3.connect(filepath)
+    cursor = database.cursor()
+    cursor.execute(
+        "CREATE TABLE SIM_INFO (did INTEGER, from_time INTEGER, "
+        "duration INTEGER, totalstatintervals INTEGER)")
+    cursor.execute(
+        "INSERT INTO SIM_INFO VALUES (?, ?, ?, ?)",
+        (1, START_TIME_SECONDS, TIME_STEP_SECONDS * NUM_TIME_INTERVALS,
+         NUM_TIME_INTERVALS))
+    for table_name in ["META_INFO", "META_SUB_INFO", "META_COLS"]:
+        cursor.execute(f"CREATE TABLE {table_name} (id INTEGER)")
+    cursor.execute(
+        "CREATE TABLE MIDETEC (did INTEGER, oid INTEGER, eid TEXT, "
+        "sid INTEGER, ent INTEGER, countveh REAL, flow REAL, speed REAL, "
+        "occupancy REAL, density REAL)")
+    cursor.execute(
+        "CREATE TABLE MISECT (did INTEGER, oid INTEGER, eid TEXT, "
+        "sid INTEGER, ent INTEGER, flow REAL, ttime REAL, dtime REAL, "
+        "speed REAL, density REAL)")
+    cursor.execute(
+        "CREATE TABLE MISYS (did INTEGER, sid INTEGER, ent INTEGER, "
+        "flow REAL, ttime REAL, dtime REAL, speed REAL, density REAL)")
+    cursor.execute(
+        "CREATE TABLE RGap (did INTEGER, sid INTEGER, ent INTEGER, "
+        "rgapinstantaneous REAL, rgapexperienced REAL)")
+    cursor.execute(
+        "CREATE TABLE MIVEHTRAJECTORY (did INTEGER, oid INTEGER, "
+        "sid INTEGER, origin INTEGER, destination INTEGER, "
+        "entranceTime REAL, exitTime REAL, travelTime REAL, delayTime REAL)")
+    for table_name, centroid_column_name in [("MICENT_O", "destination"),
+                                             ("MICENT_D", "origin")]:
+        cursor.execute(
+            f"CREATE TABLE {table_name} (did INTEGER, oid INTEGER, eid TEXT, "
+            f"sid INTEGER, ent INTEGER, {centroid_column_name} INTEGER, "
+            "nbveh REAL, ttime REAL, travel REAL)")
+    vehicle_id = 0
+    for replication in REPLICATION_IDS:
+        for origin, origin_id in enumerate(ORIGIN_CENTROID_IDS):
+            for destination, dest_id in enumerate(DEST_CENTROID_IDS):
+                for interval in range(1, NUM_TIME_INTERVALS + 1):
+                    for vehicle in range(NUM_VEHICLES_PER_OD_INTERVAL):
+                        entrance_time = START_TIME_SECONDS + TIME_STEP_SECONDS \
+                            * (interval - 1) + 100.0 * vehicle
+                        travel_time = trip_travel_time(
+                            replication, origin, destination, interval,
+                            vehicle)
+                        vehicle_id += 1
+                        cursor.execute(
+                            "INSERT INTO MIVEHTRAJECTORY VALUES "
+                            "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (replication, vehicle_id, 1 + vehicle % 2,
+                             origin_id, dest_id, entrance_time,
+                             entrance_time + travel_time, travel_time,
+                             travel_time / 3))
+        # Trips departing before the simulation and not exiting the network.
+        cursor.executemany(
+            "INSERT INTO MIVEHTRAJECTORY VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(replication, 0, 1, ORIGIN_CENTROID_IDS[0], DEST_CENTROID_IDS[0],
+              START_TIME_SECONDS - 10.0, START_TIME_SECONDS + 100.0, 110.0,
+              5.0),
+             (replication, 0, 1, ORIGIN_CENTROID_IDS[0], DEST_CENTROID_IDS[0],
+              START_TIME_SECONDS, -1.0, -1.0, -1.0)])
+    for replication in REPLICATION_IDS:
+        for interval in range(NUM_TIME_INTERVALS + 1):
+            for detector, external_id in enumerate(DETECTOR_EXTERNAL_IDS):
+                flow = detector_flow(replication, detector, interval)
+                cursor.execute(
+                    "INSERT INTO MIDETEC VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (replication, detector, external_id, 0, interval,
+                     flow / 4, flow, 50.0 + detector, 10.0, 5.0))
+            for section, internal_id in enumerate(SECTION_INTERNAL_IDS):
+                cursor.execute(
+                    "INSERT INTO MISECT VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (replication, internal_id, f"section_{internal_id}", 0,
+                     interval, 100.0 * section + interval, 10.0 + interval,
+                     2.0 * interval, 60.0 - interval, 3.0))
+            cursor.execute(
+                "INSERT INTO MISYS VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (replication, 0, interval, 1000.0 + interval, 70.0,
+                 5.0 * interval + replication, 60.0, 4.0))
+            cursor.execute(
+                "INSERT INTO RGap VALUES (?, ?, ?, ?, ?)",
+                (replication, 0, interval, 0.01 * interval, 0.02 * interval))
+            for origin, origin_id in enumerate(ORIGIN_CENTROID_IDS):
+                for destination, dest_id in enumerate(DEST_CENTROID_IDS):
+                    num_vehicles = od_num_vehicles(
+                        origin, destination, interval)
+                    cursor.execute(
+                        "INSERT INTO MICENT_O VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (replication, origin_id, f"centroid_{origin_id}", 0,
+                         interval, dest_id, num_vehicles, 200.0 + origin,
+                         2.0 * num_vehicles))
+                    cursor.execute(
+                        "INSERT INTO MICENT_D VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (replication, dest_id, f"centroid_{dest_id}", 0,
+                         interval, origin_id, num_vehicles, 200.0 + origin,
+                         2.0 * num_vehicles))
+    for query, parameters in queries:
+        cursor.execute(query, parameters)
+    database.commit()
+    database.close()
+
+
+class OutputDatabaseTestCase(unittest.TestCase):
+    """Base class of the tests that create output databases. Each test gets a
+    temporary directory, removed after the test.
+
+    Attributes:
+        directory: Temporary directory of the test.
+    """
+
+    directory: tempfile.TemporaryDirectory
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_database(
+        self, filename: str, queries: Sequence[Tuple[str, Sequence[Any]]] = ()
+    ) -> str:
+        """Create an output database in the temporary directory of the test.
+
+        Args:
+            filename: Name of the SQLite file.
+            queries: Queries executed after the tables are filled. See
+                create_micro_output_database().
+        Returns:
+            filepath: Path to the created database.
+        """
+        filepath = os.path.join(self.directory.name, filename)
+        create_micro_output_database(filepath, queries)
+        return filepath
@@ -0,0 +1,469 @@
+"""Columnar on-disk cache of Aimsun Microsimulation output databases.
+
+Reading an Aimsun output SQLite file row by row is slow, and every analysis
+session pays that cost again. The helpers in this file convert the tables of
+an output database once into one NumPy `.npy` file per column. The cache is
+then opened with memory mapping, so only the columns a query touches are read
+from disk.
+
+To use the cache, replace AimsunMicroOutputDatabase by AimsunMicroOutputCache:
+    >>> database = AimsunMicroOutputCache(database_path, cache_directory)
+    >>> database.get_detectors_flow(detector_external_ids, time_intervals)
+
+The cache is rebuilt automatically when the size, modification time or content
+hash of the source database changes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from calibration.postprocessing_util import (
+    DEFAULT_BATCH_SIZE,
+    AimsunMicroOutputDatabase,
+    FetchMode,
+    get_axis_index,
+)
+
+CACHED_TABLE_NAMES = [
+    "SIM_INFO", "META_INFO", "META_SUB_INFO", "META_COLS",
+    "MISYS", "MISECT", "MIDETEC", "RGap", "MICENT_O", "MICENT_D",
+    "MIVEHTRAJECTORY",
+]
+CACHE_MANIFEST_FILENAME = "manifest.json"
+EXPORT_CHUNK_SIZE = 100000
+# Upper bound on the length of str() of an integer or float stored by SQLite.
+MAX_NUMBER_STR_LENGTH = 32
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_file_fingerprint(filepath: str, with_hash: bool = True) -> Dict[str, Any]:
+    """Compute the fingerprint used to detect changes of a source file.
+
+    Args:
+        filepath: Path to the file.
+        with_hash: Whether to compute the SHA-256 hash of the file content,
+            which requires reading the whole file.
+    Returns:
+        fingerprint: Size in bytes, modification time and, if requested, hash
+            of the file.
+    """
+    stat = os.stat(filepath)
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        fingerprint["sha256"] = sha256.hexdigest()
+    return fingerprint
+
+
+def is_cache_valid(database_path: str, cache_directory: str) -> bool:
+    """Check whether the cache of a database is up to date.
+
+    The size and modification time of the database are compared first. If only
+    the modification time changed, the content hash decides, so touching the
+    database without modifying it does not invalidate the cache.
+
+    Args:
+        database_path: Path to the Aimsun output sqlite file.
+        cache_directory: Directory of the cache.
+    Returns:
+        Whether the cache exists and matches the database.
+    """
+    manifest_path = os.path.join(cache_directory, CACHE_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    cached_fingerprint = manifest["source"]
+    fingerprint = get_file_fingerprint(database_path, with_hash=False)
+    if fingerprint["size"] != cached_fingerprint["size"]:
+        return False
+    if fingerprint["mtime"] == cached_fingerprint["mtime"]:
+        return True
+    if get_file_fingerprint(database_path)["sha256"] \
+            != cached_fingerprint["sha256"]:
+        return False
+    manifest["source"]["mtime"] = fingerprint["mtime"]
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return True
+
+
+def export_output_database_cache(
+    database_path: str, cache_directory: str,
+    table_names: Sequence[str] = tuple(CACHED_TABLE_NAMES)
+):
+    """Convert the tables of an Aimsun output database to a columnar cache.
+
+    Each column of each table is written to
+    `cache_directory/table_name/column_name.npy`. Integer columns are stored as
+    int64, or float64 if they contain NULL values (stored as NaN). Text columns
+    are stored as unicode strings, with NULL values stored as empty strings.
+    Tables that do not exist in the database are skipped.
+
+    The type and length of every column are computed by SQLite first, so the
+    .npy files can be allocated upfront and filled chunk by chunk. Only one
+    chunk of rows is held in memory at a time.
+
+    Args:
+        database_path: Path to the Aimsun output sqlite file.
+        cache_directory: Directory to write the cache to.
+        table_names: Names of the tables to convert.
+    """
+    fingerprint = get_file_fingerprint(database_path)
+    database = sqlite3.connect(
+        f"file:{database_path}?mode=ro", uri=True, isolation_level=None)
+    existing_table_names = {row[0] for row in database.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    manifest = {"source": fingerprint, "tables": {}}
+    for table_name in table_names:
+        if table_name not in existing_table_names:
+            continue
+        # The column types and the rows are read in the same snapshot.
+        database.execute("BEGIN")
+        cursor = database.execute(f"SELECT * FROM {table_name}")
+        column_names = [column[0] for column in cursor.description]
+        num_rows, dtypes = _get_column_dtypes(
+            database, table_name, column_names)
+        table_directory = os.path.join(cache_directory, table_name)
+        os.makedirs(table_directory, exist_ok=True)
+        column_paths = [os.path.join(table_directory, f"{column_name}.npy")
+                        for column_name in column_names]
+        if num_rows == 0:
+            # Empty files can not be memory mapped.
+            for column_path, dtype in zip(column_paths, dtypes):
+                np.save(column_path, np.empty(0, dtype=dtype))
+        else:
+            columns = [np.lib.format.open_memmap(
+                column_path, mode="w+", dtype=dtype, shape=(num_rows,))
+                for column_path, dtype in zip(column_paths, dtypes)]
+            start = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                for column, values in zip(columns, zip(*rows)):
+                    column[start:start + len(rows)] = _convert_values(
+                        values, column.dtype)
+                start += len(rows)
+            assert start == num_rows
+            for column in columns:
+                column.flush()
+            del columns
+        cursor.close()
+        database.execute("COMMIT")
+        manifest["tables"][table_name] = column_names
+    database.close()
+    # The manifest is written last, so an interrupted export is never valid.
+    with open(os.path.join(cache_directory, CACHE_MANIFEST_FILENAME), "w",
+              encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def _get_column_dtypes(
+    database: sqlite3.Connection, table_name: str, column_names: List[str]
+) -> Tuple[int, List[np.dtype]]:
+    """Compute the NumPy type of each column of a table in a single scan.
+
+    A column is stored as unicode strings if it contains any text or blob, as
+    int64 if it only contains integers, and as float64 otherwise.
+
+    Args:
+        database: Connection to the Aimsun output database.
+        table_name: Name of the table.
+        column_names: Names of all columns of the table.
+    Returns:
+        num_rows: Number of rows of the table.
+        dtypes: Type of each column.
+    """
+    expressions = []
+    for column_name in column_names:
+        column = f'"{column_name}"'
+        expressions += [
+            f"MAX(typeof({column}) IN ('text', 'blob'))",
+            f"MIN(typeof({column}) = 'integer')",
+            # Length of the values once converted with str().
+            f"MAX(CASE typeof({column}) WHEN 'null' THEN 0 "
+            f"WHEN 'text' THEN LENGTH({column}) "
+            f"WHEN 'blob' THEN 4 * LENGTH({column}) + 3 "
+            f"ELSE {MAX_NUMBER_STR_LENGTH} END)"]
+    num_rows, *statistics = database.execute(
+        f"SELECT COUNT(*), {', '.join(expressions)} "
+        f"FROM {table_name}").fetchone()
+    dtypes = []
+    for has_text, all_integer, max_length in zip(
+            statistics[::3], statistics[1::3], statistics[2::3]):
+        if has_text:
+            dtypes.append(np.dtype(f"U{max(max_length, 1)}"))
+        elif all_integer is None or all_integer:
+            dtypes.append(np.dtype(np.int64))
+        else:
+            dtypes.append(np.dtype(float))
+    return num_rows, dtypes
+
+
+def _convert_values(values: Sequence[Any], dtype: np.dtype) -> np.ndarray:
+    """Convert a chunk of values of one SQLite column into a NumPy array that
+    can be memory mapped (i.e. without Python objects).
+
+    Args:
+        values: Values of the column.
+        dtype: Type of the whole column, from _get_column_dtypes().
+    Returns:
+        column: Array of the values.
+    """
+    if dtype.kind == "U":
+        return np.array(["" if value is None else str(value)
+                         for value in values], dtype=dtype)
+    return np.array(values, dtype=dtype)
+
+
+class ColumnarTable:
+    """Data class for one table of the columnar cache. It answers the same
+    queries as SQLiteTable with vectorized NumPy operations.
+
+    Attributes:
+        __table_directory: Directory that contains one .npy file per column.
+        __columns: Memory-mapped columns loaded so far, keyed by column name.
+        table_name: Name of the table.
+    """
+
+    __table_directory: str
+    __columns: Dict[str, np.ndarray]
+    table_name: str
+
+    def __init__(self, cache_directory: str, table_name: str):
+        self.__table_directory = os.path.join(cache_directory, table_name)
+        self.__columns = {}
+        self.table_name = table_name
+
+    def get_column(self, column_name: str) -> np.ndarray:
+        """Get all values of a column. Columns are memory mapped on first use.
+
+        Args:
+            column_name: Name of the column.
+        Returns:
+            column: Read-only array of the column values.
+        """
+        if column_name not in self.__columns:
+            column_path = os.path.join(
+                self.__table_directory, f"{column_name}.npy")
+            if not os.path.exists(column_path):
+                raise ValueError(
+                    f"Column {column_name} of table {self.table_name} is not "
+                    "in the cache.")
+            self.__columns[column_name] = np.load(column_path, mmap_mode="r")
+        return self.__columns[column_name]
+
+    def select(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        fetch_mode: FetchMode = FetchMode.ALL,
+        size: int = 1,
+    ) -> Any:
+        """Gets the data of several columns on condition. See
+        SQLiteTable.select() for the description of the arguments and the
+        returned value."""
+        rows_index = np.flatnonzero(self.__get_mask(condition_column_name_value))
+        if fetch_mode == FetchMode.ONE:
+            rows_index = rows_index[:1]
+        elif fetch_mode == FetchMode.MANY:
+            rows_index = rows_index[:size]
+        rows = list(zip(*(self.get_column(column_name)[rows_index].tolist()
+                          for column_name in data_column_names)))
+        if fetch_mode == FetchMode.ONE:
+            return rows[0] if rows else None
+        return rows
+
+    def get_data_on_condition(
+        self, data_column_name: str, condition_column_name_value: Dict[str, Any] = None
+    ) -> Any:
+        """Gets data on condition. See SQLiteTable.get_data_on_condition()."""
+        row = self.select(
+            [data_column_name], condition_column_name_value, FetchMode.ONE)
+        if row is None:
+            raise ValueError(
+                f"No row of {self.table_name} satisfies the conditions "
+                f"{condition_column_name_value}.")
+        return row[0]
+
+    def iter_batches(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        dtypes: Dict[str, Any] = None,
+    ) -> Iterator[np.ndarray]:
+        """Stream the data of several columns on condition in fixed-size
+        batches. See SQLiteTable.iter_batches(). Columns keep their cached
+        type unless given in dtypes."""
+        assert batch_size > 0
+        dtypes = dtypes or {}
+        columns = [self.get_column(name) for name in data_column_names]
+        dtype = np.dtype([
+            (name, dtypes.get(name, column.dtype))
+            for name, column in zip(data_column_names, columns)])
+        rows_index = np.flatnonzero(self.__get_mask(condition_column_name_value))
+        for start in range(0, len(rows_index), batch_size):
+            batch_index = rows_index[start:start + batch_size]
+            batch = np.empty(len(batch_index), dtype=dtype)
+            for name, column in zip(data_column_names, columns):
+                batch[name] = column[batch_index]
+            yield batch
+
+    def iter_rows(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[Tuple[Any, ...]]:
+        """Stream the rows of several columns on condition. See
+        SQLiteTable.iter_rows()."""
+        for batch in self.iter_batches(
+                data_column_names, condition_column_name_value, batch_size):
+            yield from zip(*(batch[name].tolist()
+                             for name in data_column_names))
+
+    def get_dense_array(
+        self, data_column_name: str, axis_column_names: List[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        axis_values: List[Optional[Sequence[Any]]] = None
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Gets data as a dense array indexed by the values of several columns.
+        See SQLiteTable.get_dense_array()."""
+        data, all_axis_values = self.get_dense_arrays(
+            [data_column_name], axis_column_names,
+            condition_column_name_value, axis_values)
+        return data[0], all_axis_values
+
+    def get_dense_arrays(
+        self, data_column_names: Sequence[str], axis_column_names: List[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        axis_values: List[Optional[Sequence[Any]]] = None
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Gets the data of several columns as dense arrays indexed by the
+        values of several columns. See SQLiteTable.get_dense_arrays()."""
+        if axis_values is None:
+            axis_values = [None] * len(axis_column_names)
+        assert len(axis_values) == len(axis_column_names)
+        mask = self.__get_mask(condition_column_name_value)
+        all_axis_values, all_axis_indices = [], []
+        for axis_column_name, values in zip(axis_column_names, axis_values):
+            axis, index = get_axis_index(
+                np.asarray(self.get_column(axis_column_name)[mask]), values)
+            all_axis_values.append(axis)
+            all_axis_indices.append(index)
+        shape = tuple(len(axis) for axis in all_axis_values)
+        size = int(np.prod(shape))
+        in_axes = np.ones(int(np.count_nonzero(mask)), dtype=bool)
+        for index in all_axis_indices:
+            in_axes &= index >= 0
+        result = np.empty((len(data_column_names),) + shape)
+        for i, data_column_name in enumerate(data_column_names):
+            data = np.asarray(
+                self.get_column(data_column_name)[mask], dtype=float)
+            found = in_axes & ~np.isnan(data)
+            flat_index = np.ravel_multi_index(
+                tuple(index[found] for index in all_axis_indices), shape)
+            # Average rows sharing the same axis values, like SQL AVG().
+            total = np.bincount(flat_index, weights=data[found],
+                                minlength=size)
+            count = np.bincount(flat_index, minlength=size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[i] = np.where(count > 0, total / count,
+                                     np.nan).reshape(shape)
+        return result, all_axis_values
+
+    def __get_mask(
+        self, condition_column_name_value: Optional[Dict[str, Any]]
+    ) -> np.ndarray:
+        """Compute which rows satisfy all conditions.
+
+        Args:
+            condition_column_name_value: Mapping of conditions, with the same
+                format as in SQLiteTable.select().
+        Returns:
+            mask: Boolean array with one item per row of the table.
+        """
+        condition_column_name_value = condition_column_name_value or {}
+        mask = None
+        for condition_column_name, condition_value in \
+                condition_column_name_value.items():
+            column = self.get_column(condition_column_name)
+            if isinstance(condition_value, (list, tuple, set, np.ndarray)):
+                condition_mask = np.isin(column, list(condition_value))
+            else:
+                condition_mask = column == condition_value
+            mask = condition_mask if mask is None else mask & condition_mask
+        if mask is None:
+            # Any column gives the number of rows.
+            table_columns = [name for name in os.listdir(
+                self.__table_directory) if name.endswith(".npy")]
+            mask = np.ones(len(self.get_column(table_columns[0][:-4])),
+                           dtype=bool)
+        return mask
+
+
+class AimsunMicroOutputCache(AimsunMicroOutputDatabase):
+    """Data class to read Aimsun microsimulation output data from its columnar
+    cache. It provides the same getters as AimsunMicroOutputDatabase.
+
+    Attributes:
+        cache_directory: Directory of the cache.
+    """
+
+    cache_directory: str
+
+    def __init__(self, database_path: str, cache_directory: str):
+        """Open the cache of a database, building or rebuilding it first if it
+        does not match the database.
+
+        Args:
+            database_path: Path to the Aimsun output sqlite file.
+            cache_directory: Directory of the cache.
+        """
+        self.cache_directory = cache_directory
+        if not is_cache_valid(database_path, cache_directory):
+            export_output_database_cache(database_path, cache_directory)
+        super().__init__(database_path)
+
+    def ensure_indexes(
+        self, sidecar_path: str = "",
+        covered_column_names: Dict[str, Sequence[str]] = None
+    ) -> Dict[str, float]:
+        """Do nothing: the columnar cache is scanned with vectorized operations
+        and has no index to build. Code written for AimsunMicroOutputDatabase
+        can call it unchanged.
+
+        Args:
+            sidecar_path: Ignored.
+            covered_column_names: Ignored.
+        Returns:
+            build_times: Always empty, as no index is built.
+        """
+        return {}
+
+    def _open_database(self, database_path: str) -> None:
+        """The cache does not keep any connection to the SQLite file."""
+        return None
+
+    def _read_schema(self) -> Dict[str, List[str]]:
+        """Read the names of the columns of all cached tables from the
+        manifest of the cache."""
+        with open(os.path.join(self.cache_directory, CACHE_MANIFEST_FILENAME),
+                  "r", encoding="utf-8") as file:
+            return json.load(file)["tables"]
+
+    def _open_table(self, table_name: str) -> ColumnarTable:
+        """Create the object used to query one table of the cache."""
+        return ColumnarTable(self.cache_directory, table_name)
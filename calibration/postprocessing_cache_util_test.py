@@ -0,0 +1,104 @@
+"""Tests for postprocessing_cache_util."""
+
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from calibration import postprocessing_cache_util
+from calibration.output_database_test_util import (
+    DETECTOR_EXTERNAL_IDS,
+    SECTION_INTERNAL_IDS,
+    TIME_LIST,
+    OutputDatabaseTestCase,
+)
+from calibration.postprocessing_cache_util import (
+    AimsunMicroOutputCache,
+    export_output_database_cache,
+    is_cache_valid,
+)
+from calibration.postprocessing_util import AimsunMicroOutputDatabase
+
+
+class TestAimsunMicroOutputCache(OutputDatabaseTestCase):
+    """Test that the columnar cache answers the same queries as the SQLite
+    database, and that it is rebuilt when the database changes."""
+
+    def setUp(self):
+        super().setUp()
+        self.database_path = self.create_database("micro.sqlite")
+        self.cache_directory = os.path.join(self.directory.name, "cache")
+
+    def test_same_data_as_database(self):
+        """Test that the getters return the same data from both sources."""
+        database = AimsunMicroOutputDatabase(self.database_path)
+        cache = AimsunMicroOutputCache(self.database_path, self.cache_directory)
+        self.assertTrue(is_cache_valid(self.database_path, self.cache_directory))
+        self.assertEqual(cache.ensure_indexes(), {})
+        for time in TIME_LIST:
+            self.assertEqual(
+                database.get_road_section_speed(SECTION_INTERNAL_IDS[0], time),
+                cache.get_road_section_speed(SECTION_INTERNAL_IDS[0], time))
+            self.assertEqual(database.get_total_delay_time(time),
+                             cache.get_total_delay_time(time))
+        database_flow, database_ids, _ = database.get_detectors_flow(
+            DETECTOR_EXTERNAL_IDS[::-1], TIME_LIST[1:])
+        cache_flow, cache_ids, _ = cache.get_detectors_flow(
+            DETECTOR_EXTERNAL_IDS[::-1], TIME_LIST[1:])
+        np.testing.assert_allclose(database_flow, cache_flow)
+        self.assertEqual(list(database_ids), list(cache_ids))
+        column_names = ["eid", "ent", "flow"]
+        self.assertEqual(
+            list(database.detectors_table.iter_rows(column_names, batch_size=8)),
+            list(cache.detectors_table.iter_rows(column_names, batch_size=8)))
+        database.close()
+
+    def test_cache_invalidation(self):
+        """Test that modifying the database invalidates the cache, while only
+        touching it does not."""
+        AimsunMicroOutputCache(self.database_path, self.cache_directory)
+        stat = os.stat(self.database_path)
+        os.utime(self.database_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertTrue(is_cache_valid(self.database_path, self.cache_directory))
+
+        database = sqlite3.connect(self.database_path)
+        database.execute("UPDATE MISYS SET dtime = dtime + 1")
+        database.commit()
+        database.close()
+        os.utime(self.database_path, (stat.st_atime, stat.st_mtime + 20))
+        self.assertFalse(
+            is_cache_valid(self.database_path, self.cache_directory))
+        cache = AimsunMicroOutputCache(self.database_path, self.cache_directory)
+        self.assertTrue(is_cache_valid(self.database_path, self.cache_directory))
+        self.assertEqual(cache.get_total_delay_time(TIME_LIST[0]), 107.0)
+
+    def test_export_column_types(self):
+        """Test the type of exported columns whose values change type after
+        the first chunk of rows."""
+        database = sqlite3.connect(self.database_path)
+        database.execute("CREATE TABLE TYPES (i INTEGER, f REAL, t TEXT, x)")
+        database.executemany("INSERT INTO TYPES VALUES (?, ?, ?, ?)", [
+            (1, 1.5, "ab", 1), (2, 2.0, None, 2), (3, None, "c", "text")])
+        database.commit()
+        database.close()
+        with mock.patch.object(
+                postprocessing_cache_util, "EXPORT_CHUNK_SIZE", 2):
+            export_output_database_cache(
+                self.database_path, self.cache_directory, ["TYPES", "MISYS"])
+        expected_columns = {
+            "i": np.array([1, 2, 3], dtype=np.int64),
+            "f": np.array([1.5, 2.0, np.nan]),
+            "t": np.array(["ab", "", "c"]),
+            "x": np.array(["1", "2", "text"]),
+        }
+        for column_name, expected_column in expected_columns.items():
+            column = np.load(os.path.join(
+                self.cache_directory, "TYPES", f"{column_name}.npy"))
+            self.assertEqual(column.dtype.kind, expected_column.dtype.kind)
+            np.testing.assert_array_equal(column, expected_column)
+
+
+if __name__ == "__main__":
+    unittest.main()
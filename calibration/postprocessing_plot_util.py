@@ -2,23 +2,161 @@
 
 from __future__ import annotations
 
+import concurrent.futures
 import datetime
+import hashlib
+import html
 import os
+import re
 import sys
-from typing import Any, Dict, List, Iterable, Union
+from typing import Any, Dict, List, Iterable, Sequence, Tuple, Union
 
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from sklearn.linear_model import LinearRegression
 
 from calibration.postprocessing_util import (
     AimsunMacroOutputDatabase,
     AimsunMicroOutputDatabase
 )
+from calibration.time_grid_util import TimeGrid
 
 sys.path.append(os.path.abspath(os.path.join('..', 'Utils')))
 
 from utils.aimsun_input_utils import AimsunFlowRealDataSet, ExternalId, InternalId
 
+PLOT_FORMATS = ("png", "svg")
+DEFAULT_SLOPE_BOUNDS = (0.8, 1.2)
+PLOT_INDEX_FILENAME = "index.html"
+
+
+class FlowComparison:
+    """Data class for real and simulated flow of many detectors at many times,
+    aligned on the same detector and time axes.
+
+    Selecting times or groups of detectors (e.g. city or PeMS detectors) is
+    done by indexing the arrays, so the flow of one time interval or of all
+    time intervals can be extracted repeatedly without walking dictionaries.
+
+    Attributes:
+        detector_external_ids: External ID of the detector of each row.
+        times: Start time of the time interval of each column.
+        real_flow: Array of shape (detectors, times) of real flow. NaN where a
+            detector has no real data.
+        simulated_flow: Array of shape (detectors, times) of simulated flow.
+    """
+
+    detector_external_ids: np.ndarray
+    times: List[datetime.time]
+    real_flow: np.ndarray
+    simulated_flow: np.ndarray
+
+    def __init__(
+        self, detector_external_ids: Sequence[ExternalId],
+        times: Sequence[datetime.time], real_flow: np.ndarray,
+        simulated_flow: np.ndarray
+    ):
+        assert all(isinstance(time, datetime.time) for time in times)
+        self.detector_external_ids = np.asarray(detector_external_ids,
+                                                dtype=str)
+        self.times = list(times)
+        self.real_flow = np.asarray(real_flow, dtype=float)
+        self.simulated_flow = np.asarray(simulated_flow, dtype=float)
+        shape = (len(self.detector_external_ids), len(self.times))
+        assert self.real_flow.shape == self.simulated_flow.shape == shape
+        self.__time_index = {time: i for i, time in enumerate(self.times)}
+        self.__group_masks = {}
+
+    @classmethod
+    def from_flow_per_time(
+        cls, real_flow_per_time: Dict[datetime.time, Dict[ExternalId, float]],
+        simulated_flow_per_time: Dict[datetime.time, Dict[ExternalId, float]],
+        time_list: List[datetime.time]
+    ) -> FlowComparison:
+        """Build the arrays from dictionaries with real and simulated flow per
+        time, as returned by process_real_flow_data() and
+        process_micro_simulated_flow_data().
+
+        Args:
+            real_flow_per_time: Real flow data grouped by time.
+            simulated_flow_per_time: Simulated flow data grouped by time.
+            time_list: Times to include.
+        Returns:
+            flow_comparison: Aligned real and simulated flow. Detectors are in
+                the order they first appear in real_flow_per_time.
+        Raises:
+            KeyError: If a detector has real flow but no simulated flow at a
+                time.
+        """
+        detector_index = {}
+        for time in time_list:
+            for detector_external_id in real_flow_per_time[time]:
+                detector_index.setdefault(
+                    detector_external_id, len(detector_index))
+        real_flow = np.full((len(detector_index), len(time_list)), np.nan)
+        simulated_flow = np.full(real_flow.shape, np.nan)
+        for j, time in enumerate(time_list):
+            simulated_flow_dict = simulated_flow_per_time[time]
+            for detector_external_id, real_flow_value in \
+                    real_flow_per_time[time].items():
+                i = detector_index[detector_external_id]
+                real_flow[i, j] = real_flow_value
+                simulated_flow[i, j] = \
+                    simulated_flow_dict[detector_external_id]
+        return cls(list(detector_index), time_list, real_flow, simulated_flow)
+
+    def get_time_index(self, times: Iterable[datetime.time]) -> np.ndarray:
+        """Get the column of each time.
+
+        Raises:
+            KeyError: If a time is not part of the time axis.
+        """
+        return np.array([self.__time_index[time] for time in times],
+                        dtype=int)
+
+    def get_group_mask(self, common_id: str) -> np.ndarray:
+        """Get the mask of the detectors whose external ID contains a common
+        string, e.g. the year of observed data for city detectors in the
+        Fremont study. Masks are computed once per common string.
+
+        Args:
+            common_id: String shared within the external IDs of the group.
+        Returns:
+            mask: Boolean array with one item per detector.
+        """
+        if common_id not in self.__group_masks:
+            self.__group_masks[common_id] = np.char.find(
+                self.detector_external_ids, common_id) >= 0
+        return self.__group_masks[common_id]
+
+    def select(
+        self, times: Iterable[datetime.time] = None,
+        detector_mask: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get real and simulated flow of some detectors at some times as
+        sklearn & matplotlib friendly column vectors. Items are ordered by
+        time, then by detector, and detectors without real flow at a time are
+        left out.
+
+        Args:
+            times: Times to select. If None, all times are used.
+            detector_mask: Boolean array selecting detectors. If None, all
+                detectors are used.
+        Returns:
+            real_flow_list: Array of shape (items, 1) of real flow.
+            simulated_flow_list: Array of shape (items, 1) of simulated flow.
+        """
+        time_index = slice(None) if times is None \
+            else self.get_time_index(times)
+        detector_index = slice(None) if detector_mask is None \
+            else detector_mask
+        real_flow = self.real_flow[detector_index][:, time_index].T
+        simulated_flow = self.simulated_flow[detector_index][:, time_index].T
+        valid = ~np.isnan(real_flow)
+        return real_flow[valid].reshape(-1, 1), \
+            simulated_flow[valid].reshape(-1, 1)
+
 
 def convert_flow_per_time_to_list(
     real_flow_per_time: Dict[datetime.time, Dict[ExternalId, float]],
@@ -27,7 +165,9 @@ def convert_flow_per_time_to_list(
 ) -> Union[tuple(np.array, np.array),
            tuple(np.array, np.array, np.array, np.array)]:
     """Convert dictionaries with real and simulated flow per time into
-    sklearn & matplotlib friendly structures.
+    sklearn & matplotlib friendly structures. To extract flow repeatedly,
+    build a FlowComparison once and use FlowComparison.select() instead, which
+    orders detectors the same way at every time.
 
     Args:
         real_flow_per_time: Real flow data grouped by time.
@@ -52,50 +192,26 @@ def convert_flow_per_time_to_list(
             pems_simulated_flow_list: All simulated flow data through PeMS
                 detectors for each time within time_list aggregated together.
     """
-    assert all(isinstance(time, datetime.time) for time in time_list)
+    flow_comparison = FlowComparison.from_flow_per_time(
+        real_flow_per_time, simulated_flow_per_time, time_list)
+    # Items follow the order of the detectors in each per-time dictionary,
+    # which may differ from one time to the next.
+    detector_index = {detector_external_id: i for i, detector_external_id
+                      in enumerate(flow_comparison.detector_external_ids)}
+    rows = np.array([detector_index[detector_external_id]
+                     for time in time_list
+                     for detector_external_id in real_flow_per_time[time]],
+                    dtype=int)
+    columns = np.array([j for j, time in enumerate(time_list)
+                        for _ in real_flow_per_time[time]], dtype=int)
+    real_flow_list = flow_comparison.real_flow[rows, columns].reshape(-1, 1)
+    simulated_flow_list = flow_comparison.simulated_flow[
+        rows, columns].reshape(-1, 1)
     if city_common_id is None:
-        all_real_flow_list = []
-        all_simulated_flow_list = []
-        for time in time_list:
-            real_flow_dict = real_flow_per_time[time]
-            simulated_flow_dict = simulated_flow_per_time[time]
-            for detector_external_id, real_flow_value in \
-                    real_flow_dict.items():
-                all_real_flow_list.append(real_flow_value)
-                all_simulated_flow_list.append(
-                    simulated_flow_dict[detector_external_id])
-        assert len(all_real_flow_list) == len(all_simulated_flow_list)
-        all_real_flow_list = np.array(all_real_flow_list).reshape(-1, 1)
-        all_simulated_flow_list = np.array(
-            all_simulated_flow_list).reshape(-1, 1)
-        return all_real_flow_list, all_simulated_flow_list
-    city_real_flow_list = []
-    city_simulated_flow_list = []
-    pems_real_flow_list = []
-    pems_simulated_flow_list = []
-    for time in time_list:
-        real_flow_dict = real_flow_per_time[time]
-        simulated_flow_dict = simulated_flow_per_time[time]
-        for detector_external_id, real_flow_value in \
-                real_flow_dict.items():
-            if city_common_id in detector_external_id:
-                city_real_flow_list.append(real_flow_value)
-                city_simulated_flow_list.append(
-                    simulated_flow_dict[detector_external_id])
-            else:
-                pems_real_flow_list.append(real_flow_value)
-                pems_simulated_flow_list.append(
-                    simulated_flow_dict[detector_external_id])
-    assert len(city_real_flow_list) == len(city_simulated_flow_list)
-    assert len(pems_real_flow_list) == len(pems_simulated_flow_list)
-    city_real_flow_list = np.array(city_real_flow_list).reshape(-1, 1)
-    city_simulated_flow_list = np.array(
-        city_simulated_flow_list).reshape(-1, 1)
-    pems_real_flow_list = np.array(pems_real_flow_list).reshape(-1, 1)
-    pems_simulated_flow_list = np.array(
-        pems_simulated_flow_list).reshape(-1, 1)
-    return city_real_flow_list, city_simulated_flow_list, \
-        pems_real_flow_list, pems_simulated_flow_list
+        return real_flow_list, simulated_flow_list
+    city_mask = flow_comparison.get_group_mask(city_common_id)[rows]
+    return real_flow_list[city_mask], simulated_flow_list[city_mask], \
+        real_flow_list[~city_mask], simulated_flow_list[~city_mask]
 
 
 def get_linear_regression(
@@ -134,18 +250,99 @@ def get_linear_regression(
     return slope[0][0], intercept_float, r_sq, max_val, yhat
 
 
+def get_batched_linear_regression(
+    real_flow: np.ndarray, simulated_flow: np.ndarray,
+    enforce_intercept: bool, detector_masks: np.ndarray = None,
+    valid_mask: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the linear regression between real and simulated flow at every
+    time interval, and over all time intervals pooled together, for several
+    groups of detectors at once. Closed-form equivalent of calling
+    get_linear_regression() once per time interval and group.
+
+    Args:
+        real_flow: Array of shape (detectors, time intervals) of real flow,
+            used as x-axis data.
+        simulated_flow: Array of shape (detectors, time intervals) of
+            simulated flow, used as y-axis data.
+        enforce_intercept: Whether the intercept should be set to 0.
+        detector_masks: Boolean array of shape (groups, detectors), e.g. city
+            and PeMS detectors. If None, all detectors form one group.
+        valid_mask: Boolean array of shape (detectors, time intervals) of the
+            values to use. Values where real or simulated flow is NaN are
+            always left out.
+    Returns:
+        slope: Array of shape (groups, time intervals + 1) of the slope of the
+            line of best fit. The last column is the regression over all time
+            intervals pooled together.
+        intercept: Intercept of the line of best fit, with the same shape.
+            Unlike get_linear_regression(), its sign is kept.
+        r_sq: R-squared value of the line of best fit, with the same shape.
+        count: Number of values used in each regression, with the same shape.
+        Regressions with too few values (or constant real flow) are NaN.
+    """
+    real_flow = np.asarray(real_flow, dtype=float)
+    simulated_flow = np.asarray(simulated_flow, dtype=float)
+    valid = ~np.isnan(real_flow) & ~np.isnan(simulated_flow)
+    if valid_mask is not None:
+        valid &= np.asarray(valid_mask, dtype=bool)
+    if detector_masks is None:
+        detector_masks = np.ones((1, real_flow.shape[0]), dtype=bool)
+    masks = np.asarray(detector_masks, dtype=float)
+
+    # Shift the data before summing products to avoid cancellation.
+    center_x = real_flow[valid].mean() if np.any(valid) else 0.0
+    center_y = simulated_flow[valid].mean() if np.any(valid) else 0.0
+    x = np.where(valid, real_flow - center_x, 0.0)
+    y = np.where(valid, simulated_flow - center_y, 0.0)
+    # Sums over the detectors of each group with one matrix product per
+    # statistic, then over all time intervals for the pooled regression.
+    sums = []
+    for values in [valid.astype(float), x, y, x * x, x * y, y * y]:
+        group_sums = masks @ values
+        sums.append(np.concatenate(
+            [group_sums, group_sums.sum(axis=1, keepdims=True)], axis=1))
+    count, sum_x, sum_y, sum_xx, sum_xy, sum_yy = sums
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = sum_x / count
+        mean_y = sum_y / count
+        centered_yy = sum_yy - count * mean_y ** 2
+        if enforce_intercept:
+            # Sums of the products of the unshifted data.
+            raw_xx = sum_xx + 2 * center_x * sum_x + count * center_x ** 2
+            raw_xy = sum_xy + center_x * sum_y + center_y * sum_x \
+                + count * center_x * center_y
+            raw_yy = sum_yy + 2 * center_y * sum_y + count * center_y ** 2
+            slope = raw_xy / raw_xx
+            intercept = np.where(count > 0, 0.0, np.nan)
+            residual = raw_yy - slope * raw_xy
+        else:
+            centered_xx = sum_xx - count * mean_x ** 2
+            centered_xy = sum_xy - count * mean_x * mean_y
+            slope = centered_xy / centered_xx
+            intercept = (mean_y + center_y) - slope * (mean_x + center_x)
+            residual = centered_yy - slope * centered_xy
+        r_sq = np.where(centered_yy > 0, 1 - residual / centered_yy, np.nan)
+    return slope, intercept, r_sq, count.astype(int)
+
+
 def process_real_flow_data(
-    real_flow_dataset: AimsunFlowRealDataSet, time_list: Iterable[datetime.time]
+    real_flow_dataset: AimsunFlowRealDataSet, time_list: Iterable[datetime.time],
+    time_grid: TimeGrid = None
 ) -> tuple(dict(datetime.time, dict(ExternalId, float)),
            dict(ExternalId, dict(datetime.time, float)),
            list(ExternalId)):
     """Helper function to extract real flow per time and real flow per detector
-    from an AimsunFlowRealDataSet object.
+    from an AimsunFlowRealDataSet object, in a single pass over the data set.
 
     Args:
         real_flow_dataset: Object that contains the real flow data.
         time_list: List of start times for each time interval within the
             timeframe of study.
+        time_grid: Time intervals of the real flow data, whose length sets the
+            key of each time interval and the scaling of counts to hourly
+            flows. If None, the time intervals of metadata_settings are used.
     Returns:
         real_flow_per_time: Real flow data grouped by time. Used for flow
             biplots.
@@ -154,37 +351,83 @@ def process_real_flow_data(
         detector_external_id_list: List of external IDs for the detectors used
             in the study.
     """
-    # Initialize return paramaters.
-    real_flow_per_time = {}
+    time_list = list(time_list)
+    if not time_list:
+        return {}, {}, []
+    if time_grid is None:
+        time_grid = TimeGrid.from_metadata_settings()
+    hourly_flow_factor = time_grid.hourly_flow_factor
+    min_time, max_time = min(time_list), max(time_list)
+    time_keys = time_grid.get_interval_end_timedeltas(time_list)
+    # Real flow data of all detectors usually share the same keys: convert
+    # each key to a time once.
+    times_of_keys = {}
+
+    real_flow_per_time = {time: {} for time in time_list}
     real_flow_per_detector = {}
-    detector_external_id_list = []
+    for flow_real_data in real_flow_dataset.flow_data_set:
+        detector_external_id = f"flow_{flow_real_data.external_id}"
+        flow_data = flow_real_data.flow_data
+        # Group flow by time.
+        for time, time_key in zip(time_list, time_keys):
+            real_flow_per_time[time][detector_external_id] = \
+                flow_data[time_key] * hourly_flow_factor
+        # Group flow by detectors.
+        flow_per_detector_dict = real_flow_per_detector.setdefault(
+            detector_external_id, {})
+        for time_key, flow_val in flow_data.items():
+            time = times_of_keys.get(time_key)
+            if time is None:
+                time = (datetime.datetime.min + time_key).time()
+                times_of_keys[time_key] = time
+            if min_time <= time <= max_time:
+                flow_per_detector_dict[time] = flow_val * hourly_flow_factor
 
-    # Group flow by time.
-    for time in time_list:
-        flow_per_time_dict = {}
-        for flow_real_data in real_flow_dataset.flow_data_set:
-            detector_external_id = f"flow_{flow_real_data.external_id}"
-            if detector_external_id not in detector_external_id_list:
-                detector_external_id_list.append(detector_external_id)
-            time_in_timedelta = datetime.timedelta(
-                hours=time.hour, minutes=time.minute) \
-                + datetime.timedelta(minutes=15)  # This line is the scaler
-            flow_per_time_dict[detector_external_id] = \
-                flow_real_data.flow_data[time_in_timedelta] * 4
-        real_flow_per_time[time] = flow_per_time_dict
-
-    # Group flow by detectors.
-    for detector_external_id in detector_external_id_list:
-        flow_per_detector_dict = {}
-        for flow_real_data in real_flow_dataset.flow_data_set:
-            if f"flow_{flow_real_data.external_id}" == detector_external_id:
-                for time_key, flow_val in flow_real_data.flow_data.items():
-                    time = (datetime.datetime.min + time_key).time()
-                    if min(time_list) <= time <= max(time_list):
-                        flow_per_detector_dict[time] = flow_val * 4
-        real_flow_per_detector[detector_external_id] = flow_per_detector_dict
-
-    return real_flow_per_time, real_flow_per_detector, detector_external_id_list
+    return real_flow_per_time, real_flow_per_detector, \
+        list(real_flow_per_detector)
+
+
+def get_real_flow_array(
+    real_flow_dataset: AimsunFlowRealDataSet,
+    time_list: Iterable[datetime.time], time_grid: TimeGrid = None
+) -> Tuple[np.ndarray, List[ExternalId]]:
+    """Extract real flow of all detectors at all times into a dense array, in
+    a single pass over the data set. Can be combined with the simulated flow
+    of get_detectors_flow() into a FlowComparison.
+
+    Args:
+        real_flow_dataset: Object that contains the real flow data.
+        time_list: List of start times for each time interval within the
+            timeframe of study.
+        time_grid: Time intervals of the real flow data. See
+            process_real_flow_data().
+    Returns:
+        real_flow: Array of shape (detectors, times) of real flow in vehicles
+            per hour. NaN where a detector has no data for a time interval.
+        detector_external_id_list: External ID of the detector of each row,
+            in the Aimsun format "flow_<external ID>".
+    """
+    if time_grid is None:
+        time_grid = TimeGrid.from_metadata_settings()
+    time_keys = time_grid.get_interval_end_timedeltas(list(time_list))
+    detector_index = {}
+    rows = []
+    for flow_real_data in real_flow_dataset.flow_data_set:
+        detector_external_id = f"flow_{flow_real_data.external_id}"
+        flow_data = flow_real_data.flow_data
+        row = [flow_data.get(time_key, np.nan) for time_key in time_keys]
+        if detector_external_id in detector_index:
+            # Later data of the same detector overrides earlier data.
+            previous = rows[detector_index[detector_external_id]]
+            rows[detector_index[detector_external_id]] = [
+                previous_value if np.isnan(value) else value
+                for previous_value, value in zip(previous, row)]
+        else:
+            detector_index[detector_external_id] = len(rows)
+            rows.append(row)
+    real_flow = time_grid.convert_count_to_hourly_flow(np.array(
+        rows, dtype=float).reshape(len(rows), len(time_keys)))
+    return real_flow, list(detector_index)
 
 
 def __revert_dict_of_dict(
@@ -250,14 +493,14 @@ def process_micro_simulated_flow_data(
         simulated_flow_per_detector: Simulated flow data grouped by detector.
             Used for flow profiles.
     """
+    # Query flow of all detectors at all times at once.
+    flow_values, _, _ = simulation_results_database.get_detectors_flow(
+        detector_external_id_list, time_list)
+
     # Group flow by time.
     simulated_flow_per_time = {
-        time: {
-            detector_external_id: simulation_results_database.get_detector_flow(
-                detector_external_id, time)
-            for detector_external_id in detector_external_id_list
-        }
-        for time in time_list
+        time: dict(zip(detector_external_id_list, flow_values[:, i].tolist()))
+        for i, time in enumerate(time_list)
     }
     return simulated_flow_per_time, __revert_dict_of_dict(
         simulated_flow_per_time)
@@ -274,4 +517,280 @@ def process_network_delay_time_data(
     return delay_times
 
 
+class _BiplotTemplate:
+    """Figure of a real vs simulated biplot, whose artists are created once and
+    updated for every plot."""
+
+    def __init__(self, settings: Dict[str, Any]):
+        metric = f"{settings['metric_name']} ({settings['metric_units']})"
+        lower_bound, upper_bound = settings["slope_bounds"]
+        self.figure = Figure(figsize=(10, 10))
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel(f"Real {metric}")
+        self.axes.set_ylabel(f"Simulated {metric}")
+        self.scatter = self.axes.scatter([], [], color="steelblue", alpha=0.5)
+        self.identity_line, = self.axes.plot(
+            [], [], color="red", linewidth=2, label="Y = X")
+        self.lower_bound_line, = self.axes.plot(
+            [], [], color="green", linewidth=2,
+            label=f"Y = {lower_bound}X (lower bound)")
+        self.upper_bound_line, = self.axes.plot(
+            [], [], color="purple", linewidth=2,
+            label=f"Y = {upper_bound}X (upper bound)")
+        self.fit_line, = self.axes.plot(
+            [], [], color="blue", linewidth=3, label="Line of best fit")
+        self.summary = self.axes.annotate(
+            "", xy=(0.05, 0.85), xycoords="axes fraction")
+        self.axes.legend(loc="lower right")
+        self.slope_bounds = (lower_bound, upper_bound)
+
+    def update(self, job: Dict[str, Any]):
+        """Draw the biplot of one job."""
+        real, simulated = job["real"], job["simulated"]
+        max_val = max(np.max(real, initial=0.0), np.max(simulated, initial=0.0),
+                      1.0)
+        self.scatter.set_offsets(np.column_stack([real, simulated]))
+        self.identity_line.set_data([0, max_val], [0, max_val])
+        self.lower_bound_line.set_data(
+            [0, max_val], [0, self.slope_bounds[0] * max_val])
+        self.upper_bound_line.set_data(
+            [0, max_val], [0, self.slope_bounds[1] * max_val])
+        self.fit_line.set_data(
+            [0, max_val],
+            [job["intercept"], job["slope"] * max_val + job["intercept"]])
+        self.summary.set_text(
+            f"R^2 = {round(job['r_sq'], 4)} \n\nSlope = "
+            f"{round(job['slope'], 4)} \nIntercept = "
+            f"{round(job['intercept'], 4)}")
+        self.axes.set_title(job["title"])
+        self.axes.set_xlim(0, 1.05 * max_val)
+        self.axes.set_ylim(0, 1.05 * max_val)
+
+
+class _TimeSeriesTemplate:
+    """Figure of one or two time series over the time intervals, whose artists
+    are created once and updated for every plot."""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.time_labels = settings["time_labels"]
+        self.figure = Figure(figsize=(15, 5))
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel("Time")
+        x = np.arange(len(self.time_labels))
+        self.axes.set_xticks(x)
+        self.axes.set_xticklabels(self.time_labels, rotation=70)
+        self.lines = [self.axes.plot(x, np.full(len(x), np.nan), color=color)[0]
+                      for color in ["blue", "red"]]
+        self.bound_lines = [
+            self.axes.plot(x, np.full(len(x), np.nan), color="green",
+                           linestyle="--")[0] for _ in range(2)]
+        self.figure.subplots_adjust(bottom=0.25)
+
+    def update(self, job: Dict[str, Any]):
+        """Draw the time series of one job."""
+        nan = np.full(len(self.time_labels), np.nan)
+        for line, (label, values) in zip(
+                self.lines, list(job["series"].items()) + [(None, nan)] * 2):
+            line.set_ydata(values)
+            line.set_label(label if label is not None else "_nolegend_")
+        bounds = job.get("bounds") or (np.nan, np.nan)
+        for line, bound in zip(self.bound_lines, bounds):
+            line.set_ydata(np.full(len(self.time_labels), bound))
+        self.axes.set_title(job["title"])
+        self.axes.set_ylabel(job["ylabel"])
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.axes.legend(loc="lower right")
+
+
+_PLOT_TEMPLATES = {"biplot": _BiplotTemplate, "time_series": _TimeSeriesTemplate}
+
+
+def _render_plot_jobs(
+    template_name: str, settings: Dict[str, Any], jobs: List[Dict[str, Any]],
+    formats: Sequence[str]
+) -> List[str]:
+    """Render plots sharing the same figure template. Runs inside the worker
+    processes of render_flow_plots().
+
+    Args:
+        template_name: Key of the figure template in _PLOT_TEMPLATES.
+        settings: Settings of the template.
+        jobs: Data of each plot, with the path of its file without extension.
+        formats: Formats each plot is saved in.
+    Returns:
+        paths: Paths of the files written.
+    """
+    template = _PLOT_TEMPLATES[template_name](settings)
+    paths = []
+    try:
+        for job in jobs:
+            template.update(job)
+            for plot_format in formats:
+                path = f"{job['path']}.{plot_format}"
+                template.figure.savefig(path, format=plot_format)
+                paths.append(path)
+    finally:
+        # Release the figure and its renderer before the next batch.
+        template.figure.clear()
+    return paths
+
+
+def __get_filename(name: str) -> str:
+    """Replace the characters of a name that are not safe in filenames. A
+    short hash of the name is appended when characters are replaced, so that
+    different names never share a filename."""
+    filename = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+    if filename == name:
+        return filename
+    return f"{filename}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+def render_flow_plots(
+    flow_comparison: FlowComparison, output_directory: str,
+    metric_name: str = "Flow", metric_units: str = "veh/h",
+    enforce_intercept: bool = True,
+    slope_bounds: Tuple[float, float] = DEFAULT_SLOPE_BOUNDS,
+    detector_external_ids: Sequence[ExternalId] = None,
+    formats: Sequence[str] = PLOT_FORMATS[:1], max_workers: int = 1
+) -> str:
+    """Render the biplots, flow profiles and regression time series of a
+    scenario to files, with an HTML index linking them.
+
+    Rendering is headless: figures are drawn by the Agg canvas without pyplot,
+    and each worker reuses one figure per kind of plot, updating its artists
+    instead of rebuilding it. The plots are split between worker processes.
+
+    Args:
+        flow_comparison: Real and simulated flow of the scenario.
+        output_directory: Directory where the plots and the index are written.
+        metric_name: Name of the compared metric, used in titles and labels.
+        metric_units: Units of the compared metric.
+        enforce_intercept: Whether the intercept of the regressions should be
+            set to 0.
+        slope_bounds: Lower and upper bounds of an acceptable slope.
+        detector_external_ids: Detectors to draw a flow profile of. If None,
+            all detectors of flow_comparison are used.
+        formats: Formats each plot is saved in, among PLOT_FORMATS. The index
+            links the plots in the first format.
+        max_workers: Number of worker processes. 1 renders all plots in the
+            calling process.
+    Returns:
+        index_path: Path of the HTML index.
+    Raises:
+        ValueError: If formats is empty or holds an unknown format, or if
+            max_workers is lower than 1.
+    """
+    if not formats:
+        raise ValueError(
+            f"At least one format is needed. Available formats: "
+            f"{list(PLOT_FORMATS)}.")
+    unknown_formats = set(formats) - set(PLOT_FORMATS)
+    if unknown_formats:
+        raise ValueError(
+            f"Unknown formats {sorted(unknown_formats)}. Available formats: "
+            f"{list(PLOT_FORMATS)}.")
+    if max_workers < 1:
+        raise ValueError(
+            f"max_workers must be at least 1, got {max_workers}.")
+    time_labels = [time.strftime("%H:%M") for time in flow_comparison.times]
+    slope, intercept, r_sq, _ = get_batched_linear_regression(
+        flow_comparison.real_flow, flow_comparison.simulated_flow,
+        enforce_intercept)
+    slope, intercept, r_sq = slope[0], intercept[0], r_sq[0]
+    sections = {}
+
+    # One biplot per time interval, then all time intervals pooled.
+    directory = os.path.join(output_directory, "biplots")
+    jobs = []
+    for i, time_label in enumerate(time_labels + [None]):
+        times = None if time_label is None else [flow_comparison.times[i]]
+        real, simulated = flow_comparison.select(times)
+        jobs.append({
+            "path": os.path.join(directory, "biplot_" + (
+                "all" if time_label is None else time_label.replace(":", ""))),
+            "title": f"Linear regression plot for {metric_name} across all "
+                     "timesteps" if time_label is None
+                     else f"Linear regression plot for {time_label}",
+            "real": real.reshape(-1), "simulated": simulated.reshape(-1),
+            "slope": slope[i], "intercept": intercept[i], "r_sq": r_sq[i],
+        })
+    sections["Biplots"] = ("biplot", directory, jobs)
+
+    detector_index = {detector_external_id: i for i, detector_external_id
+                      in enumerate(flow_comparison.detector_external_ids)}
+    if detector_external_ids is None:
+        detector_external_ids = list(detector_index)
+    # Each detector is plotted once, even if it is listed several times.
+    detector_external_ids = list(dict.fromkeys(detector_external_ids))
+    directory = os.path.join(output_directory, "flow-profiles")
+    sections["Flow profiles"] = ("time_series", directory, [{
+        "path": os.path.join(directory, __get_filename(detector_external_id)),
+        "title": f"real vs simulated {metric_name} time-series for "
+                 f"{detector_external_id}",
+        "ylabel": f"{metric_name} ({metric_units})",
+        "series": {
+            "Real": flow_comparison.real_flow[
+                detector_index[detector_external_id]],
+            "Simulated": flow_comparison.simulated_flow[
+                detector_index[detector_external_id]]},
+    } for detector_external_id in detector_external_ids])
+
+    directory = os.path.join(output_directory, "regression-time-series")
+    sections["Regression time series"] = ("time_series", directory, [{
+        "path": os.path.join(directory, name),
+        "title": f"{label} of linear regression for {metric_name} at each "
+                 "timestep",
+        "ylabel": label,
+        "series": {label: values[:-1]},
+        "bounds": bounds,
+    } for name, label, values, bounds in [
+        ("slope", "Slope", slope, slope_bounds),
+        ("r_sq", "R^2", r_sq, None),
+        ("intercept", "Intercept", intercept, None),
+    ]])
+
+    settings = {"metric_name": metric_name, "metric_units": metric_units,
+                "slope_bounds": tuple(slope_bounds),
+                "time_labels": time_labels}
+    batches = []
+    for template_name, directory, jobs in sections.values():
+        os.makedirs(directory, exist_ok=True)
+        # Split the plots of each kind evenly between the workers.
+        for indices in np.array_split(np.arange(len(jobs)), max_workers):
+            if len(indices):
+                batches.append((template_name, settings,
+                                [jobs[i] for i in indices], list(formats)))
+    if max_workers == 1:
+        for batch in batches:
+            _render_plot_jobs(*batch)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            for future in [executor.submit(_render_plot_jobs, *batch)
+                           for batch in batches]:
+                future.result()
+
+    # The index links the first format of every plot.
+    lines = ["<!DOCTYPE html>", "<html>", "<head>", '<meta charset="utf-8">',
+             f"<title>{html.escape(metric_name)} plots</title>", "</head>",
+             "<body>"]
+    for section_name, (_, _, jobs) in sections.items():
+        lines.append(f"<h2>{html.escape(section_name)}</h2>")
+        for job in jobs:
+            source = os.path.relpath(f"{job['path']}.{formats[0]}",
+                                     output_directory)
+            lines.append(
+                f'<figure><img src="{html.escape(source)}" '
+                f'alt="{html.escape(job["title"])}" loading="lazy">'
+                f"<figcaption>{html.escape(job['title'])}</figcaption>"
+                "</figure>")
+    lines += ["</body>", "</html>"]
+    index_path = os.path.join(output_directory, PLOT_INDEX_FILENAME)
+    with open(index_path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return index_path
+
+
 # Add more methods as needed.
@@ -4,14 +4,20 @@ import datetime
 import numpy as np
 import os
 import sys
+import tempfile
 import unittest
 
 from utils.aimsun_input_utils import FlowRealData, AimsunFlowRealDataSet
 from calibration.postprocessing_plot_util import (
+    FlowComparison,
     convert_flow_per_time_to_list,
+    get_batched_linear_regression,
     get_linear_regression,
+    get_real_flow_array,
     process_real_flow_data,
+    render_flow_plots,
 )
+from calibration.time_grid_util import TimeGrid
 
 TIME_LIST = [datetime.time(1, 1), datetime.time(17, 49), datetime.time(19, 45)]
 REAL_DETECTOR_EXTERNAL_ID_LIST = [
@@ -165,6 +171,281 @@ class TestAllMethods(unittest.TestCase):
             list(real_flow_per_detector.keys()) == AIMSUN_DETECTOR_EXTERNAL_ID_LIST
         )
 
+    def test_process_real_flow_data_values(self):
+        """Verify the flow values of process_real_flow_data() and
+        get_real_flow_array(), including detectors with missing data."""
+        flow_real_dataset = _create_flow_real_dataset()
+        (
+            real_flow_per_time,
+            real_flow_per_detector,
+            detector_external_id_list,
+        ) = process_real_flow_data(flow_real_dataset, TIME_LIST[:1])
+        self.assertEqual(detector_external_id_list,
+                         AIMSUN_DETECTOR_EXTERNAL_ID_LIST)
+        self.assertEqual(real_flow_per_time, {TIME_LIST[0]: {
+            detector_external_id: 4 * 10 * i
+            for i, detector_external_id in enumerate(
+                AIMSUN_DETECTOR_EXTERNAL_ID_LIST)}})
+        # Only flow of times between the first and last time is kept.
+        self.assertEqual(real_flow_per_detector[
+            AIMSUN_DETECTOR_EXTERNAL_ID_LIST[1]], {})
+        _, real_flow_per_detector, _ = process_real_flow_data(
+            flow_real_dataset, TIME_LIST)
+        self.assertEqual(
+            real_flow_per_detector[AIMSUN_DETECTOR_EXTERNAL_ID_LIST[1]],
+            {datetime.time(1, 16): 40, datetime.time(18, 4): 44})
+
+        flow_real_dataset.flow_data_set[-1].flow_data.pop(
+            _get_time_key(TIME_LIST[1]))
+        with self.assertRaises(KeyError):
+            process_real_flow_data(flow_real_dataset, TIME_LIST)
+        real_flow, detector_external_id_list = get_real_flow_array(
+            flow_real_dataset, TIME_LIST)
+        self.assertEqual(detector_external_id_list,
+                         AIMSUN_DETECTOR_EXTERNAL_ID_LIST)
+        self.assertEqual(real_flow.shape, (4, 3))
+        self.assertEqual(real_flow[1].tolist(), [40.0, 44.0, 48.0])
+        self.assertTrue(np.isnan(real_flow[3, 1]))
+
+    def test_real_flow_time_grid(self):
+        """Verify that real flow is keyed and scaled with the length of the
+        time intervals of the time grid."""
+        time_grid = TimeGrid(0, 1800, 48)
+        flow_real_dataset = _create_flow_real_dataset()
+        for flow_real_data in flow_real_dataset.flow_data_set:
+            flow_real_data.flow_data = {
+                time_key + datetime.timedelta(minutes=15): flow
+                for time_key, flow in flow_real_data.flow_data.items()}
+        real_flow_per_time, _, _ = process_real_flow_data(
+            flow_real_dataset, TIME_LIST, time_grid)
+        self.assertEqual(
+            real_flow_per_time[TIME_LIST[1]][
+                AIMSUN_DETECTOR_EXTERNAL_ID_LIST[2]], 2 * 21)
+        real_flow, _ = get_real_flow_array(flow_real_dataset, TIME_LIST,
+                                           time_grid)
+        self.assertEqual(real_flow[2].tolist(), [40.0, 42.0, 44.0])
+
+    def test_get_batched_linear_regression(self):
+        """Verify that the batched regression matches get_linear_regression()
+        for every time interval, group of detectors and the pooled case."""
+        random = np.random.default_rng(0)
+        real_flow = random.uniform(100, 1000, (20, 4))
+        simulated_flow = 1.1 * real_flow + random.normal(30, 50, (20, 4))
+        real_flow[3, 1] = np.nan
+        valid_mask = np.ones(real_flow.shape, dtype=bool)
+        valid_mask[5, 2] = False
+        detector_masks = np.array([np.arange(20) < 12, np.arange(20) >= 8])
+        for enforce_intercept in [False, True]:
+            slope, intercept, r_sq, count = get_batched_linear_regression(
+                real_flow, simulated_flow, enforce_intercept, detector_masks,
+                valid_mask)
+            self.assertEqual(slope.shape, (2, 5))
+            for group, detector_mask in enumerate(detector_masks):
+                for interval in range(5):
+                    valid = valid_mask & ~np.isnan(real_flow) \
+                        & detector_mask[:, np.newaxis]
+                    if interval < 4:
+                        valid[:, np.arange(4) != interval] = False
+                    expected = get_linear_regression(
+                        real_flow[valid].reshape(-1, 1),
+                        simulated_flow[valid].reshape(-1, 1),
+                        enforce_intercept)
+                    self.assertEqual(count[group, interval], valid.sum())
+                    self.assertAlmostEqual(slope[group, interval],
+                                           expected[0])
+                    self.assertAlmostEqual(abs(intercept[group, interval]),
+                                           expected[1])
+                    self.assertAlmostEqual(r_sq[group, interval],
+                                           expected[2])
+
+        # Without groups, all detectors are used.
+        slope, _, r_sq, count = get_batched_linear_regression(
+            real_flow[:, :1], 2 * real_flow[:, :1], False)
+        np.testing.assert_allclose(slope, [[2.0, 2.0]])
+        np.testing.assert_allclose(r_sq, [[1.0, 1.0]])
+        self.assertEqual(count.tolist(), [[20, 20]])
+
+
+def _get_time_key(time):
+    """Key of the real flow data of the time interval starting at time."""
+    return datetime.timedelta(hours=time.hour, minutes=(time.minute + 15))
+
+
+def _create_flow_real_dataset():
+    """Create real flow data of all detectors at all times of TIME_LIST, with
+    flow 10 * detector index + time index."""
+    flow_real_dataset = AimsunFlowRealDataSet()
+    flow_real_dataset.flow_data_set = []
+    for i, detector_external_id in enumerate(REAL_DETECTOR_EXTERNAL_ID_LIST):
+        flow_real_data_obj = FlowRealData()
+        flow_real_data_obj.external_id = detector_external_id
+        flow_real_data_obj.flow_data = {
+            _get_time_key(time): 10 * i + j for j, time in enumerate(TIME_LIST)}
+        flow_real_dataset.flow_data_set.append(flow_real_data_obj)
+    return flow_real_dataset
+
+
+class TestFlowComparison(unittest.TestCase):
+    """Test the index-aligned real and simulated flow."""
+
+    def setUp(self):
+        # Real flow is 10 * time index + detector index, simulated flow is
+        # twice the real flow. The last detector has no data at the last time.
+        self.real_flow_per_time, self.simulated_flow_per_time = {}, {}
+        for j, time in enumerate(TIME_LIST):
+            self.real_flow_per_time[time] = {
+                detector_external_id: 10.0 * j + i
+                for i, detector_external_id in enumerate(
+                    REAL_DETECTOR_EXTERNAL_ID_LIST)
+                if j < len(TIME_LIST) - 1 or i < 3}
+            self.simulated_flow_per_time[time] = {
+                detector_external_id: 2 * flow for detector_external_id, flow
+                in self.real_flow_per_time[time].items()}
+        self.flow_comparison = FlowComparison.from_flow_per_time(
+            self.real_flow_per_time, self.simulated_flow_per_time, TIME_LIST)
+
+    def test_arrays(self):
+        """Test that the arrays are aligned on detectors and times."""
+        self.assertEqual(list(self.flow_comparison.detector_external_ids),
+                         REAL_DETECTOR_EXTERNAL_ID_LIST)
+        self.assertEqual(self.flow_comparison.real_flow.shape, (4, 3))
+        self.assertEqual(self.flow_comparison.real_flow[1, 2], 21.0)
+        self.assertTrue(np.isnan(self.flow_comparison.real_flow[3, 2]))
+        np.testing.assert_array_equal(self.flow_comparison.simulated_flow,
+                                      2 * self.flow_comparison.real_flow)
+
+    def test_select(self):
+        """Test the selection of times and groups of detectors."""
+        real_flow_list, simulated_flow_list = self.flow_comparison.select(
+            TIME_LIST[2:0:-1])
+        self.assertEqual(real_flow_list.reshape(-1).tolist(),
+                         [20.0, 21.0, 22.0, 10.0, 11.0, 12.0, 13.0])
+        np.testing.assert_array_equal(simulated_flow_list,
+                                      2 * real_flow_list)
+
+        city_mask = self.flow_comparison.get_group_mask("2019")
+        self.assertEqual(city_mask.tolist(), [True, True, False, False])
+        self.assertIs(self.flow_comparison.get_group_mask("2019"), city_mask)
+        real_flow_list, _ = self.flow_comparison.select(
+            detector_mask=~city_mask)
+        self.assertEqual(real_flow_list.reshape(-1).tolist(),
+                         [2.0, 3.0, 12.0, 13.0, 22.0])
+
+    def test_convert_flow_per_time_to_list_order(self):
+        """Test that convert_flow_per_time_to_list() keeps the order of the
+        detectors in each per-time dictionary, as it did before
+        FlowComparison."""
+        self.real_flow_per_time[TIME_LIST[1]] = dict(
+            reversed(self.real_flow_per_time[TIME_LIST[1]].items()))
+        for time_list, city_common_id, expected in [
+                (TIME_LIST, None, [[0.0, 1.0, 2.0, 3.0, 13.0, 12.0, 11.0, 10.0,
+                                    20.0, 21.0, 22.0]]),
+                (TIME_LIST, "2019", [[0.0, 1.0, 11.0, 10.0, 20.0, 21.0],
+                                     [2.0, 3.0, 13.0, 12.0, 22.0]]),
+                (TIME_LIST[2:0:-1], None, [[20.0, 21.0, 22.0, 13.0, 12.0,
+                                            11.0, 10.0]]),
+                (TIME_LIST[:1], "2019", [[0.0, 1.0], [2.0, 3.0]])]:
+            flow_lists = convert_flow_per_time_to_list(
+                self.real_flow_per_time, self.simulated_flow_per_time,
+                time_list, city_common_id)
+            self.assertEqual(len(flow_lists), 2 * len(expected))
+            for i, expected_real_flow_list in enumerate(expected):
+                real_flow_list, simulated_flow_list = \
+                    flow_lists[2 * i:2 * i + 2]
+                self.assertEqual(real_flow_list.shape,
+                                 (len(expected_real_flow_list), 1))
+                self.assertEqual(real_flow_list.reshape(-1).tolist(),
+                                 expected_real_flow_list)
+                np.testing.assert_array_equal(simulated_flow_list,
+                                              2 * real_flow_list)
+
+    def test_missing_simulated_flow(self):
+        """Test that real flow without simulated flow is reported."""
+        del self.simulated_flow_per_time[TIME_LIST[0]][
+            REAL_DETECTOR_EXTERNAL_ID_LIST[0]]
+        with self.assertRaises(KeyError):
+            FlowComparison.from_flow_per_time(
+                self.real_flow_per_time, self.simulated_flow_per_time,
+                TIME_LIST)
+
+
+class TestRenderFlowPlots(unittest.TestCase):
+    """Test the headless rendering of the flow plots of a scenario."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        random = np.random.default_rng(0)
+        real_flow = random.uniform(100, 1000, (4, 3))
+        real_flow[3, 2] = np.nan
+        self.flow_comparison = FlowComparison(
+            REAL_DETECTOR_EXTERNAL_ID_LIST, TIME_LIST, real_flow,
+            1.1 * real_flow)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def __assert_plots(self, output_directory, formats):
+        index_path = render_flow_plots(
+            self.flow_comparison, output_directory, formats=formats,
+            max_workers=len(formats))
+        self.assertEqual(index_path,
+                         os.path.join(output_directory, "index.html"))
+        with open(index_path) as file:
+            index = file.read()
+        paths = [os.path.join("biplots", f"biplot_{name}")
+                 for name in ["0101", "1749", "1945", "all"]]
+        paths += [os.path.join("flow-profiles", detector_external_id)
+                  for detector_external_id in REAL_DETECTOR_EXTERNAL_ID_LIST]
+        paths += [os.path.join("regression-time-series", name)
+                  for name in ["slope", "r_sq", "intercept"]]
+        for path in paths:
+            self.assertIn(f'src="{path}.{formats[0]}"', index)
+            for plot_format in formats:
+                self.assertGreater(os.path.getsize(os.path.join(
+                    output_directory, f"{path}.{plot_format}")), 0)
+
+    def test_render_flow_plots(self):
+        """Test that every plot is written and linked by the index."""
+        self.__assert_plots(os.path.join(self.directory.name, "serial"),
+                            ["png"])
+
+    def test_render_flow_plots_parallel(self):
+        """Test rendering with worker processes and several formats."""
+        self.__assert_plots(os.path.join(self.directory.name, "parallel"),
+                            ["svg", "png"])
+
+    def test_fail_invalid_arguments(self):
+        """Test that unknown or missing formats and invalid numbers of workers
+        are rejected before any plot is rendered."""
+        for kwargs in [{"formats": ["jpg"]}, {"formats": []},
+                       {"max_workers": 0}, {"max_workers": -1}]:
+            with self.subTest(**kwargs):
+                with self.assertRaises(ValueError):
+                    render_flow_plots(self.flow_comparison,
+                                      self.directory.name, **kwargs)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_unique_filenames(self):
+        """Test that detectors whose names only differ by characters that are
+        not safe in filenames get different flow profiles."""
+        detector_external_ids = ["detector 1", "detector/1", "detector_1"]
+        flow_comparison = FlowComparison(
+            detector_external_ids, TIME_LIST,
+            self.flow_comparison.real_flow[:3],
+            self.flow_comparison.simulated_flow[:3])
+        index_path = render_flow_plots(
+            flow_comparison, self.directory.name,
+            detector_external_ids=detector_external_ids + ["detector 1"])
+        with open(index_path) as file:
+            index = file.read()
+        filenames = os.listdir(
+            os.path.join(self.directory.name, "flow-profiles"))
+        self.assertEqual(len(filenames), 3)
+        self.assertIn("detector_1.png", filenames)
+        for filename in filenames:
+            self.assertEqual(index.count(
+                f'src="{os.path.join("flow-profiles", filename)}"'), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -3,15 +3,50 @@
 from __future__ import annotations
 import utils.aimsun_input_utils
 
+import contextlib
 import datetime
 import enum
+import functools
 import os
+import queue
 import sqlite3
 import sys
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import stats
+
+from calibration.time_grid_util import TimeGrid
 
 ALL_VEHICLE_TYPES = 0
 ALL_TIME_AGGREGATED = 0
+# Maximum number of parameters bound to one query: the default limit of SQLite
+# builds older than 3.32.
+MAX_QUERY_PARAMETERS = 999
+STATEMENT_CACHE_SIZE = 256
+DEFAULT_BATCH_SIZE = 65536
+# Edges in seconds of the histogram bins of trip travel and delay times.
+DEFAULT_TRIP_TIME_BIN_EDGES = tuple(range(0, 3600 + 60, 60))
+
+# Settings of the read-only connections of SQLiteConnectionPool.
+DEFAULT_POOL_SIZE = 4
+DEFAULT_MMAP_SIZE_BYTES = 1 << 30
+DEFAULT_CACHE_SIZE_KIB = 1 << 16
+
+# Columns of the indexes built by AimsunOutputDatabase.ensure_indexes() for
+# each output table. Each index starts with the columns the getters filter on
+# by equality and ends with the replication ID, so that grouped queries over
+# (object, time interval) can be answered from the index alone.
+OUTPUT_TABLE_INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "MASECT": [("sid", "oid", "ent"), ("sid", "eid", "ent")],
+    "MADET": [("sid", "eid", "ent"), ("sid", "oid", "ent")],
+    "MISECT": [("sid", "oid", "ent", "did"), ("sid", "eid", "ent", "did")],
+    "MIDETEC": [("sid", "eid", "ent", "did"), ("sid", "oid", "ent", "did")],
+    "MISYS": [("sid", "ent", "did")],
+    "RGap": [("sid", "ent", "did")],
+}
 
 
 class SimInfoColumns(enum.Enum):
@@ -107,18 +142,39 @@ class MiSysColumns(enum.Enum):
     each road section at each time interval.
 
     Attributes:
+        REPLICATION_INTERNAL_ID: Experiment replication identification number.
+        VEHICLE_TYPE: Integer identifer for type of vehicles included in the
+            data. 0 for all vehicles, 1 for cars only, and 2 for trucks only.
         TIME_INTERVAL: Index of the time interval of when the data was collected
             from. 0 corresponds to all time intervals aggregated.
         FLOW: Number of vehicles in the entire network at a certain time
             interval. Units are vehicles per hour.
         DELAY_TIME: Delay time in the entire network at a certain time
             interval. Units are in seconds.
+        DENSITY: Density of the entire network at a certain time interval.
+            Units are vehicles per kilometer.
+        TRAVEL_TIME: Average travel time in the entire network at a certain
+            time interval. Units are in seconds.
+        SPEED: Average speed in the entire network at a certain time interval.
+        FUEL_CONSUMPTION: Fuel consumed in the entire network at a certain
+            time interval.
+        BATTERY_CONSUMPTION: Battery consumed in the entire network at a
+            certain time interval.
+        TRAVEL_DISTANCE: Total distance travelled in the entire network at a
+            certain time interval.
     """
 
+    REPLICATION_INTERNAL_ID = "did"
     VEHICLE_TYPE = "sid"
     TIME_INTERVAL = "ent"
     FLOW = "flow"
     DELAY_TIME = "dtime"
+    DENSITY = "density"
+    TRAVEL_TIME = "ttime"
+    SPEED = "speed"
+    FUEL_CONSUMPTION = "fuelc"
+    BATTERY_CONSUMPTION = "batteryc"
+    TRAVEL_DISTANCE = "travel"
     # Add more columns as needed.
 
 
@@ -137,8 +193,16 @@ class MiSectColumns(enum.Enum):
             data. 0 for all vehicles, 1 for cars only, and 2 for trucks only.
         TIME_INTERVAL: Index of the time interval of when the data was collected
             from. 0 corresponds to all time intervals aggregated.
+        MEAN_FLOW: Number of vehicles through the specified road section at
+            a certain time interval. Units are vehicles per hour.
         MEAN_SPEED: Average speed through the specified road section at a
             certain time interval.
+        MEAN_TRAVEL_TIME: Average travel time through the specified road
+            section at a certain time interval. Units are in seconds.
+        MEAN_DELAY_TIME: Average delay time through the specified road
+            section at a certain time interval. Units are in seconds.
+        DENSITY: Density of the specified road section at a certain time
+            interval. Units are vehicles per kilometer.
     """
 
     REPLICATION_INTERNAL_ID = "did"
@@ -146,7 +210,11 @@ class MiSectColumns(enum.Enum):
     SECTION_EXTERNAL_ID = "eid"
     VEHICLE_TYPE = "sid"
     TIME_INTERVAL = "ent"
+    MEAN_FLOW = "flow"
     MEAN_SPEED = "speed"
+    MEAN_TRAVEL_TIME = "ttime"
+    MEAN_DELAY_TIME = "dtime"
+    DENSITY = "density"
     # Add more columns as needed.
 
 
@@ -168,6 +236,12 @@ class MiDetColumns(enum.Enum):
             time interval. Units are vehicles per time interval length.
         FLOW: Number of vehicles through the specified detector at a certain
             time interval. Units are vehicles per hour.
+        SPEED: Average speed of the vehicles through the specified detector at
+            a certain time interval.
+        OCCUPANCY: Percentage of time the specified detector was occupied at a
+            certain time interval.
+        DENSITY: Density measured by the specified detector at a certain time
+            interval.
     """
 
     REPLICATION_INTERNAL_ID = "did"
@@ -177,6 +251,9 @@ class MiDetColumns(enum.Enum):
     TIME_INTERVAL = "ent"
     COUNT = "countveh"
     FLOW = "flow"
+    SPEED = "speed"
+    OCCUPANCY = "occupancy"
+    DENSITY = "density"
     # Add more columns as needed.
 
 
@@ -212,8 +289,11 @@ class MicentOriginColumns(enum.Enum):
     destination centroid pairs.
 
     Attributes:
+        REPLICATION_INTERNAL_ID: Experiment replication identification number.
         ORIGIN_CENTROID_INTERNAL_ID: Internal ID of the origin centroid.
         ORIGIN_CENTROID_EXTERNAL_ID: External ID of the origin centroid.
+        NUM_VEHICLES: Number of vehicles that left the origin centroid towards
+            the destination centroid.
         VEHICLE_TYPE: Integer identifer for type of vehicles included in the
             data. 0 for all vehicles, 1 for cars only, and 2 for trucks only.
         DEST_CENTROID_INTERNAL_ID: Internal ID of the destination centroid.
@@ -225,6 +305,7 @@ class MicentOriginColumns(enum.Enum):
             origin and destination centroids in kilometers.
     """
 
+    REPLICATION_INTERNAL_ID = "did"
     ORIGIN_CENTROID_INTERNAL_ID = "oid"
     ORIGIN_CENTROID_EXTERNAL_ID = "eid"
     NUM_VEHICLES = "nbveh"
@@ -237,17 +318,20 @@ class MicentOriginColumns(enum.Enum):
 
 
 class MicentDestinationColumns(enum.Enum):
-    """Column names of the MICENT_D (Micro Centroid Destination) table. This table
-    contains statistical information about the origin centroids for each time
-    interval. Mainly used to compute travel times between various origin
-    destination centroid pairs.
+    """Column names of the MICENT_D (Micro Centroid Destination) table. This
+    table contains statistical information about the destination centroids
+    for each time interval. Each row describes the vehicles that arrived at a
+    destination centroid from an origin centroid.
 
     Attributes:
-        ORIGIN_CENTROID_INTERNAL_ID: Internal ID of the origin centroid.
-        ORIGIN_CENTROID_EXTERNAL_ID: External ID of the origin centroid.
+        REPLICATION_INTERNAL_ID: Experiment replication identification number.
+        DEST_CENTROID_INTERNAL_ID: Internal ID of the destination centroid.
+        DEST_CENTROID_EXTERNAL_ID: External ID of the destination centroid.
+        NUM_VEHICLES: Number of vehicles that arrived at the destination
+            centroid from the origin centroid.
         VEHICLE_TYPE: Integer identifer for type of vehicles included in the
             data. 0 for all vehicles, 1 for cars only, and 2 for trucks only.
-        DEST_CENTROID_INTERNAL_ID: Internal ID of the destination centroid.
+        ORIGIN_CENTROID_INTERNAL_ID: Internal ID of the origin centroid.
         TIME_INTERVAL: Index of the time interval of when the data was collected
             from. 0 corresponds to all time intervals aggregated.
         TRAVEL_TIME: Average travel time for all vehicles between the specified
@@ -256,35 +340,245 @@ class MicentDestinationColumns(enum.Enum):
             origin and destination centroids in kilometers.
     """
 
-    ORIGIN_CENTROID_INTERNAL_ID = "oid"
-    ORIGIN_CENTROID_EXTERNAL_ID = "eid"
+    REPLICATION_INTERNAL_ID = "did"
+    DEST_CENTROID_INTERNAL_ID = "oid"
+    DEST_CENTROID_EXTERNAL_ID = "eid"
     NUM_VEHICLES = "nbveh"
     VEHICLE_TYPE = "sid"
-    DEST_CENTROID_INTERNAL_ID = "destination"
+    ORIGIN_CENTROID_INTERNAL_ID = "origin"
     TIME_INTERVAL = "ent"
     TRAVEL_TIME = "ttime"
     DISTANCE = "travel"
     # Add more columns as needed.
 
 
+class MiVehTrajectoryColumns(enum.Enum):
+    """Column names of the MIVEHTRAJECTORY (Micro Vehicle Trajectories) table.
+    This table contains one row per vehicle and replication when trajectory
+    statistics are saved, with the origin and destination centroids of the
+    trip and its entrance and exit times in the network.
+
+    Attributes:
+        REPLICATION_INTERNAL_ID: Experiment replication identification number.
+        VEHICLE_INTERNAL_ID: Internal ID of the vehicle.
+        VEHICLE_TYPE: Integer identifer for the type of the vehicle.
+        ORIGIN_CENTROID_INTERNAL_ID: Internal ID of the origin centroid.
+        DEST_CENTROID_INTERNAL_ID: Internal ID of the destination centroid.
+        ENTRANCE_TIME: Time in seconds since midnight of when the vehicle
+            entered the network.
+        EXIT_TIME: Time in seconds since midnight of when the vehicle exited
+            the network. Negative if the vehicle did not exit.
+        TRAVEL_TIME: Travel time of the whole trip in seconds.
+        DELAY_TIME: Delay time of the whole trip in seconds.
+    """
+
+    REPLICATION_INTERNAL_ID = "did"
+    VEHICLE_INTERNAL_ID = "oid"
+    VEHICLE_TYPE = "sid"
+    ORIGIN_CENTROID_INTERNAL_ID = "origin"
+    DEST_CENTROID_INTERNAL_ID = "destination"
+    ENTRANCE_TIME = "entranceTime"
+    EXIT_TIME = "exitTime"
+    TRAVEL_TIME = "travelTime"
+    DELAY_TIME = "delayTime"
+    # Add more columns as needed.
+
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of read-only connections to one SQLite file.
+
+    Each connection is opened with a `mode=ro` URI (and `immutable=1` if
+    requested) and tuned for analytical reads: memory-mapped I/O, a large page
+    cache, in-memory temporary storage and `query_only`. Threads borrow a
+    connection for the duration of one query, so several threads can query the
+    same database in parallel.
+
+    Attributes:
+        database_path: Path to the SQLite file.
+        size: Maximum number of connections opened at the same time.
+        immutable: Whether the file is opened with `immutable=1`, which skips
+            all locking. Only safe if the file is not modified while open.
+        mmap_size: Maximum number of bytes of the file to memory map.
+        cache_size_kib: Size of the page cache of each connection in KiB.
+    """
+
+    database_path: str
+    size: int
+    immutable: bool
+    mmap_size: int
+    cache_size_kib: int
+
+    def __init__(
+        self, database_path: str, size: int = DEFAULT_POOL_SIZE,
+        immutable: bool = False, mmap_size: int = DEFAULT_MMAP_SIZE_BYTES,
+        cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB
+    ):
+        if not os.path.exists(database_path):
+            raise FileNotFoundError(
+                f"The given filepath {database_path} does not exist.")
+        self.database_path = database_path
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.__idle_connections = queue.LifoQueue()
+        self.__all_connections = []
+        self.__lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool. A new connection is opened if
+        all connections are in use and the pool is not full, otherwise this
+        waits for a connection to be returned.
+
+        Yields:
+            connection: Read-only SQL connection to the file.
+        """
+        try:
+            connection = self.__idle_connections.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                can_open = len(self.__all_connections) < self.size
+                if can_open:
+                    connection = self.__open_connection()
+                    self.__all_connections.append(connection)
+            if not can_open:
+                connection = self.__idle_connections.get()
+        try:
+            yield connection
+        finally:
+            self.__idle_connections.put(connection)
+
+    def close(self):
+        """Close all connections of the pool."""
+        with self.__lock:
+            for connection in self.__all_connections:
+                connection.close()
+            self.__all_connections = []
+            self.__idle_connections = queue.LifoQueue()
+
+    def __open_connection(self) -> sqlite3.Connection:
+        """Open one read-only connection with the tuned pragmas."""
+        uri = f"file:{os.path.abspath(self.database_path)}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        connection = sqlite3.connect(
+            uri, uri=True, check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE)
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        connection.execute("PRAGMA query_only = ON")
+        return connection
+
+
+def _acquire_connection(
+    database: Union[sqlite3.Connection, SQLiteConnectionPool]
+) -> contextlib.AbstractContextManager:
+    """Get a context manager that yields a connection to the database, from
+    the pool if the database is a SQLiteConnectionPool."""
+    if isinstance(database, SQLiteConnectionPool):
+        return database.connection()
+    return contextlib.nullcontext(database)
+
+
+class FetchMode(enum.Enum):
+    """Number of result rows returned by a query on a SQLiteTable.
+
+    Attributes:
+        ALL: Return all rows, like sqlite3.Cursor.fetchall().
+        ONE: Return the first row only, like sqlite3.Cursor.fetchone().
+        MANY: Return up to a given number of rows, like
+            sqlite3.Cursor.fetchmany().
+    """
+
+    ALL = "all"
+    ONE = "one"
+    MANY = "many"
+
+
 class SQLiteTable:
     """Data class for one SQL table from Aimsun Micro/Macrosimulation output.
 
+    Queries use bound parameters so that SQLite can compare integer IDs with
+    integer columns and reuse its compiled statements. The SQL text of each
+    query shape is generated once and cached, so repeated queries hit the
+    prepared-statement cache of the connection instead of being parsed and
+    planned again.
+
     Attributes:
-        __cursor: Cursor instance of the SQLite table to enable SQL operations
-            from Python.
+        __database: SQL connection, or pool of SQL connections, the table
+            belongs to.
+        __queries: SQL text of each query shape already generated for this
+            table.
         table_name: Name of the table.
+        column_names: Names of the columns of the table, if known. Queries on
+            other columns are then rejected before reaching SQLite.
     """
 
-    __cursor: sqlite3.Cursor
+    __database: Union[sqlite3.Connection, SQLiteConnectionPool]
+    __queries: Dict[Tuple[Any, ...], str]
     table_name: str
+    column_names: Optional[List[str]]
+
+    def __init__(
+        self, database: Union[sqlite3.Connection, SQLiteConnectionPool],
+        table_name: str, column_names: Sequence[str] = None
+    ):
+        self.__database = database
+        self.__queries = {}
+        self.table_name = _verify_identifier(table_name)
+        self.column_names = None if column_names is None \
+            else list(column_names)
+
+    def set_database(
+        self, database: Union[sqlite3.Connection, SQLiteConnectionPool]
+    ):
+        """Query the same table from another SQL connection.
+
+        Args:
+            database: SQL connection, or pool of SQL connections, the table
+                belongs to.
+        """
+        self.__database = database
 
-    def __init__(self, database: sqlite3.Connection, table_name: str):
-        self.__cursor = database.cursor()
-        self.table_name = table_name
+    def select(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        fetch_mode: FetchMode = FetchMode.ALL,
+        size: int = 1,
+    ) -> Any:
+        """Gets the data of several columns on condition.
+
+        Args:
+            data_column_names: Names of the columns that contain the data to be
+                queried in the output database SQL file.
+            condition_column_name_value: Mapping of conditions that need to be
+                satisfied to query data. Key of the dictionary is column name
+                in the output database SQL file. Value of the dictionary is
+                either the value the column needs to be equal to, or a list of
+                values the column needs to be in.
+            fetch_mode: Number of rows to return.
+            size: Maximum number of rows to return when fetch_mode is
+                FetchMode.MANY.
+        Returns:
+            Queried rows, each a tuple with one item per column in
+            data_column_names. A single row (or None if there is no match) when
+            fetch_mode is FetchMode.ONE, a list of rows otherwise.
+        """
+        if fetch_mode == FetchMode.ONE:
+            fetch = sqlite3.Cursor.fetchone
+        elif fetch_mode == FetchMode.MANY:
+            def fetch(cursor):
+                return cursor.fetchmany(size)
+        else:
+            fetch = sqlite3.Cursor.fetchall
+        return self.__execute(
+            fetch, data_column_names, condition_column_name_value)
 
     def get_data_on_condition(
-        self, data_column_name: str, condition_column_name_value: Dict[str, str] = None
+        self, data_column_name: str, condition_column_name_value: Dict[str, Any] = None
     ) -> Any:
         """Gets data on condition.
 
@@ -299,30 +593,724 @@ class SQLiteTable:
             Queried data from data_column_name that abides conditions in
                 condition_column_name_value.
         """
-        if condition_column_name_value is None:
-            self.__cursor.execute(f"SELECT {data_column_name} FROM {self.table_name}")
-        else:
-            condition_list = [
-                f"{condition_column_name} = '{condition_value}'"
-                for condition_column_name, condition_value in condition_column_name_value.items()
-            ]
-            self.__cursor.execute(
-                f"SELECT {data_column_name} FROM {self.table_name} "
-                + "WHERE "
-                + " AND ".join(condition_list)
-            )
-        result = self.__cursor.fetchall()
-        # assert len(result) == 1  # only one row for the condition.
-        # assert len(result[0]) == 1  # only one data returned.
-        return result[0][0]
+        row = self.select(
+            [data_column_name], condition_column_name_value, FetchMode.ONE)
+        if row is None:
+            raise ValueError(
+                f"No row of {self.table_name} satisfies the conditions "
+                f"{condition_column_name_value}.")
+        return row[0]
+
+    def get_dense_array(
+        self, data_column_name: str, axis_column_names: List[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        axis_values: List[Optional[Sequence[Any]]] = None
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Gets data as a dense array indexed by the values of several columns.
+
+        All data is fetched with a single query grouped by axis_column_names.
+        Rows sharing the same axis values (e.g. several replications stored in
+        the same database) are averaged.
+
+        Args:
+            data_column_name: Name of the column that contains the data to be
+                queried in the output database SQL file.
+            axis_column_names: Names of the columns whose values index each
+                axis of the returned array, in order.
+            condition_column_name_value: Mapping of conditions that need to be
+                satisfied to query data, with the same format as in select().
+            axis_values: Values to use along each axis, in the order they
+                should appear in the returned array. Rows with values outside
+                of them are dropped. None for an axis (or for all axes) uses
+                the sorted unique values found in the table.
+        Returns:
+            data: Array with one axis per column in axis_column_names. Entries
+                without any matching row are set to NaN.
+            axis_values: Values indexing each axis of data.
+        """
+        data, all_axis_values = self.get_dense_arrays(
+            [data_column_name], axis_column_names,
+            condition_column_name_value, axis_values)
+        return data[0], all_axis_values
+
+    def get_dense_arrays(
+        self, data_column_names: Sequence[str], axis_column_names: List[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        axis_values: List[Optional[Sequence[Any]]] = None
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Gets the data of several columns as dense arrays indexed by the
+        values of several columns, with a single query over the table. See
+        get_dense_array() for the description of the other arguments.
+
+        Args:
+            data_column_names: Names of the columns that contain the data.
+        Returns:
+            data: Array of shape (len(data_column_names), ...) with one more
+                axis per column in axis_column_names.
+            axis_values: Values indexing each axis of data after the first
+                one.
+        """
+        if axis_values is None:
+            axis_values = [None] * len(axis_column_names)
+        assert len(axis_values) == len(axis_column_names)
+        condition_column_name_value = dict(condition_column_name_value or {})
+        num_parameters = _count_parameters(condition_column_name_value)
+        for axis_column_name, values in zip(axis_column_names, axis_values):
+            # Let SQLite skip rows outside of the requested axis values, as
+            # long as the query stays within the parameter limit.
+            if values is not None \
+                    and num_parameters + len(values) <= MAX_QUERY_PARAMETERS \
+                    and axis_column_name not in condition_column_name_value:
+                condition_column_name_value[axis_column_name] = values
+                num_parameters += len(values)
+        rows = self.__execute(
+            sqlite3.Cursor.fetchall, axis_column_names,
+            condition_column_name_value,
+            aggregated_column_names=tuple(data_column_names))
+        num_axes = len(axis_column_names)
+        columns = list(zip(*rows)) if rows \
+            else [()] * (num_axes + len(data_column_names))
+
+        all_axis_values, all_axis_indices = [], []
+        for keys, values in zip(columns[:num_axes], axis_values):
+            axis, index = get_axis_index(np.array(keys), values)
+            all_axis_values.append(axis)
+            all_axis_indices.append(index)
+        data = np.full((len(data_column_names),) + tuple(
+            len(axis) for axis in all_axis_values), np.nan)
+        found = np.ones(len(rows), dtype=bool)
+        for index in all_axis_indices:
+            found &= index >= 0
+        index = tuple(index[found] for index in all_axis_indices)
+        for i, values in enumerate(columns[num_axes:]):
+            data[i][index] = np.array(values, dtype=float)[found]
+        return data, all_axis_values
+
+    def validate_columns(self, column_names: Sequence[str]):
+        """Check that columns exist in the table, if its columns are known.
+
+        Args:
+            column_names: Names of the columns.
+        Raises:
+            ValueError: If a column is not in the table.
+        """
+        if self.column_names is None:
+            return
+        missing_column_names = [name for name in column_names
+                                if name not in self.column_names]
+        if missing_column_names:
+            raise ValueError(
+                f"Columns {missing_column_names} are not in table "
+                f"{self.table_name}. Available columns: {self.column_names}.")
+
+    def iter_batches(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        dtypes: Dict[str, Any] = None,
+    ) -> Iterator[np.ndarray]:
+        """Stream the data of several columns on condition in fixed-size
+        batches, so that whole tables can be processed in bounded memory.
+
+        The rows are read with sqlite3.Cursor.fetchmany(). The connection is
+        held until the generator is exhausted or closed, so a generator that
+        is not consumed to the end should be closed explicitly when the
+        database is a pool of connections.
+
+        Args:
+            data_column_names: Names of the columns to select.
+            condition_column_name_value: Mapping of conditions that need to be
+                satisfied to query data, with the same format as in select().
+            batch_size: Maximum number of rows in each batch.
+            dtypes: NumPy type of each column, keyed by column name. Columns
+                not listed get the type inferred from the rows read so far:
+                int64 for integers, float64 for real numbers (with NULL as
+                NaN) and object otherwise. SQLite columns can hold values of
+                any type, so the inferred type of a column widens from one
+                batch to the next when a later batch holds a real number, NULL
+                or text.
+        Yields:
+            batch: Structured array with one field per column in
+                data_column_names and at most batch_size rows.
+        """
+        dtypes = dtypes or {}
+        column_dtypes = [None] * len(data_column_names)
+        for rows in self.__iter_fetchmany(
+                batch_size, data_column_names, condition_column_name_value):
+            for i, (name, values) in enumerate(
+                    zip(data_column_names, zip(*rows))):
+                if name in dtypes:
+                    column_dtypes[i] = np.dtype(dtypes[name])
+                else:
+                    column_dtypes[i] = _widen_column_dtype(
+                        column_dtypes[i], values)
+            yield _to_record_batch(
+                rows, np.dtype(list(zip(data_column_names, column_dtypes))))
+
+    def iter_rows(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[Tuple[Any, ...]]:
+        """Stream the rows of several columns on condition, fetching them from
+        SQLite batch_size rows at a time. See iter_batches().
+
+        Yields:
+            row: Tuple with one item per column in data_column_names.
+        """
+        for rows in self.__iter_fetchmany(
+                batch_size, data_column_names, condition_column_name_value):
+            yield from rows
+
+    def __iter_fetchmany(
+        self,
+        batch_size: int,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        """Run a SELECT query on the table and yield its result rows in
+        lists of at most batch_size rows, holding the connection meanwhile."""
+        assert batch_size > 0
+        query, parameters = self.__prepare_query(
+            data_column_names, condition_column_name_value)
+        with _acquire_connection(self.__database) as connection:
+            cursor = connection.execute(query, parameters)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield rows
+            finally:
+                cursor.close()
+
+    def __execute(
+        self,
+        fetch: Callable[[sqlite3.Cursor], Any],
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        aggregated_column_names: Tuple[str, ...] = (),
+    ) -> Any:
+        """Run a SELECT query on the table with bound parameters.
+
+        Args:
+            fetch: Function that fetches the result rows from the cursor. It
+                runs while the connection is held, which matters when the
+                connection is borrowed from a pool.
+            data_column_names: Names of the columns to select.
+            condition_column_name_value: Mapping of conditions, with the same
+                format as in select().
+            aggregated_column_names: If not empty, the average of each of
+                these columns is selected after data_column_names in each row,
+                and rows are grouped by data_column_names.
+        Returns:
+            Result rows, as returned by fetch.
+        """
+        query, parameters = self.__prepare_query(
+            data_column_names, condition_column_name_value,
+            aggregated_column_names)
+        with _acquire_connection(self.__database) as connection:
+            return fetch(connection.execute(query, parameters))
+
+    def __prepare_query(
+        self,
+        data_column_names: Sequence[str],
+        condition_column_name_value: Dict[str, Any] = None,
+        aggregated_column_names: Tuple[str, ...] = (),
+    ) -> Tuple[str, List[Any]]:
+        """Get the SQL text of a query, from the cache if its shape was seen
+        before, and the parameters to bind to it. See __execute() for the
+        arguments.
+
+        Returns:
+            query: SQL text with one placeholder per bound parameter.
+            parameters: Values to bind to the placeholders.
+        """
+        condition_column_name_value = condition_column_name_value or {}
+        condition_shape, parameters = [], []
+        num_parameters = _count_parameters(condition_column_name_value)
+        for condition_column_name, condition_value in \
+                condition_column_name_value.items():
+            if _is_list_condition(condition_value):
+                values = [_to_sql_value(value) for value in condition_value]
+                # Pad the list to a power of two by repeating its last value,
+                # so that lists of similar lengths share the same SQL text.
+                # Padding never makes the query exceed the parameter limit.
+                bucket_size = 1 << max(len(values) - 1, 0).bit_length() \
+                    if values else 0
+                if num_parameters + bucket_size - len(values) \
+                        > MAX_QUERY_PARAMETERS:
+                    bucket_size = len(values)
+                num_parameters += bucket_size - len(values)
+                values += values[-1:] * (bucket_size - len(values))
+                condition_shape.append((condition_column_name, bucket_size))
+                parameters.extend(values)
+            else:
+                condition_shape.append((condition_column_name, None))
+                parameters.append(_to_sql_value(condition_value))
+        key = (tuple(data_column_names), tuple(condition_shape),
+               tuple(aggregated_column_names))
+        query = self.__queries.get(key)
+        if query is None:
+            query = self.__build_query(*key)
+            self.__queries[key] = query
+        return query, parameters
+
+    def __build_query(
+        self,
+        data_column_names: Tuple[str, ...],
+        condition_shape: Tuple[Tuple[str, Optional[int]], ...],
+        aggregated_column_names: Tuple[str, ...],
+    ) -> str:
+        """Generate the SQL text of a query shape.
+
+        Args:
+            data_column_names: Names of the columns to select.
+            condition_shape: Name of each condition column, with the number of
+                values it is compared against, or None for an equality.
+            aggregated_column_names: Names of the columns to average.
+        Returns:
+            query: SQL text with one placeholder per bound parameter.
+        """
+        self.validate_columns(
+            list(data_column_names) + [name for name, _ in condition_shape]
+            + list(aggregated_column_names))
+        selected = [_verify_identifier(name) for name in data_column_names]
+        selected += [f"AVG({_verify_identifier(name)})"
+                     for name in aggregated_column_names]
+        query = f"SELECT {', '.join(selected)} FROM {self.table_name}"
+        conditions = []
+        for condition_column_name, num_values in condition_shape:
+            _verify_identifier(condition_column_name)
+            if num_values is None:
+                conditions.append(f"{condition_column_name} = ?")
+            else:
+                conditions.append(
+                    f"{condition_column_name} IN "
+                    f"({', '.join('?' * num_values)})")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if aggregated_column_names:
+            query += f" GROUP BY {', '.join(data_column_names)}"
+        return query
+
+
+def _verify_identifier(name: str) -> str:
+    """Check that a table or column name can safely be written into SQL text.
+
+    Args:
+        name: Table or column name.
+    Returns:
+        name: The same name.
+    """
+    if not name.isidentifier():
+        raise ValueError(f"{name} is not a valid SQL table or column name.")
+    return name
+
+
+def _is_list_condition(condition_value: Any) -> bool:
+    """Check whether a condition value is a list of values to match with IN,
+    rather than a single value to match with =."""
+    return isinstance(condition_value, (list, tuple, set, np.ndarray))
+
+
+def _count_parameters(condition_column_name_value: Dict[str, Any]) -> int:
+    """Count the parameters bound by conditions before any padding.
+
+    Args:
+        condition_column_name_value: Mapping of conditions, with the same
+            format as in SQLiteTable.select().
+    Returns:
+        num_parameters: One per value of each list, one per single value.
+    """
+    return sum(len(condition_value) if _is_list_condition(condition_value)
+               else 1 for condition_value in condition_column_name_value.values())
+
+
+def _infer_column_dtype(values: Sequence[Any]) -> np.dtype:
+    """Infer the NumPy type of a column from some of its SQLite values.
+
+    Args:
+        values: Values of the column.
+    Returns:
+        dtype: int64 if all values are integers, float64 if all values are
+            numbers or NULL, object otherwise.
+    """
+    if all(isinstance(value, int) for value in values):
+        return np.dtype(np.int64)
+    if all(value is None or isinstance(value, (int, float))
+           for value in values):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def _widen_column_dtype(
+    dtype: Optional[np.dtype], values: Sequence[Any]
+) -> np.dtype:
+    """Get the narrowest type that holds both the values of a column read so
+    far and new values of the same column.
+
+    Args:
+        dtype: Type of the values read so far, None if there are none.
+        values: New values of the column.
+    Returns:
+        dtype: int64, float64 or object. See _infer_column_dtype().
+    """
+    inferred_dtype = _infer_column_dtype(values)
+    if dtype is None:
+        return inferred_dtype
+    return np.promote_types(dtype, inferred_dtype)
+
+
+def _to_record_batch(
+    rows: List[Tuple[Any, ...]], dtype: np.dtype
+) -> np.ndarray:
+    """Convert rows fetched from SQLite into a structured array.
+
+    Args:
+        rows: Rows, each a tuple with one item per field of dtype.
+        dtype: Structured type of the batch.
+    Returns:
+        batch: Structured array with one item per row.
+    """
+    batch = np.empty(len(rows), dtype=dtype)
+    for name, values in zip(dtype.names, zip(*rows)):
+        if dtype[name].kind == "f":
+            # NULL values become NaN.
+            values = [np.nan if value is None else value for value in values]
+        batch[name] = values
+    return batch
+
+
+def _get_column_name(column: Union[str, enum.Enum]) -> str:
+    """Get the name of a column given by name or by column enum member."""
+    if isinstance(column, enum.Enum):
+        return column.value
+    return column
+
+
+def _to_sql_value(value: Any) -> Any:
+    """Convert NumPy scalars into Python scalars that sqlite3 can bind."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def get_axis_index(
+    keys: np.ndarray, values: Optional[Sequence[Any]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the position of every key along an array axis.
+
+    Args:
+        keys: Key of each queried row.
+        values: Values of the axis, in order. If None, the sorted unique keys
+            are used.
+    Returns:
+        axis_values: Values of the axis.
+        index: Position of each key within axis_values. -1 for keys that are
+            not part of the axis.
+    """
+    if values is None:
+        axis_values, index = np.unique(keys, return_inverse=True)
+        return axis_values, index.reshape(-1)
+    axis_values = np.asarray(values)
+    if len(axis_values) == 0 or len(keys) == 0:
+        return axis_values, np.full(len(keys), -1, dtype=int)
+    order = np.argsort(axis_values, kind="stable")
+    sorted_values = axis_values[order]
+    position = np.clip(
+        np.searchsorted(sorted_values, keys), 0, len(sorted_values) - 1)
+    index = np.where(sorted_values[position] == keys, order[position], -1)
+    return axis_values, index
+
+
+def get_centroid_internal_ids(
+    centroid_configuration: aimsun_input_utils.CentroidConfiguration
+) -> np.ndarray:
+    """Get the internal IDs of the centroids of a centroid configuration, in
+    the order of its centroid_connection_list. Used to index the centroid axes
+    of OD arrays consistently with the input data.
+
+    Args:
+        centroid_configuration: Centroids of the network.
+    Returns:
+        centroid_internal_ids: Internal ID of each centroid.
+    """
+    return np.array([
+        centroid.internal_id
+        for centroid in centroid_configuration.centroid_connection_list])
+
+
+def compute_replication_statistics(
+    data: np.ndarray, confidence_level: float = 0.95
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute statistics across replications in one vectorized pass.
+
+    NaN values (e.g. an object missing from one replication) are ignored, and
+    every statistic is computed with the number of replications that have data.
+
+    Args:
+        data: Array whose first axis is the replication, e.g. of shape
+            (replications, objects, time intervals).
+        confidence_level: Confidence level of the confidence interval of the
+            mean, based on the Student t-distribution.
+    Returns:
+        mean: Mean across replications, of shape data.shape[1:].
+        std: Sample standard deviation across replications.
+        ci_lower: Lower bound of the confidence interval of the mean.
+        ci_upper: Upper bound of the confidence interval of the mean.
+    """
+    count = np.sum(~np.isnan(data), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.nansum(data, axis=0)
+        mean = np.where(count > 0, total / count, np.nan)
+        squared_deviation = np.nansum((data - mean) ** 2, axis=0)
+        std = np.where(count > 1, np.sqrt(squared_deviation / (count - 1)),
+                       np.nan)
+        half_width = stats.t.ppf((1 + confidence_level) / 2, count - 1) \
+            * std / np.sqrt(count)
+    return mean, std, mean - half_width, mean + half_width
+
+
+def merge_moments(
+    count_a: np.ndarray, mean_a: np.ndarray, squared_deviation_a: np.ndarray,
+    count_b: np.ndarray, mean_b: np.ndarray, squared_deviation_b: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge the moments of two disjoint sets of values, element-wise, with the
+    parallel form of Welford's algorithm (Chan et al.).
+
+    Args:
+        count_a: Number of values of the first set.
+        mean_a: Mean of the first set. Ignored where count_a is 0.
+        squared_deviation_a: Sum of squared deviations from mean_a.
+        count_b: Number of values of the second set.
+        mean_b: Mean of the second set. Ignored where count_b is 0.
+        squared_deviation_b: Sum of squared deviations from mean_b.
+    Returns:
+        count: Number of values of both sets.
+        mean: Mean of both sets, NaN where count is 0.
+        squared_deviation: Sum of squared deviations from mean.
+    """
+    count = count_a + count_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where(count_b > 0, mean_b, 0.0) \
+            - np.where(count_a > 0, mean_a, 0.0)
+        weight_b = np.where(count > 0, count_b / count, 0.0)
+        mean = np.where(count_a > 0, mean_a, 0.0) + delta * weight_b
+        squared_deviation = np.where(count_a > 0, squared_deviation_a, 0.0) \
+            + np.where(count_b > 0, squared_deviation_b, 0.0) \
+            + delta ** 2 * count_a * weight_b
+    return count, np.where(count > 0, mean, np.nan), squared_deviation
+
+
+class ODTripDistributions:
+    """Single-pass aggregator of the travel time and delay time distributions
+    of trips per origin-destination pair and departure time interval.
+
+    Trips are added in batches with update(), e.g. while streaming the
+    MIVEHTRAJECTORY table, so that the distributions of millions of vehicles
+    are computed without keeping the vehicles in memory. Each distribution is
+    summarized by its count, mean, sum of squared deviations from the mean and
+    a histogram over fixed bins. The moments of each batch are merged with
+    merge_moments(), which keeps the variance accurate when it is small
+    compared to the mean. OD pairs are discovered on the fly.
+
+    Attributes:
+        metric_columns: Trajectory columns whose distributions are computed.
+        bin_edges: Edges of the histogram bins in seconds. Values below the
+            first edge are counted in the first bin, and values above the last
+            edge in the last bin.
+        start_time_seconds: Time in seconds since midnight of when the first
+            time interval starts.
+        time_step: Length of one time interval in seconds.
+        num_time_intervals: Number of time intervals. Trips departing outside
+            of them are ignored.
+    """
+
+    metric_columns: Tuple[MiVehTrajectoryColumns, ...] = (
+        MiVehTrajectoryColumns.TRAVEL_TIME, MiVehTrajectoryColumns.DELAY_TIME)
+    bin_edges: np.ndarray
+    start_time_seconds: float
+    time_step: float
+    num_time_intervals: int
+
+    def __init__(
+        self, start_time_seconds: float, time_step: float,
+        num_time_intervals: int, bin_edges: Sequence[float] = None
+    ):
+        if bin_edges is None:
+            bin_edges = DEFAULT_TRIP_TIME_BIN_EDGES
+        self.bin_edges = np.asarray(bin_edges, dtype=float)
+        assert len(self.bin_edges) >= 2
+        self.start_time_seconds = start_time_seconds
+        self.time_step = time_step
+        self.num_time_intervals = num_time_intervals
+        self.__pair_index = {}
+        shape = (0, num_time_intervals, len(self.metric_columns))
+        self.__count = np.zeros(shape[:2], dtype=np.int64)
+        self.__mean = np.zeros(shape)
+        self.__squared_deviation = np.zeros(shape)
+        self.__histogram = np.zeros(
+            shape + (len(self.bin_edges) - 1,), dtype=np.int64)
+
+    def update(self, batch: np.ndarray):
+        """Add a batch of trips to the distributions.
+
+        Args:
+            batch: Structured array with the origin, destination, entrance
+                time and metric columns of MiVehTrajectoryColumns as fields, as
+                yielded by SQLiteTable.iter_batches(). Trips without a valid
+                (non-negative) value of every metric are ignored.
+        """
+        metrics = np.stack([
+            np.asarray(batch[column.value], dtype=float)
+            for column in self.metric_columns], axis=1)
+        interval = np.floor((np.asarray(
+            batch[MiVehTrajectoryColumns.ENTRANCE_TIME.value], dtype=float)
+            - self.start_time_seconds) / self.time_step)
+        valid = (interval >= 0) & (interval < self.num_time_intervals) \
+            & np.all(metrics >= 0, axis=1)
+        if not np.any(valid):
+            return
+        metrics = metrics[valid]
+        interval = interval[valid].astype(np.int64)
+        pairs, pair_inverse = np.unique(np.stack([
+            batch[MiVehTrajectoryColumns.ORIGIN_CENTROID_INTERNAL_ID.value][
+                valid],
+            batch[MiVehTrajectoryColumns.DEST_CENTROID_INTERNAL_ID.value][
+                valid]], axis=1), axis=0, return_inverse=True)
+        pair_index = np.array([self.__get_pair_index(tuple(pair))
+                               for pair in pairs.tolist()])[
+            pair_inverse.reshape(-1)]
+
+        size = self.__count.size
+        flat_index = pair_index * self.num_time_intervals + interval
+        batch_count = np.bincount(flat_index, minlength=size)
+        num_bins = len(self.bin_edges) - 1
+        for i in range(len(self.metric_columns)):
+            values = metrics[:, i]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                batch_mean = np.bincount(
+                    flat_index, weights=values, minlength=size) / batch_count
+            batch_squared_deviation = np.bincount(
+                flat_index, weights=(values - batch_mean[flat_index]) ** 2,
+                minlength=size)
+            _, mean, squared_deviation = merge_moments(
+                self.__count.reshape(-1), self.__mean[:, :, i].reshape(-1),
+                self.__squared_deviation[:, :, i].reshape(-1), batch_count,
+                batch_mean, batch_squared_deviation)
+            self.__mean[:, :, i] = mean.reshape(self.__count.shape)
+            self.__squared_deviation[:, :, i] = squared_deviation.reshape(
+                self.__count.shape)
+            bin_index = np.clip(np.searchsorted(
+                self.bin_edges, values, side="right") - 1, 0, num_bins - 1)
+            self.__histogram[:, :, i] += np.bincount(
+                flat_index * num_bins + bin_index,
+                minlength=size * num_bins).reshape(
+                    self.__histogram.shape[:2] + (num_bins,))
+        self.__count += batch_count.reshape(self.__count.shape)
+
+    def get_statistics(
+        self, metric_column: MiVehTrajectoryColumns,
+        origin_centroid_ids: Sequence[aimsun_input_utils.InternalId] = None,
+        dest_centroid_ids: Sequence[aimsun_input_utils.InternalId] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+               np.ndarray]:
+        """Get the distribution of one metric as dense arrays.
+
+        Args:
+            metric_column: MiVehTrajectoryColumns.TRAVEL_TIME or
+                MiVehTrajectoryColumns.DELAY_TIME.
+            origin_centroid_ids: Origin centroids to index the arrays with. If
+                None, all origins seen so far are used, sorted.
+            dest_centroid_ids: Destination centroids to index the arrays with.
+                If None, all destinations seen so far are used, sorted.
+        Returns:
+            count: Number of trips, of shape (origins, destinations, time
+                intervals).
+            mean: Mean of the metric, NaN where there is no trip.
+            std: Standard deviation of the metric (with one degree of freedom),
+                NaN where there are less than two trips.
+            histogram: Number of trips per bin of bin_edges, of shape
+                (origins, destinations, time intervals, bins).
+            origin_centroid_ids: Internal ID of the origin of each row.
+            dest_centroid_ids: Internal ID of the destination of each column.
+        """
+        metric = self.metric_columns.index(metric_column)
+        pairs = np.array(list(self.__pair_index), dtype=np.int64).reshape(
+            -1, 2)
+        origin_centroid_ids, origin_index = get_axis_index(
+            pairs[:, 0], origin_centroid_ids)
+        dest_centroid_ids, dest_index = get_axis_index(
+            pairs[:, 1], dest_centroid_ids)
+        found = (origin_index >= 0) & (dest_index >= 0)
+        pair_slots = (origin_index[found], dest_index[found])
+        shape = (len(origin_centroid_ids), len(dest_centroid_ids),
+                 self.num_time_intervals)
+        count = np.zeros(shape, dtype=np.int64)
+        mean = np.full(shape, np.nan)
+        squared_deviation = np.zeros(shape)
+        histogram = np.zeros(shape + (len(self.bin_edges) - 1,),
+                             dtype=np.int64)
+        # The accumulators may have more rows than OD pairs seen so far.
+        rows = np.flatnonzero(found)
+        count[pair_slots] = self.__count[rows]
+        mean[pair_slots] = self.__mean[rows, :, metric]
+        squared_deviation[pair_slots] = \
+            self.__squared_deviation[rows, :, metric]
+        histogram[pair_slots] = self.__histogram[rows, :, metric]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.where(count > 1, np.sqrt(squared_deviation / (count - 1)),
+                           np.nan)
+        return count, mean, std, histogram, origin_centroid_ids, \
+            dest_centroid_ids
+
+    def __get_pair_index(self, pair: Tuple[int, int]) -> int:
+        """Get the row of an OD pair in the accumulators, adding it if it is
+        new."""
+        index = self.__pair_index.get(pair)
+        if index is None:
+            index = len(self.__pair_index)
+            self.__pair_index[pair] = index
+            if index == len(self.__count):
+                self.__grow()
+        return index
+
+    def __grow(self):
+        """Double the number of OD pairs the accumulators can hold."""
+        num_new_rows = max(len(self.__count), 16)
+        self.__count, self.__mean, self.__squared_deviation, \
+            self.__histogram = (
+                np.concatenate([array, np.zeros(
+                    (num_new_rows,) + array.shape[1:], dtype=array.dtype)])
+                for array in (self.__count, self.__mean,
+                              self.__squared_deviation, self.__histogram))
 
 
 class AimsunOutputDatabase:
     """Data class to store common output data between both Aimsun micro and
     macro simulation results.
 
+    By default the database is opened with a single read-write connection. In
+    read-only mode, it is opened through a SQLiteConnectionPool instead, which
+    lets several threads query the same database in parallel.
+
     Attributes:
-        database: SQL connection to the specified Aimsun output sqlite file.
+        database: SQL connection to the specified Aimsun output sqlite file, or
+            pool of read-only SQL connections in read-only mode.
+        database_path: Path to the Aimsun output sqlite file in use.
+        read_only: Whether the database is opened in read-only mode.
+        immutable: Whether the read-only connections skip file locking. Only
+            safe if the file is not modified while it is open.
+        pool_size: Maximum number of connections of the read-only pool.
+        indexes: Build time in seconds of each index of the database, keyed by
+            index name. Filled by ensure_indexes().
+        schema: Names of the columns of each table of the database, keyed by
+            table name. Read once when the database is opened.
+        tables: Objects that query each table opened so far, keyed by table
+            name.
         sim_info: SQL table that contains the ID of the object that
             generated the data. Named SIM_INFO.
         meta_info: SQL table that contains the information about all stored
@@ -333,18 +1321,271 @@ class AimsunOutputDatabase:
             all other tables. Named META_COLS.
     """
 
-    database: sqlite3.Connection
+    database: Union[sqlite3.Connection, SQLiteConnectionPool]
+    database_path: str
+    read_only: bool
+    immutable: bool
+    pool_size: int
+    indexes: Dict[str, float]
+    schema: Dict[str, List[str]]
+    tables: Dict[str, SQLiteTable]
     sim_info: SQLiteTable
     meta_info: SQLiteTable
     meta_sub_info: SQLiteTable
     meta_cols: SQLiteTable
 
-    def __init__(self, database_path):
-        self.database = sqlite3.connect(database_path)
-        self.sim_info = SQLiteTable(self.database, "SIM_INFO")
-        self.meta_info = SQLiteTable(self.database, "META_INFO")
-        self.meta_sub_info = SQLiteTable(self.database, "META_SUB_INFO")
-        self.meta_cols = SQLiteTable(self.database, "META_COLS")
+    def __init__(
+        self, database_path: str, read_only: bool = False,
+        immutable: bool = False, pool_size: int = DEFAULT_POOL_SIZE
+    ):
+        self.database_path = database_path
+        self.read_only = read_only
+        self.immutable = immutable
+        self.pool_size = pool_size
+        self.database = self._open_database(database_path)
+        self.indexes = {}
+        self.schema = self._read_schema()
+        self.tables = {}
+        self.sim_info = self.get_table("SIM_INFO")
+        self.meta_info = self.get_table("META_INFO")
+        self.meta_sub_info = self.get_table("META_SUB_INFO")
+        self.meta_cols = self.get_table("META_COLS")
+
+    def close(self):
+        """Close the connection(s) to the database."""
+        if self.database is not None:
+            self.database.close()
+
+    def get_table(self, table_name: str) -> SQLiteTable:
+        """Get the object used to query one table of the database. It is
+        created on first use and reused afterwards, along with its cache of
+        queries.
+
+        Args:
+            table_name: Name of the table, e.g. "MISECT".
+        Returns:
+            table: Object that queries the table.
+        """
+        if table_name not in self.tables:
+            self.tables[table_name] = self._open_table(table_name)
+        return self.tables[table_name]
+
+    def validate_columns(
+        self, table_name: str,
+        column_names: Sequence[Union[str, enum.Enum]]
+    ) -> List[str]:
+        """Check that a table and some of its columns exist in the database.
+
+        Args:
+            table_name: Name of the table.
+            column_names: Names of the columns, or column enum members such as
+                MiSectColumns.MEAN_SPEED.
+        Returns:
+            column_names: Names of the columns.
+        Raises:
+            ValueError: If the table or a column is not in the database.
+        """
+        if table_name not in self.schema:
+            raise ValueError(
+                f"Table {table_name} is not in the database "
+                f"{self.database_path}. Available tables: "
+                f"{sorted(self.schema)}.")
+        column_names = [_get_column_name(column) for column in column_names]
+        missing_column_names = [name for name in column_names
+                                if name not in self.schema[table_name]]
+        if missing_column_names:
+            raise ValueError(
+                f"Columns {missing_column_names} are not in table "
+                f"{table_name}. Available columns: "
+                f"{self.schema[table_name]}.")
+        return column_names
+
+    def get(
+        self, table_name: str,
+        column_names: Sequence[Union[str, enum.Enum]] = None,
+        condition_column_name_value: Dict[Union[str, enum.Enum], Any] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> np.ndarray:
+        """Get the data of any columns of any table of the database with a
+        single query, e.g. statistics that have no dedicated getter.
+
+        The table and all columns are validated against the schema before
+        the query runs.
+
+        Args:
+            table_name: Name of the table, e.g. "MISECT".
+            column_names: Columns to get, as names or column enum members. If
+                None, all columns of the table are returned.
+            condition_column_name_value: Mapping of conditions that need to be
+                satisfied to query data, with the same format as in
+                SQLiteTable.select(). Keys can be column enum members too.
+            batch_size: Number of rows fetched from the database at a time.
+        Returns:
+            data: Structured array with one field per column and one item per
+                matching row. See SQLiteTable.iter_batches() for the types of
+                the fields. Fields whose type widened between batches get the
+                widest type.
+        """
+        if column_names is None:
+            column_names = self.validate_columns(
+                table_name, self.schema.get(table_name, []))
+        else:
+            column_names = self.validate_columns(table_name, column_names)
+        conditions = {
+            _get_column_name(column): value
+            for column, value in (condition_column_name_value or {}).items()}
+        self.validate_columns(table_name, list(conditions))
+        batches = list(self.get_table(table_name).iter_batches(
+            column_names, conditions, batch_size))
+        if not batches:
+            return np.empty(0, dtype=[(name, float) for name in column_names])
+        dtype = np.dtype([
+            (name, functools.reduce(
+                np.promote_types, [batch.dtype[name] for batch in batches]))
+            for name in column_names])
+        return np.concatenate([batch.astype(dtype) for batch in batches])
+
+    def ensure_indexes(
+        self, sidecar_path: str = "",
+        covered_column_names: Dict[str, Sequence[str]] = None
+    ) -> Dict[str, float]:
+        """Build the indexes of OUTPUT_TABLE_INDEXES that do not exist yet.
+
+        Aimsun output databases come without indexes, so every lookup on a
+        large table is a full table scan. Building the indexes once turns
+        these lookups into index searches.
+
+        Args:
+            sidecar_path: If set, the database is first copied to this path
+                and the indexes are built in the copy, which is used by this
+                object from then on. The original file is left untouched. An
+                existing copy is reused unless it is older than the original.
+                Required in read-only mode.
+            covered_column_names: Data columns to append to every index of a
+                table, keyed by table name, e.g. {"MIDETEC": ["flow"]}. The
+                indexes then cover the queries on these columns, which are
+                answered without reading the table itself.
+        Returns:
+            build_times: Time in seconds it took to build each new index,
+                keyed by index name. All indexes of the database, including
+                the ones that already existed (with a build time of 0), are
+                recorded in the indexes attribute.
+        """
+        if self.read_only and not sidecar_path:
+            raise ValueError(
+                "Indexes of a database opened in read-only mode can only be "
+                "built in a sidecar copy.")
+        if sidecar_path:
+            if not os.path.exists(sidecar_path) or os.path.getmtime(
+                    sidecar_path) < os.path.getmtime(self.database_path):
+                source = sqlite3.connect(
+                    f"file:{os.path.abspath(self.database_path)}?mode=ro",
+                    uri=True)
+                sidecar = sqlite3.connect(sidecar_path)
+                source.backup(sidecar)
+                sidecar.close()
+                source.close()
+        # Indexes are built through their own connection, so that the
+        # connection(s) used for queries can stay read-only.
+        writer = sqlite3.connect(sidecar_path or self.database_path)
+        covered_column_names = covered_column_names or {}
+        existing_index_names = {row[0] for row in writer.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        build_times = {}
+        for table_name, index_column_names in OUTPUT_TABLE_INDEXES.items():
+            table_column_names = [row[1] for row in writer.execute(
+                f"PRAGMA table_info({table_name})")]
+            if not table_column_names:
+                continue  # Table not part of this database.
+            num_built_indexes = len(build_times)
+            for column_names in index_column_names:
+                column_names = column_names + tuple(
+                    _verify_identifier(name)
+                    for name in covered_column_names.get(table_name, [])
+                    if name not in column_names)
+                if not all(name in table_column_names
+                           for name in column_names):
+                    continue
+                index_name = f"{table_name}_{'_'.join(column_names)}_index"
+                if index_name in existing_index_names:
+                    continue
+                start_time = time.perf_counter()
+                writer.execute(
+                    f"CREATE INDEX {index_name} ON {table_name} "
+                    f"({', '.join(column_names)})")
+                build_times[index_name] = time.perf_counter() - start_time
+            if len(build_times) > num_built_indexes:
+                writer.execute(f"ANALYZE {table_name}")
+        writer.commit()
+        writer.close()
+        if sidecar_path or build_times:
+            # Reopen the query connection(s) so their plans use the new
+            # indexes and statistics.
+            self._connect(sidecar_path or self.database_path)
+        self.indexes = {name: self.indexes.get(name, 0.0)
+                        for name in existing_index_names}
+        self.indexes.update(build_times)
+        return build_times
+
+    def _open_database(
+        self, database_path: str
+    ) -> Union[sqlite3.Connection, SQLiteConnectionPool]:
+        """Open the connection(s) to the Aimsun output sqlite file.
+
+        Args:
+            database_path: Path to the Aimsun output sqlite file.
+        Returns:
+            database: SQL connection to the file, or pool of read-only SQL
+                connections in read-only mode.
+        """
+        if self.read_only:
+            return SQLiteConnectionPool(
+                database_path, self.pool_size, self.immutable)
+        return sqlite3.connect(
+            database_path, cached_statements=STATEMENT_CACHE_SIZE)
+
+    def _read_schema(self) -> Dict[str, List[str]]:
+        """Read the names of the columns of all tables with one query.
+
+        The columns are read from the SQLite catalog rather than from
+        META_COLS, which describes the statistics Aimsun can export rather
+        than the columns actually stored in this file.
+
+        Returns:
+            schema: Names of the columns of each table, keyed by table name.
+        """
+        schema = {}
+        with _acquire_connection(self.database) as connection:
+            for table_name, column_name in connection.execute(
+                    "SELECT m.name, p.name FROM sqlite_master AS m "
+                    "JOIN pragma_table_info(m.name) AS p "
+                    "WHERE m.type = 'table' ORDER BY m.name, p.cid"):
+                schema.setdefault(table_name, []).append(column_name)
+        return schema
+
+    def _open_table(self, table_name: str) -> SQLiteTable:
+        """Create the object used to query one table of the database.
+
+        Args:
+            table_name: Name of the table.
+        Returns:
+            table: Object that queries the table. Its columns are validated
+                against the schema if the table exists.
+        """
+        return SQLiteTable(
+            self.database, table_name, self.schema.get(table_name))
+
+    def _connect(self, database_path: str):
+        """Point this object and all of its tables to another database file.
+
+        Args:
+            database_path: Path to the Aimsun output sqlite file to use.
+        """
+        self.close()
+        self.database_path = database_path
+        self.database = self._open_database(database_path)
+        for table in self.tables.values():
+            table.set_database(self.database)
 
 
 class AimsunMacroOutputDatabase(AimsunOutputDatabase):
@@ -360,10 +1601,13 @@ class AimsunMacroOutputDatabase(AimsunOutputDatabase):
     sections_table: SQLiteTable
     detectors_table: SQLiteTable
 
-    def __init__(self, database_path: str):
-        super().__init__(database_path)
-        self.sections_table = SQLiteTable(self.database, "MASECT")
-        self.detectors_table = SQLiteTable(self.database, "MADET")
+    def __init__(
+        self, database_path: str, read_only: bool = False,
+        immutable: bool = False, pool_size: int = DEFAULT_POOL_SIZE
+    ):
+        super().__init__(database_path, read_only, immutable, pool_size)
+        self.sections_table = self.get_table("MASECT")
+        self.detectors_table = self.get_table("MADET")
         # Add more tables here if needed.
 
     def get_road_section_flow(self, road_id: aimsun_input_utils.InternalId) -> float:
@@ -413,22 +1657,71 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             to each road section ID. Named 'MISECT' in the original SQLite file.
         detectors_table: SQL table data that maps various microsimulation data
             to each detector ID. Named 'MIDETEC' in the original SQLite file.
+        origin_centroids_table: SQL table data that maps various
+            microsimulation data to each origin-destination centroid pair,
+            seen from the origin. Named 'MICENT_O' in the original SQLite file.
+        destination_centroids_table: Same data as origin_centroids_table, seen
+            from the destination. Named 'MICENT_D' in the original SQLite file.
+        vehicle_trajectories_table: SQL table data with the trip of each
+            vehicle. Named 'MIVEHTRAJECTORY' in the original SQLite file, and
+            only present if trajectory statistics were saved.
     """
 
     sections_table: SQLiteTable
     detectors_table: SQLiteTable
     total_rgap_table: SQLiteTable
     origin_centroids_table: SQLiteTable
+    destination_centroids_table: SQLiteTable
     section_trajectories_table: SQLiteTable
-
-    def __init__(self, database_path: str):
-        super().__init__(database_path)
-        self.system_table = SQLiteTable(self.database, "MISYS")
-        self.sections_table = SQLiteTable(self.database, "MISECT")
-        self.detectors_table = SQLiteTable(self.database, "MIDETEC")
-        self.total_rgap_table = SQLiteTable(self.database, "RGap")
+    vehicle_trajectories_table: SQLiteTable
+
+    def __init__(
+        self, database_path: str, read_only: bool = False,
+        immutable: bool = False, pool_size: int = DEFAULT_POOL_SIZE
+    ):
+        super().__init__(database_path, read_only, immutable, pool_size)
+        self.__time_interval_settings = None
+        self.system_table = self.get_table("MISYS")
+        self.sections_table = self.get_table("MISECT")
+        self.detectors_table = self.get_table("MIDETEC")
+        self.total_rgap_table = self.get_table("RGap")
+        self.origin_centroids_table = self.get_table("MICENT_O")
+        self.destination_centroids_table = self.get_table("MICENT_D")
+        self.vehicle_trajectories_table = self.get_table("MIVEHTRAJECTORY")
         # Add more tables here if needed.
 
+    def get_time_interval_settings(self) -> Tuple[int, int, int]:
+        """Get the time interval settings of the simulation. They are queried
+        from SIM_INFO once and cached afterwards.
+
+        Returns:
+            start_time_seconds: Time in seconds of when the simulation starts.
+            time_step: Length of one time interval in seconds.
+            num_time_intervals: Number of time intervals within the simulation.
+        """
+        if self.__time_interval_settings is None:
+            start_time_seconds = self.sim_info.get_data_on_condition(
+                SimInfoColumns.START_TIME_INTERVAL.value
+            )
+            num_time_intervals = self.sim_info.get_data_on_condition(
+                SimInfoColumns.NUM_TIME_INTERVALS.value
+            )
+            time_step = self.sim_info.get_data_on_condition(
+                SimInfoColumns.TOTAL_DURATION.value
+            ) // num_time_intervals
+            self.__time_interval_settings = (
+                start_time_seconds, time_step, num_time_intervals)
+        return self.__time_interval_settings
+
+    def get_time_grid(self) -> TimeGrid:
+        """Get the time intervals of the simulation as a TimeGrid, to convert
+        between their times and their indices in the output tables.
+
+        Returns:
+            time_grid: Time intervals of the simulation.
+        """
+        return TimeGrid(*self.get_time_interval_settings())
+
     def convert_time_to_int(self, time_interval: datetime.time) -> int:
         """Convert a given time interval to its corresponding index within the
         Aimsun Microsimulation output SQLite database.
@@ -440,20 +1733,42 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             time_index: Corresponding index of time_interval in the simulation
                 output database.
         """
-        start_time_seconds = self.sim_info.get_data_on_condition(
-            SimInfoColumns.START_TIME_INTERVAL.value
-        )
-        time_step = self.sim_info.get_data_on_condition(
-            SimInfoColumns.TOTAL_DURATION.value
-        ) // self.sim_info.get_data_on_condition(
-            SimInfoColumns.NUM_TIME_INTERVALS.value
-        )
+        start_time_seconds, time_step, _ = self.get_time_interval_settings()
         time_index = (
             time_interval.hour * 3600 + time_interval.minute * 60 - start_time_seconds
         ) // time_step + 1
         assert isinstance(time_index, int) and time_index >= 1
         return time_index
 
+    def convert_times_to_int(
+        self, time_intervals: Sequence[datetime.time]
+    ) -> np.ndarray:
+        """Convert time intervals to their corresponding indices within the
+        Aimsun Microsimulation output SQLite database.
+
+        Args:
+            time_intervals: Times to convert into their corresponding indices
+                within the Microsimulation SQL table.
+        Returns:
+            time_indices: Corresponding index of each time interval in the
+                simulation output database.
+        """
+        start_time_seconds, time_step, _ = self.get_time_interval_settings()
+        seconds = np.array([time_interval.hour * 3600 + time_interval.minute * 60
+                            for time_interval in time_intervals], dtype=int)
+        time_indices = (seconds - start_time_seconds) // time_step + 1
+        assert np.all(time_indices >= 1)
+        return time_indices
+
+    def __get_time_interval_indices(
+        self, time_intervals: Optional[Sequence[datetime.time]]
+    ) -> np.ndarray:
+        """Convert time intervals to indices, defaulting to all time intervals
+        of the simulation when time_intervals is None."""
+        if time_intervals is None:
+            return np.arange(1, self.get_time_interval_settings()[2] + 1)
+        return self.convert_times_to_int(time_intervals)
+
     def get_road_section_flow(
         self, road_id: aimsun_input_utils.InternalId, time_interval: datetime.time
     ) -> float:
@@ -473,7 +1788,7 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             {
                 MiSectColumns.SECTION_INTERNAL_ID.value: road_id,
                 MiSectColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                MiSectColumns.TIME_INTERVAL.value: str(time_interval_int),
+                MiSectColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
 
@@ -496,7 +1811,7 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             {
                 MiSectColumns.SECTION_INTERNAL_ID.value: road_id,
                 MiSectColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                MiSectColumns.TIME_INTERVAL.value: str(time_interval_int),
+                MiSectColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
 
@@ -520,7 +1835,7 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             {
                 MiSectColumns.SECTION_INTERNAL_ID.value: road_id,
                 MiSectColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                MiSectColumns.TIME_INTERVAL.value: str(time_interval_int),
+                MiSectColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
 
@@ -545,10 +1860,397 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             {
                 MiDetColumns.DETECTOR_EXTERNAL_ID.value: detector_external_id,
                 MiDetColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                MiDetColumns.TIME_INTERVAL.value: str(time_interval_int),
+                MiDetColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
 
+    def get_detectors_data(
+        self,
+        data_column: MiDetColumns,
+        detector_external_ids: Sequence[aimsun_input_utils.ExternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated data of many detectors at many time intervals with a
+        single query. Used for Microsimulations.
+
+        Args:
+            data_column: Column of the MIDETEC table to get the data from, e.g.
+                MiDetColumns.FLOW, MiDetColumns.COUNT or MiDetColumns.SPEED.
+            detector_external_ids: External IDs of the detectors we want the
+                data from. If None, all detectors of the table are used.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            data: Array of shape (detectors, time intervals). Missing values
+                are set to NaN.
+            detector_external_ids: External ID of the detector of each row.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each column.
+        """
+        time_interval_indices = self.__get_time_interval_indices(
+            time_intervals)
+        data, (detector_external_ids, time_interval_indices) = \
+            self.detectors_table.get_dense_array(
+                data_column.value,
+                [MiDetColumns.DETECTOR_EXTERNAL_ID.value,
+                 MiDetColumns.TIME_INTERVAL.value],
+                {MiDetColumns.VEHICLE_TYPE.value: vehicle_type},
+                [detector_external_ids, time_interval_indices],
+            )
+        return data, detector_external_ids, time_interval_indices
+
+    def get_sections_data(
+        self,
+        data_column: MiSectColumns,
+        section_internal_ids: Sequence[aimsun_input_utils.InternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated data of many road sections at many time intervals
+        with a single query. Used for Microsimulations.
+
+        Args:
+            data_column: Column of the MISECT table to get the data from, e.g.
+                MiSectColumns.MEAN_FLOW or MiSectColumns.MEAN_SPEED.
+            section_internal_ids: Internal IDs of the road sections we want
+                the data from. If None, all road sections of the table are
+                used.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            data: Array of shape (road sections, time intervals). Missing
+                values are set to NaN.
+            section_internal_ids: Internal ID of the road section of each row.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each column.
+        """
+        time_interval_indices = self.__get_time_interval_indices(
+            time_intervals)
+        data, (section_internal_ids, time_interval_indices) = \
+            self.sections_table.get_dense_array(
+                data_column.value,
+                [MiSectColumns.SECTION_INTERNAL_ID.value,
+                 MiSectColumns.TIME_INTERVAL.value],
+                {MiSectColumns.VEHICLE_TYPE.value: vehicle_type},
+                [section_internal_ids, time_interval_indices],
+            )
+        return data, section_internal_ids, time_interval_indices
+
+    def get_sections_data_by_replication(
+        self,
+        data_column: MiSectColumns,
+        section_internal_ids: Sequence[aimsun_input_utils.InternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+        replication_ids: Sequence[int] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated data of many road sections at many time intervals for
+        each replication, with a single query. Used for Microsimulations.
+
+        Args:
+            data_column: Column of the MISECT table to get the data from.
+            section_internal_ids: Internal IDs of the road sections we want the
+                data from. If None, all road sections of the table are used.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            replication_ids: IDs of the replications we want the data from. If
+                None, all replications of the table are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            data: Array of shape (replications, road sections, time
+                intervals). Missing values are set to NaN.
+            replication_ids: ID of the replication of each item of the first
+                axis.
+            section_internal_ids: Internal ID of the road section of each item
+                of the second axis.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each item of the last axis.
+        """
+        return self.__get_data_by_replication(
+            self.sections_table, data_column.value,
+            MiSectColumns.SECTION_INTERNAL_ID.value, section_internal_ids,
+            time_intervals, replication_ids, vehicle_type)
+
+    def get_detectors_data_by_replication(
+        self,
+        data_column: MiDetColumns,
+        detector_external_ids: Sequence[aimsun_input_utils.ExternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+        replication_ids: Sequence[int] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated data of many detectors at many time intervals for each
+        replication, with a single query. Used for Microsimulations.
+
+        Args:
+            data_column: Column of the MIDETEC table to get the data from.
+            detector_external_ids: External IDs of the detectors we want the
+                data from. If None, all detectors of the table are used.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            replication_ids: IDs of the replications we want the data from. If
+                None, all replications of the table are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            data: Array of shape (replications, detectors, time intervals).
+                Missing values are set to NaN.
+            replication_ids: ID of the replication of each item of the first
+                axis.
+            detector_external_ids: External ID of the detector of each item of
+                the second axis.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each item of the last axis.
+        """
+        return self.__get_data_by_replication(
+            self.detectors_table, data_column.value,
+            MiDetColumns.DETECTOR_EXTERNAL_ID.value, detector_external_ids,
+            time_intervals, replication_ids, vehicle_type)
+
+    def __get_data_by_replication(
+        self,
+        table: SQLiteTable,
+        data_column_name: str,
+        object_id_column_name: str,
+        object_ids: Optional[Sequence[Any]],
+        time_intervals: Optional[Sequence[datetime.time]],
+        replication_ids: Optional[Sequence[int]],
+        vehicle_type: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get a (replications, objects, time intervals) array from a table
+        whose rows are keyed by replication, object and time interval."""
+        time_interval_indices = self.__get_time_interval_indices(
+            time_intervals)
+        data, (replication_ids, object_ids, time_interval_indices) = \
+            table.get_dense_array(
+                data_column_name,
+                [MiSectColumns.REPLICATION_INTERNAL_ID.value,
+                 object_id_column_name, MiSectColumns.TIME_INTERVAL.value],
+                {MiSectColumns.VEHICLE_TYPE.value: vehicle_type},
+                [replication_ids, object_ids, time_interval_indices],
+            )
+        return data, replication_ids, object_ids, time_interval_indices
+
+    def get_detectors_flow(
+        self,
+        detector_external_ids: Sequence[aimsun_input_utils.ExternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated flow through many detectors at many time intervals
+        with a single query. Used for Microsimulations.
+
+        Args:
+            detector_external_ids: External IDs of the detectors we want the
+                flow data from. If None, all detectors of the table are used.
+            time_intervals: Time intervals of when we want the flow from. If
+                None, all time intervals of the simulation are used.
+        Returns:
+            flow_values: Array of flow of shape (detectors, time intervals).
+            detector_external_ids: External ID of the detector of each row.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each column.
+        """
+        return self.get_detectors_data(
+            MiDetColumns.FLOW, detector_external_ids, time_intervals)
+
+    def get_od_skim_matrix(
+        self,
+        data_column: Union[MicentOriginColumns, MicentDestinationColumns],
+        origin_centroid_ids: Sequence[aimsun_input_utils.InternalId] = None,
+        dest_centroid_ids: Sequence[aimsun_input_utils.InternalId] = None,
+        time_intervals: Sequence[datetime.time] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get simulated data of many origin-destination centroid pairs at many
+        time intervals with a single query. Used for Microsimulations.
+
+        Args:
+            data_column: Column to get the data from. A MicentOriginColumns
+                member queries the MICENT_O table and a
+                MicentDestinationColumns member the MICENT_D table.
+            origin_centroid_ids: Internal IDs of the origin centroids, in the
+                order of the first axis of the returned array. If None, all
+                origins of the table are used, sorted.
+            dest_centroid_ids: Internal IDs of the destination centroids, in
+                the order of the second axis. If None, all destinations of the
+                table are used, sorted.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            data: Array of shape (origins, destinations, time intervals).
+                Missing values are set to NaN.
+            origin_centroid_ids: Internal ID of the origin of each row.
+            dest_centroid_ids: Internal ID of the destination of each column.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each item of the last axis.
+        """
+        columns = type(data_column)
+        table = self.origin_centroids_table \
+            if columns is MicentOriginColumns \
+            else self.destination_centroids_table
+        time_interval_indices = self.__get_time_interval_indices(
+            time_intervals)
+        data, (origin_centroid_ids, dest_centroid_ids,
+               time_interval_indices) = table.get_dense_array(
+            data_column.value,
+            [columns.ORIGIN_CENTROID_INTERNAL_ID.value,
+             columns.DEST_CENTROID_INTERNAL_ID.value,
+             columns.TIME_INTERVAL.value],
+            {columns.VEHICLE_TYPE.value: vehicle_type},
+            [origin_centroid_ids, dest_centroid_ids, time_interval_indices],
+        )
+        return data, origin_centroid_ids, dest_centroid_ids, \
+            time_interval_indices
+
+    def get_od_skim_matrices(
+        self,
+        centroid_configuration: aimsun_input_utils.CentroidConfiguration,
+        time_intervals: Sequence[datetime.time] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get the number of vehicles, travel time and distance skim matrices
+        between all centroids of a centroid configuration. Both centroid axes
+        follow the order of centroid_configuration.centroid_connection_list.
+
+        Args:
+            centroid_configuration: Centroids of the network.
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            num_vehicles: Number of vehicles between each pair of centroids, of
+                shape (origins, destinations, time intervals).
+            travel_time: Average travel time between each pair of centroids.
+            distance: Total travel distance between each pair of centroids.
+            centroid_internal_ids: Internal ID of the centroid of each item of
+                the origin and destination axes.
+            time_interval_indices: Index in the simulation output database of
+                the time interval of each item of the last axis.
+        """
+        centroid_internal_ids = get_centroid_internal_ids(
+            centroid_configuration)
+        skim_matrices = []
+        for data_column in [MicentOriginColumns.NUM_VEHICLES,
+                            MicentOriginColumns.TRAVEL_TIME,
+                            MicentOriginColumns.DISTANCE]:
+            data, _, _, time_interval_indices = self.get_od_skim_matrix(
+                data_column, centroid_internal_ids, centroid_internal_ids,
+                time_intervals, vehicle_type)
+            skim_matrices.append(data)
+        return (*skim_matrices, centroid_internal_ids, time_interval_indices)
+
+    def get_od_trip_distributions(
+        self,
+        replication_ids: Sequence[int] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+        bin_edges: Sequence[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> ODTripDistributions:
+        """Compute the travel time and delay time distributions of the trips
+        between each origin-destination pair, grouped by the time interval
+        the vehicles entered the network. The trajectory table is streamed in
+        batches and read once.
+
+        Args:
+            replication_ids: IDs of the replications whose trips are included.
+                If None, the trips of all replications are pooled.
+            vehicle_type: Type of vehicles included. ALL_VEHICLE_TYPES for all
+                vehicles.
+            bin_edges: Edges of the histogram bins in seconds. See
+                ODTripDistributions.
+            batch_size: Number of vehicles read from the database at a time.
+        Returns:
+            distributions: Aggregated distributions. Use its get_statistics()
+                method to get them as dense arrays.
+        """
+        distributions = ODTripDistributions(
+            *self.get_time_interval_settings(), bin_edges=bin_edges)
+        column_names = [
+            MiVehTrajectoryColumns.ORIGIN_CENTROID_INTERNAL_ID.value,
+            MiVehTrajectoryColumns.DEST_CENTROID_INTERNAL_ID.value,
+            MiVehTrajectoryColumns.ENTRANCE_TIME.value,
+        ] + [column.value for column in distributions.metric_columns]
+        conditions = {}
+        if replication_ids is not None:
+            conditions[MiVehTrajectoryColumns.REPLICATION_INTERNAL_ID.value] = \
+                list(replication_ids)
+        if vehicle_type != ALL_VEHICLE_TYPES:
+            conditions[MiVehTrajectoryColumns.VEHICLE_TYPE.value] = \
+                vehicle_type
+        dtypes = {name: np.float64 for name in column_names[2:]}
+        for batch in self.vehicle_trajectories_table.iter_batches(
+                column_names, conditions, batch_size, dtypes):
+            distributions.update(batch)
+        return distributions
+
+    def get_system_metrics(
+        self,
+        time_intervals: Sequence[datetime.time] = None,
+        replication_ids: Sequence[int] = None,
+        column_names: Sequence[str] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+    ) -> np.ndarray:
+        """Get the mean and standard deviation of network-wide metrics over
+        many time intervals and replications, with a single query on the
+        MISYS table. Used for Microsimulations.
+
+        Args:
+            time_intervals: Time intervals of when we want the data from. If
+                None, all time intervals of the simulation are used.
+            replication_ids: IDs of the replications we want the data from. If
+                None, all replications of the table are used.
+            column_names: Columns of the MISYS table to summarize, e.g.
+                MiSysColumns.FLOW.value. If None, all columns of the table
+                except the replication, vehicle type and time interval are
+                used.
+            vehicle_type: Type of vehicles included in the data.
+        Returns:
+            metrics: Structured array with one record per column, and fields
+                metric (name of the column), mean, std (with one degree of
+                freedom) and count (number of non-NaN values over the time
+                intervals and replications).
+        """
+        if column_names is None:
+            key_column_names = {
+                MiSysColumns.REPLICATION_INTERNAL_ID.value,
+                MiSysColumns.VEHICLE_TYPE.value,
+                MiSysColumns.TIME_INTERVAL.value, "oid", "eid"}
+            column_names = [
+                name for name in self.schema.get(
+                    self.system_table.table_name, [])
+                if name not in key_column_names]
+        column_names = list(column_names)
+        metrics = np.zeros(len(column_names), dtype=[
+            ("metric", f"U{max([len(name) for name in column_names] + [1])}"),
+            ("mean", np.float64), ("std", np.float64), ("count", np.int64)])
+        metrics["metric"] = column_names
+        if not column_names:
+            return metrics
+        time_interval_indices = self.__get_time_interval_indices(
+            time_intervals)
+        data, _ = self.system_table.get_dense_arrays(
+            column_names,
+            [MiSysColumns.REPLICATION_INTERNAL_ID.value,
+             MiSysColumns.TIME_INTERVAL.value],
+            {MiSysColumns.VEHICLE_TYPE.value: vehicle_type},
+            [replication_ids, time_interval_indices],
+        )
+        data = data.reshape(len(column_names), -1)
+        valid = ~np.isnan(data)
+        count = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, data, 0.0).sum(axis=1) / count
+            variance = np.where(
+                valid, data - mean[:, np.newaxis], 0.0) ** 2
+            std = np.sqrt(variance.sum(axis=1) / (count - 1))
+        metrics["mean"] = np.where(count > 0, mean, np.nan)
+        metrics["std"] = np.where(count > 1, std, np.nan)
+        metrics["count"] = count
+        return metrics
+
     def get_total_delay_time(self, time_interval: datetime.time) -> float:
         """Get total delay time across the network.
 
@@ -561,8 +2263,8 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
         return self.system_table.get_data_on_condition(
             MiSysColumns.DELAY_TIME.value,
             {
-                MiDetColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                MiDetColumns.TIME_INTERVAL.value: str(time_interval_int),
+                MiSysColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
+                MiSysColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
 
@@ -580,7 +2282,7 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             TotalRgapColumns.RGAP_INSTANT.value,
             {
                 TotalRgapColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                TotalRgapColumns.TIME_INTERVAL.value: str(time_interval_int),
+                TotalRgapColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
         return rgap_instant
@@ -599,7 +2301,7 @@ class AimsunMicroOutputDatabase(AimsunOutputDatabase):
             TotalRgapColumns.RGAP_EXPERIENCED.value,
             {
                 TotalRgapColumns.VEHICLE_TYPE.value: ALL_VEHICLE_TYPES,
-                TotalRgapColumns.TIME_INTERVAL.value: str(time_interval_int),
+                TotalRgapColumns.TIME_INTERVAL.value: time_interval_int,
             },
         )
         return rgap_experience
@@ -0,0 +1,536 @@
+"""Tests for postprocessing_util.
+
+The tests build a small SQLite file that mimics the layout of an Aimsun
+microsimulation output database (see output_database_test_util), then check
+that the data classes query it correctly.
+"""
+
+import concurrent.futures
+import os
+import sqlite3
+import unittest
+
+import numpy as np
+
+from calibration.output_database_test_util import (
+    DEST_CENTROID_IDS,
+    DETECTOR_EXTERNAL_IDS,
+    NUM_TIME_INTERVALS,
+    NUM_VEHICLES_PER_OD_INTERVAL,
+    ORIGIN_CENTROID_IDS,
+    REPLICATION_IDS,
+    SECTION_INTERNAL_IDS,
+    TIME_LIST,
+    OutputDatabaseTestCase,
+    detector_flow,
+    od_num_vehicles,
+    trip_travel_time,
+)
+from calibration.postprocessing_util import (
+    MAX_QUERY_PARAMETERS,
+    AimsunMicroOutputDatabase,
+    FetchMode,
+    MiDetColumns,
+    MicentDestinationColumns,
+    MicentOriginColumns,
+    MiSectColumns,
+    MiSysColumns,
+    MiVehTrajectoryColumns,
+    ODTripDistributions,
+    SQLiteConnectionPool,
+    SQLiteTable,
+    compute_replication_statistics,
+)
+from utils.aimsun_input_utils import CentroidConfiguration, CentroidConnection
+
+
+class TestAimsunMicroOutputDatabase(OutputDatabaseTestCase):
+    """Test the queries of AimsunMicroOutputDatabase against a small SQLite
+    file."""
+
+    def setUp(self):
+        super().setUp()
+        self.database_path = self.create_database("micro.sqlite")
+        self.database = AimsunMicroOutputDatabase(self.database_path)
+
+    def tearDown(self):
+        self.database.close()
+        super().tearDown()
+
+    def test_convert_times_to_int(self):
+        """Test that bulk time conversion matches convert_time_to_int()."""
+        self.assertEqual(
+            self.database.convert_times_to_int(TIME_LIST).tolist(),
+            [self.database.convert_time_to_int(time) for time in TIME_LIST])
+        self.assertEqual(
+            self.database.convert_times_to_int(TIME_LIST).tolist(),
+            [1, 2, 3, 4])
+
+    def test_get_detectors_data(self):
+        """Test that the bulk detector query returns the flow of every detector
+        at every time interval, averaged over replications."""
+        flow, detector_external_ids, time_interval_indices = \
+            self.database.get_detectors_flow(DETECTOR_EXTERNAL_IDS, TIME_LIST)
+        self.assertEqual(flow.shape, (len(DETECTOR_EXTERNAL_IDS),
+                                      len(TIME_LIST)))
+        self.assertEqual(list(detector_external_ids), DETECTOR_EXTERNAL_IDS)
+        self.assertEqual(time_interval_indices.tolist(), [1, 2, 3, 4])
+        for i in range(len(DETECTOR_EXTERNAL_IDS)):
+            for j in range(len(TIME_LIST)):
+                expected = np.mean([detector_flow(replication, i, j + 1)
+                                    for replication in REPLICATION_IDS])
+                self.assertAlmostEqual(flow[i, j], expected)
+
+        count, _, _ = self.database.get_detectors_data(
+            MiDetColumns.COUNT, DETECTOR_EXTERNAL_IDS[::-1], TIME_LIST[:2])
+        np.testing.assert_allclose(count, flow[::-1, :2] / 4)
+
+    def test_get_detectors_data_missing_detector(self):
+        """Test that unknown detectors are returned as NaN rows."""
+        flow, _, _ = self.database.get_detectors_flow(
+            ["flow_detector_unknown", DETECTOR_EXTERNAL_IDS[0]], TIME_LIST)
+        self.assertTrue(np.all(np.isnan(flow[0])))
+        self.assertFalse(np.any(np.isnan(flow[1])))
+
+    def test_road_section_getters(self):
+        """Test that the single-value getters query the right row."""
+        time = TIME_LIST[2]
+        self.assertAlmostEqual(
+            self.database.get_road_section_flow(SECTION_INTERNAL_IDS[1], time),
+            103.0)
+        self.assertAlmostEqual(
+            self.database.get_road_section_speed(SECTION_INTERNAL_IDS[1], time),
+            57.0)
+        self.assertAlmostEqual(
+            self.database.get_road_section_travel_time(
+                SECTION_INTERNAL_IDS[0], time), 13.0)
+        self.assertAlmostEqual(
+            self.database.get_detector_flow(DETECTOR_EXTERNAL_IDS[2], time),
+            detector_flow(REPLICATION_IDS[0], 2, 3))
+        self.assertAlmostEqual(
+            self.database.get_total_instantaneous_rgap(time), 0.03)
+
+    def test_ensure_indexes(self):
+        """Test that indexes are built once and used by the queries."""
+        flow_before, _, _ = self.database.get_detectors_flow()
+        build_times = self.database.ensure_indexes(
+            covered_column_names={"MIDETEC": ["flow"]})
+        self.assertIn("MIDETEC_sid_eid_ent_did_flow_index", build_times)
+        self.assertIn("MISYS_sid_ent_did_index", build_times)
+        self.assertTrue(all(seconds >= 0 for seconds in build_times.values()))
+        self.assertEqual(self.database.ensure_indexes(
+            covered_column_names={"MIDETEC": ["flow"]}), {})
+        self.assertTrue(set(build_times) <= set(self.database.indexes))
+        plan = self.database.database.execute(
+            "EXPLAIN QUERY PLAN SELECT flow FROM MIDETEC "
+            "WHERE sid = 0 AND eid = 'flow_detector_1' AND ent = 1").fetchall()
+        self.assertIn("INDEX", " ".join(str(row) for row in plan))
+        flow_after, _, _ = self.database.get_detectors_flow()
+        np.testing.assert_array_equal(flow_before, flow_after)
+
+    def test_ensure_indexes_sidecar(self):
+        """Test that building indexes in a sidecar copy leaves the original
+        database untouched."""
+        sidecar_path = os.path.join(self.directory.name, "micro_index.sqlite")
+        self.database.ensure_indexes(sidecar_path)
+        self.assertEqual(self.database.database_path, sidecar_path)
+        self.assertAlmostEqual(
+            self.database.get_total_experienced_rgap(TIME_LIST[0]), 0.02)
+        original = sqlite3.connect(self.database_path)
+        self.assertEqual(original.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'"
+        ).fetchone()[0], 0)
+        original.close()
+
+    def test_schema(self):
+        """Test that the schema is read at open time and used to validate
+        queries before they reach SQLite."""
+        self.assertEqual(self.database.schema["RGap"],
+                         ["did", "sid", "ent", "rgapinstantaneous",
+                          "rgapexperienced"])
+        self.assertIn("MIVEHTRAJECTORY", self.database.schema)
+        self.assertIs(self.database.get_table("MISECT"),
+                      self.database.sections_table)
+        with self.assertRaisesRegex(ValueError, "occupancy"):
+            self.database.sections_table.select(["occupancy"])
+        with self.assertRaisesRegex(ValueError, "MISECT"):
+            self.database.validate_columns(
+                "MISECT", [MiSectColumns.MEAN_SPEED, "countveh"])
+        with self.assertRaisesRegex(ValueError, "MASECT"):
+            self.database.validate_columns("MASECT", ["flow"])
+
+    def test_get(self):
+        """Test the generic accessor on a column without dedicated getter."""
+        density = self.database.get(
+            "MISECT", [MiSectColumns.SECTION_INTERNAL_ID, "ent", "density"],
+            {MiSectColumns.REPLICATION_INTERNAL_ID: REPLICATION_IDS[0],
+             "ent": [1, 2]})
+        self.assertEqual(density.dtype.names, ("oid", "ent", "density"))
+        self.assertEqual(len(density), 2 * len(SECTION_INTERNAL_IDS))
+        self.assertTrue(np.all(density["density"] == 3.0))
+        database = sqlite3.connect(self.database_path)
+        database.execute("UPDATE RGap SET sid = NULL "
+                         "WHERE rowid = (SELECT MAX(rowid) FROM RGap)")
+        database.commit()
+        database.close()
+        rgap = self.database.get("RGap", batch_size=3)
+        self.assertEqual(len(rgap),
+                         len(REPLICATION_IDS) * (NUM_TIME_INTERVALS + 1))
+        self.assertEqual(rgap.dtype.names, tuple(self.database.schema["RGap"]))
+        # The NULL in the last batch widens the whole column to float64.
+        self.assertEqual(rgap["sid"].dtype, np.float64)
+        self.assertTrue(np.isnan(rgap["sid"][-1]))
+        self.assertTrue(np.all(rgap["sid"][:-1] == 0))
+        self.assertEqual(len(self.database.get("RGap", ["did"], {"ent": 99})),
+                         0)
+        with self.assertRaises(ValueError):
+            self.database.get("MISECT", ["flow"], {"occupancy": 1})
+
+    def test_get_od_skim_matrices(self):
+        """Test that OD skim matrices follow the order of the centroid
+        configuration, from both centroid tables."""
+        centroid_configuration = CentroidConfiguration()
+        centroid_configuration.centroid_connection_list = []
+        centroid_internal_ids = DEST_CENTROID_IDS[::-1] \
+            + ORIGIN_CENTROID_IDS[::-1]
+        for internal_id in centroid_internal_ids:
+            centroid = CentroidConnection()
+            centroid.internal_id = internal_id
+            centroid_configuration.centroid_connection_list.append(centroid)
+        num_vehicles, travel_time, distance, centroid_ids, \
+            time_interval_indices = self.database.get_od_skim_matrices(
+                centroid_configuration, TIME_LIST[1:])
+        self.assertEqual(centroid_ids.tolist(), centroid_internal_ids)
+        self.assertEqual(time_interval_indices.tolist(), [2, 3, 4])
+        self.assertEqual(num_vehicles.shape, (5, 5, 3))
+        for origin, origin_id in enumerate(ORIGIN_CENTROID_IDS):
+            row = centroid_internal_ids.index(origin_id)
+            for destination, dest_id in enumerate(DEST_CENTROID_IDS):
+                column = centroid_internal_ids.index(dest_id)
+                np.testing.assert_allclose(
+                    num_vehicles[row, column],
+                    [od_num_vehicles(origin, destination, interval)
+                     for interval in [2, 3, 4]])
+                np.testing.assert_allclose(travel_time[row, column],
+                                           200.0 + origin)
+        np.testing.assert_allclose(distance, 2.0 * num_vehicles)
+        # Destinations are never origins in the test database.
+        self.assertTrue(np.all(np.isnan(num_vehicles[:3])))
+
+        num_vehicles_by_destination, origin_ids, dest_ids, _ = \
+            self.database.get_od_skim_matrix(
+                MicentDestinationColumns.NUM_VEHICLES, centroid_ids,
+                centroid_ids, TIME_LIST[1:])
+        np.testing.assert_array_equal(num_vehicles_by_destination,
+                                      num_vehicles)
+        _, origin_ids, dest_ids, time_interval_indices = \
+            self.database.get_od_skim_matrix(MicentOriginColumns.TRAVEL_TIME)
+        self.assertEqual(origin_ids.tolist(), ORIGIN_CENTROID_IDS)
+        self.assertEqual(dest_ids.tolist(), DEST_CENTROID_IDS)
+        self.assertEqual(time_interval_indices.tolist(), [1, 2, 3, 4])
+
+    def test_get_od_trip_distributions(self):
+        """Test the streamed travel and delay time distributions against a
+        direct computation."""
+        distributions = self.database.get_od_trip_distributions(
+            bin_edges=[0, 350, 400, 1000], batch_size=10)
+        count, mean, std, histogram, origin_ids, dest_ids = \
+            distributions.get_statistics(MiVehTrajectoryColumns.TRAVEL_TIME)
+        self.assertEqual(origin_ids.tolist(), ORIGIN_CENTROID_IDS)
+        self.assertEqual(dest_ids.tolist(), DEST_CENTROID_IDS)
+        self.assertEqual(count.shape, (len(ORIGIN_CENTROID_IDS),
+                                       len(DEST_CENTROID_IDS),
+                                       NUM_TIME_INTERVALS))
+        self.assertTrue(np.all(count == len(REPLICATION_IDS)
+                               * NUM_VEHICLES_PER_OD_INTERVAL))
+        for origin in range(len(ORIGIN_CENTROID_IDS)):
+            for destination in range(len(DEST_CENTROID_IDS)):
+                for interval in range(NUM_TIME_INTERVALS):
+                    travel_times = [trip_travel_time(
+                        replication, origin, destination, interval + 1,
+                        vehicle) for replication in REPLICATION_IDS
+                        for vehicle in range(NUM_VEHICLES_PER_OD_INTERVAL)]
+                    index = (origin, destination, interval)
+                    self.assertAlmostEqual(mean[index],
+                                           np.mean(travel_times))
+                    self.assertAlmostEqual(std[index],
+                                           np.std(travel_times, ddof=1))
+                    np.testing.assert_array_equal(
+                        histogram[index],
+                        np.histogram(travel_times, [0, 350, 400, 1000])[0])
+
+        count, mean, _, _, origin_ids, dest_ids = \
+            distributions.get_statistics(
+                MiVehTrajectoryColumns.DELAY_TIME, ORIGIN_CENTROID_IDS[::-1],
+                [DEST_CENTROID_IDS[0], 99])
+        self.assertEqual(origin_ids.tolist(), ORIGIN_CENTROID_IDS[::-1])
+        self.assertTrue(np.all(count[:, 1] == 0))
+        self.assertTrue(np.all(np.isnan(mean[:, 1])))
+        self.assertAlmostEqual(mean[1, 0, 0], np.mean([trip_travel_time(
+            replication, 0, 0, 1, vehicle) / 3
+            for replication in REPLICATION_IDS
+            for vehicle in range(NUM_VEHICLES_PER_OD_INTERVAL)]))
+
+        count, _, _, _, _, _ = self.database.get_od_trip_distributions(
+            REPLICATION_IDS[:1], vehicle_type=1).get_statistics(
+                MiVehTrajectoryColumns.TRAVEL_TIME)
+        self.assertTrue(np.all(count == 2))
+
+    def test_get_data_by_replication(self):
+        """Test that data is kept apart per replication."""
+        flow, replication_ids, detector_external_ids, time_interval_indices = \
+            self.database.get_detectors_data_by_replication(MiDetColumns.FLOW)
+        self.assertEqual(flow.shape, (len(REPLICATION_IDS),
+                                      len(DETECTOR_EXTERNAL_IDS),
+                                      NUM_TIME_INTERVALS))
+        self.assertEqual(replication_ids.tolist(), REPLICATION_IDS)
+        self.assertEqual(list(detector_external_ids), DETECTOR_EXTERNAL_IDS)
+        self.assertEqual(time_interval_indices.tolist(), [1, 2, 3, 4])
+        self.assertEqual(flow[1, 2, 0], detector_flow(REPLICATION_IDS[1], 2, 1))
+
+        speed, replication_ids, section_internal_ids, _ = \
+            self.database.get_sections_data_by_replication(
+                MiSectColumns.MEAN_SPEED, SECTION_INTERNAL_IDS[::-1],
+                TIME_LIST[:2], REPLICATION_IDS[1:])
+        self.assertEqual(speed.shape, (1, len(SECTION_INTERNAL_IDS), 2))
+        self.assertEqual(replication_ids.tolist(), REPLICATION_IDS[1:])
+        self.assertEqual(section_internal_ids.tolist(),
+                         SECTION_INTERNAL_IDS[::-1])
+        np.testing.assert_allclose(speed[0], [[59.0, 58.0], [59.0, 58.0]])
+
+    def test_get_system_metrics(self):
+        """Test the summary of all MISYS columns over intervals and
+        replications."""
+        metrics = self.database.get_system_metrics()
+        self.assertEqual(list(metrics["metric"]),
+                         ["flow", "ttime", "dtime", "speed", "density"])
+        delay_times = [5.0 * interval + replication
+                       for replication in REPLICATION_IDS
+                       for interval in range(1, NUM_TIME_INTERVALS + 1)]
+        np.testing.assert_allclose(metrics["mean"],
+                                   [1002.5, 70.0, np.mean(delay_times),
+                                    60.0, 4.0])
+        np.testing.assert_allclose(metrics["std"][2],
+                                   np.std(delay_times, ddof=1))
+        self.assertEqual(metrics["count"].tolist(), [8] * 5)
+
+        metrics = self.database.get_system_metrics(
+            TIME_LIST[:2], REPLICATION_IDS[1:], [MiSysColumns.DELAY_TIME.value])
+        self.assertEqual(metrics["count"].tolist(), [2])
+        np.testing.assert_allclose(metrics["mean"], [7.5 + REPLICATION_IDS[1]])
+
+
+class TestReadOnlyAimsunMicroOutputDatabase(OutputDatabaseTestCase):
+    """Test AimsunMicroOutputDatabase backed by a read-only connection
+    pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.database_path = self.create_database("micro.sqlite")
+        self.database = AimsunMicroOutputDatabase(
+            self.database_path, read_only=True, immutable=True, pool_size=2)
+
+    def tearDown(self):
+        self.database.close()
+        super().tearDown()
+
+    def test_same_data_as_read_write(self):
+        """Test that the pool returns the same data as a plain connection."""
+        self.assertIsInstance(self.database.database, SQLiteConnectionPool)
+        read_write_database = AimsunMicroOutputDatabase(self.database_path)
+        np.testing.assert_array_equal(
+            self.database.get_detectors_flow()[0],
+            read_write_database.get_detectors_flow()[0])
+        self.assertEqual(
+            self.database.get_total_delay_time(TIME_LIST[1]),
+            read_write_database.get_total_delay_time(TIME_LIST[1]))
+        read_write_database.close()
+
+    def test_parallel_queries(self):
+        """Test that several threads can query the database at once."""
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            flows = list(executor.map(
+                lambda detector_external_id: self.database.get_detector_flow(
+                    detector_external_id, TIME_LIST[0]),
+                DETECTOR_EXTERNAL_IDS * 4))
+        self.assertEqual(flows, [
+            detector_flow(REPLICATION_IDS[0], i, 1)
+            for i in range(len(DETECTOR_EXTERNAL_IDS))] * 4)
+
+    def test_fail_write(self):
+        """Test that pooled connections cannot modify the file."""
+        with self.database.database.connection() as connection:
+            with self.assertRaises(sqlite3.DatabaseError):
+                connection.execute("DELETE FROM MIDETEC")
+        with self.assertRaises(ValueError):
+            self.database.ensure_indexes()
+
+    def test_ensure_indexes_sidecar(self):
+        """Test that indexes of a read-only database go to a sidecar copy,
+        which is then queried through a new pool."""
+        sidecar_path = os.path.join(self.directory.name, "micro_index.sqlite")
+        self.assertTrue(self.database.ensure_indexes(sidecar_path))
+        self.assertIsInstance(self.database.database, SQLiteConnectionPool)
+        self.assertEqual(self.database.database.database_path, sidecar_path)
+        self.assertAlmostEqual(
+            self.database.get_total_experienced_rgap(TIME_LIST[0]), 0.02)
+
+
+class TestComputeReplicationStatistics(unittest.TestCase):
+    """Test the vectorized statistics across replications."""
+
+    def test_statistics(self):
+        """Test mean, standard deviation and confidence interval against a
+        direct computation, with one missing value."""
+        data = np.array([[1.0, 2.0], [3.0, np.nan], [5.0, 6.0]])
+        mean, std, ci_lower, ci_upper = compute_replication_statistics(data)
+        np.testing.assert_allclose(mean, [3.0, 4.0])
+        np.testing.assert_allclose(std, [2.0, np.sqrt(8.0)])
+        # t-quantiles for 2 and 1 degrees of freedom at 95% confidence.
+        half_width = np.array([4.302653 * 2.0 / np.sqrt(3),
+                               12.706205 * np.sqrt(8.0) / np.sqrt(2)])
+        np.testing.assert_allclose(ci_lower, mean - half_width, rtol=1e-5)
+        np.testing.assert_allclose(ci_upper, mean + half_width, rtol=1e-5)
+
+
+class TestODTripDistributions(unittest.TestCase):
+    """Test the single-pass trip distributions."""
+
+    def test_large_offset(self):
+        """Test that batches of trips whose times spread little around a large
+        mean give the same moments as a direct computation."""
+        travel_times = 1e9 + 0.1 * np.arange(10)
+        batch = np.zeros(len(travel_times), dtype=[
+            (column.value, float) for column in MiVehTrajectoryColumns])
+        batch[MiVehTrajectoryColumns.ORIGIN_CENTROID_INTERNAL_ID.value] = 1
+        batch[MiVehTrajectoryColumns.DEST_CENTROID_INTERNAL_ID.value] = 2
+        batch[MiVehTrajectoryColumns.ENTRANCE_TIME.value] = 30
+        batch[MiVehTrajectoryColumns.TRAVEL_TIME.value] = travel_times
+        batch[MiVehTrajectoryColumns.DELAY_TIME.value] = travel_times - 1e9
+        distributions = ODTripDistributions(0, 60, 1)
+        for chunk in np.array_split(batch, 4):
+            distributions.update(chunk)
+        for column, values in [
+                (MiVehTrajectoryColumns.TRAVEL_TIME, travel_times),
+                (MiVehTrajectoryColumns.DELAY_TIME, travel_times - 1e9)]:
+            count, mean, std, _, _, _ = distributions.get_statistics(column)
+            self.assertEqual(count.tolist(), [[[len(values)]]])
+            np.testing.assert_allclose(mean, [[[np.mean(values)]]])
+            np.testing.assert_allclose(std, [[[np.std(values, ddof=1)]]])
+
+
+class TestSQLiteTable(OutputDatabaseTestCase):
+    """Test the parameterized query layer of SQLiteTable."""
+
+    def setUp(self):
+        super().setUp()
+        self.database = sqlite3.connect(self.create_database("micro.sqlite"))
+        self.table = SQLiteTable(self.database, "MIDETEC")
+
+    def tearDown(self):
+        self.database.close()
+        super().tearDown()
+
+    def test_select_projection_and_in_filter(self):
+        """Test multi-column projections with equality and IN filters."""
+        rows = self.table.select(
+            ["eid", "ent", "flow"],
+            {"did": REPLICATION_IDS[0], "eid": DETECTOR_EXTERNAL_IDS[:2],
+             "ent": np.array([1, 2, 3])})
+        self.assertEqual(len(rows), 6)
+        for external_id, interval, flow in rows:
+            detector = DETECTOR_EXTERNAL_IDS.index(external_id)
+            self.assertAlmostEqual(
+                flow, detector_flow(REPLICATION_IDS[0], detector, interval))
+        self.assertEqual(self.table.select(["eid"], {"eid": []}), [])
+
+    def test_select_fetch_modes(self):
+        """Test that the fetch modes return the expected number of rows."""
+        conditions = {"did": REPLICATION_IDS[1], "ent": 1}
+        self.assertEqual(len(self.table.select(["flow"], conditions)),
+                         len(DETECTOR_EXTERNAL_IDS))
+        self.assertEqual(
+            len(self.table.select(["flow"], conditions, FetchMode.MANY, 2)), 2)
+        self.assertEqual(
+            len(self.table.select(["flow", "speed"], conditions,
+                                  FetchMode.ONE)), 2)
+        self.assertIsNone(
+            self.table.select(["flow"], {"ent": 99}, FetchMode.ONE))
+        with self.assertRaises(ValueError):
+            self.table.get_data_on_condition("flow", {"ent": 99})
+
+    def test_iter_batches(self):
+        """Test that streamed batches cover the same rows as select()."""
+        conditions = {"did": REPLICATION_IDS}
+        batches = list(self.table.iter_batches(
+            ["eid", "ent", "flow"], conditions, batch_size=7))
+        rows = self.table.select(["eid", "ent", "flow"], conditions)
+        self.assertEqual([len(batch) for batch in batches], [7, 7, 7, 7, 2])
+        self.assertEqual(batches[0].dtype.names, ("eid", "ent", "flow"))
+        self.assertEqual(batches[0]["ent"].dtype, np.int64)
+        self.assertEqual(batches[0]["flow"].dtype, np.float64)
+        self.assertEqual(
+            [row for batch in batches for row in batch.tolist()], rows)
+        self.assertEqual(list(self.table.iter_rows(
+            ["eid", "ent", "flow"], conditions, batch_size=4)), rows)
+        self.assertEqual(
+            list(self.table.iter_batches(["flow"], {"ent": 99})), [])
+        batch = next(self.table.iter_batches(
+            ["ent"], conditions, dtypes={"ent": np.int8}))
+        self.assertEqual(batch["ent"].dtype, np.int8)
+
+    def test_iter_batches_widen_dtype(self):
+        """Test that the type of a column widens when a later batch holds real
+        numbers, NULL or text."""
+        self.database.execute("CREATE TABLE MIXED (id INTEGER, flow)")
+        self.database.executemany("INSERT INTO MIXED VALUES (?, ?)", [
+            (1, 5), (2, 6), (3, 7.9), (4, None), (5, 8), (6, "text")])
+        table = SQLiteTable(self.database, "MIXED")
+        batches = list(table.iter_batches(["id", "flow"], batch_size=2))
+        self.assertEqual([batch["id"].dtype for batch in batches],
+                         [np.int64] * 3)
+        self.assertEqual([batch["flow"].dtype for batch in batches],
+                         [np.int64, np.float64, object])
+        np.testing.assert_array_equal(batches[1]["flow"], [7.9, np.nan])
+        self.assertEqual(batches[2]["flow"].tolist(), [8, "text"])
+        batches = list(table.iter_batches(
+            ["flow"], {"id": [1, 2, 3, 4]}, batch_size=3))
+        np.testing.assert_array_equal(batches[0]["flow"], [5, 6, 7.9])
+        np.testing.assert_array_equal(batches[1]["flow"], [np.nan])
+
+    def test_parameter_limit(self):
+        """Test that padded IN lists and axis filters keep queries within
+        SQLite's former default limit of bound parameters."""
+        self.database.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER,
+                               MAX_QUERY_PARAMETERS)
+        external_ids = DETECTOR_EXTERNAL_IDS + [
+            f"missing_detector_{i}" for i in range(600)]
+        rows = self.table.select(
+            ["eid"], {"did": REPLICATION_IDS[0], "ent": 1,
+                      "eid": external_ids})
+        self.assertEqual(len(rows), len(DETECTOR_EXTERNAL_IDS))
+        intervals = list(range(1, 401))
+        flow, (axis_external_ids, axis_intervals) = \
+            self.table.get_dense_array(
+                "flow", ["eid", "ent"], {"did": REPLICATION_IDS},
+                [external_ids, intervals])
+        self.assertEqual(flow.shape, (len(external_ids), len(intervals)))
+        self.assertEqual(list(axis_external_ids), external_ids)
+        for i in range(len(DETECTOR_EXTERNAL_IDS)):
+            for j in range(NUM_TIME_INTERVALS):
+                expected = np.mean([detector_flow(replication, i, j + 1)
+                                    for replication in REPLICATION_IDS])
+                self.assertAlmostEqual(flow[i, j], expected)
+        self.assertTrue(np.isnan(flow[len(DETECTOR_EXTERNAL_IDS):]).all())
+        self.assertTrue(np.isnan(flow[:, NUM_TIME_INTERVALS:]).all())
+
+    def test_fail_invalid_identifier(self):
+        """Test that column names cannot inject SQL."""
+        with self.assertRaises(ValueError):
+            self.table.select(["flow FROM MIDETEC; --"])
+        with self.assertRaises(ValueError):
+            self.table.select(["flow"], {"ent = 1 OR 1": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,313 @@
+"""Incremental statistics of Aimsun Microsimulation outputs across
+replications.
+
+Replications finish one at a time, each in its own output database (or a few
+per database). Instead of reading all databases again whenever one is added, a
+ReplicationAggregator keeps the count, mean and sum of squared deviations of
+every (object, time interval, metric) on disk, and folds each new database into
+them with the parallel form of Welford's online algorithm. Adding a database
+only reads that database:
+    >>> aggregator = ReplicationAggregator(
+    ...     "aggregates/detectors", "MIDETEC",
+    ...     [MiDetColumns.FLOW.value, MiDetColumns.SPEED.value])
+    >>> aggregator.add_database("replication_105.sqlite")
+    >>> count, mean, std, ci_lower, ci_upper = aggregator.get_statistics(
+    ...     MiDetColumns.FLOW.value)
+
+Replications already folded in are skipped, so adding the same database twice
+does not change the statistics. The mean arrays can be passed as simulated
+values to compute_goodness_of_fit() or FlowComparison, and to_table() gives
+the mean and standard deviation table of every metric.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from calibration.postprocessing_util import (
+    ALL_VEHICLE_TYPES,
+    AimsunMicroOutputDatabase,
+    MiDetColumns,
+    MiSectColumns,
+    get_axis_index,
+    merge_moments,
+)
+
+AGGREGATE_STATE_FILENAME = "replication_aggregates.npz"
+OBJECT_ID_COLUMNS = {
+    "MISECT": MiSectColumns.SECTION_INTERNAL_ID.value,
+    "MIDETEC": MiDetColumns.DETECTOR_EXTERNAL_ID.value,
+}
+
+
+def compute_moments(
+    data: np.ndarray, axis: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the number of values, mean and sum of squared deviations from
+    the mean of data along one axis, ignoring NaN.
+
+    Args:
+        data: Array of values, e.g. of shape (replications, objects, time
+            intervals).
+        axis: Axis to reduce.
+    Returns:
+        count: Number of non-NaN values.
+        mean: Mean of the values, NaN where there is none.
+        squared_deviation: Sum of squared deviations from the mean.
+    """
+    valid = ~np.isnan(data)
+    count = valid.sum(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, np.where(valid, data, 0.0).sum(axis=axis)
+                        / count, np.nan)
+    squared_deviation = (np.where(
+        valid, data - np.expand_dims(mean, axis), 0.0) ** 2).sum(axis=axis)
+    return count, mean, squared_deviation
+
+
+class ReplicationAggregator:
+    """Data class for the running statistics of metrics of a microsimulation
+    output table across replications, persisted in a directory.
+
+    The statistics are stored as dense arrays of shape (metrics, objects, time
+    intervals), along with the replications folded into them. The object and
+    time interval axes grow as databases with new objects or time intervals
+    are added.
+
+    Attributes:
+        directory: Directory where the statistics are stored.
+        table_name: Output table the metrics are read from, "MISECT" or
+            "MIDETEC".
+        column_names: Columns of the table whose statistics are kept.
+        vehicle_type: Type of vehicles included in the data.
+        replication_ids: IDs of the replications folded into the statistics,
+            in the order they were added.
+        object_ids: ID of the object (road section internal ID or detector
+            external ID) of each item of the second axis of the statistics.
+        time_interval_indices: Index in the simulation output database of the
+            time interval of each item of the last axis of the statistics.
+    """
+
+    directory: str
+    table_name: str
+    column_names: List[str]
+    vehicle_type: int
+    replication_ids: List[int]
+    object_ids: np.ndarray
+    time_interval_indices: np.ndarray
+
+    def __init__(
+        self, directory: str, table_name: str, column_names: Sequence[str],
+        vehicle_type: int = ALL_VEHICLE_TYPES
+    ):
+        if table_name not in OBJECT_ID_COLUMNS:
+            raise ValueError(
+                f"Unknown table {table_name}. Available tables: "
+                f"{list(OBJECT_ID_COLUMNS)}.")
+        self.directory = directory
+        self.table_name = table_name
+        self.column_names = list(column_names)
+        self.vehicle_type = vehicle_type
+        self.replication_ids = []
+        self.object_ids = np.array([], dtype=np.int64
+                                   if table_name == "MISECT" else str)
+        self.time_interval_indices = np.array([], dtype=np.int64)
+        shape = (len(self.column_names), 0, 0)
+        self.__count = np.zeros(shape, dtype=np.int64)
+        self.__mean = np.zeros(shape)
+        self.__squared_deviation = np.zeros(shape)
+        self.__load()
+
+    @property
+    def state_path(self) -> str:
+        """Path of the file the statistics are stored in."""
+        return os.path.join(self.directory, AGGREGATE_STATE_FILENAME)
+
+    def add_database(self, database_path: str) -> List[int]:
+        """Fold the replications of an output database into the statistics,
+        and store the statistics. Only this database is read, with a single
+        query.
+
+        Args:
+            database_path: Path to the Aimsun output sqlite file.
+        Returns:
+            replication_ids: IDs of the replications that were added.
+                Replications already folded into the statistics are skipped.
+        """
+        database = AimsunMicroOutputDatabase(database_path, read_only=True)
+        try:
+            database.validate_columns(self.table_name, self.column_names)
+            data, (replication_ids, object_ids, time_interval_indices) = \
+                database.get_table(self.table_name).get_dense_arrays(
+                    self.column_names,
+                    [MiSectColumns.REPLICATION_INTERNAL_ID.value,
+                     OBJECT_ID_COLUMNS[self.table_name],
+                     MiSectColumns.TIME_INTERVAL.value],
+                    {MiSectColumns.VEHICLE_TYPE.value: self.vehicle_type})
+        finally:
+            database.close()
+        is_new = ~np.isin(replication_ids, self.replication_ids)
+        if not np.any(is_new):
+            return []
+        count, mean, squared_deviation = compute_moments(
+            data[:, is_new], axis=1)
+
+        object_index = self.__extend_axis("object_ids", object_ids)
+        time_index = self.__extend_axis(
+            "time_interval_indices", time_interval_indices)
+        slots = (slice(None),) + np.ix_(object_index, time_index)
+        self.__count[slots], self.__mean[slots], \
+            self.__squared_deviation[slots] = merge_moments(
+                self.__count[slots], self.__mean[slots],
+                self.__squared_deviation[slots], count, mean,
+                squared_deviation)
+        added_replication_ids = [int(replication_id) for replication_id
+                                 in replication_ids[is_new]]
+        self.replication_ids += added_replication_ids
+        self.save()
+        return added_replication_ids
+
+    def add_databases(self, database_paths: Sequence[str]) -> List[int]:
+        """Fold the replications of several output databases into the
+        statistics. See add_database().
+
+        Args:
+            database_paths: Paths to the Aimsun output sqlite files.
+        Returns:
+            replication_ids: IDs of the replications that were added.
+        """
+        replication_ids = []
+        for database_path in database_paths:
+            replication_ids += self.add_database(database_path)
+        return replication_ids
+
+    def get_statistics(
+        self, column_name: str, confidence_level: float = 0.95
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get the statistics of one metric across the replications folded in
+        so far, with the same definitions as compute_replication_statistics().
+
+        Args:
+            column_name: Column of the metric, among column_names.
+            confidence_level: Confidence level of the confidence interval of
+                the mean, based on the Student t-distribution.
+        Returns:
+            count: Number of replications with data, of shape (objects, time
+                intervals).
+            mean: Mean across replications, NaN where there is no data.
+            std: Sample standard deviation across replications, NaN where
+                there are less than two replications with data.
+            ci_lower: Lower bound of the confidence interval of the mean.
+            ci_upper: Upper bound of the confidence interval of the mean.
+        """
+        metric = self.column_names.index(column_name)
+        count = self.__count[metric]
+        mean = np.where(count > 0, self.__mean[metric], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.where(count > 1, np.sqrt(
+                self.__squared_deviation[metric] / (count - 1)), np.nan)
+            half_width = stats.t.ppf((1 + confidence_level) / 2, count - 1) \
+                * std / np.sqrt(count)
+        return count, mean, std, mean - half_width, mean + half_width
+
+    def to_table(self) -> pd.DataFrame:
+        """Get the mean and standard deviation of every metric as a table.
+
+        Returns:
+            table: Table with one row per metric, object and time interval,
+                and columns metric, object_id, time_interval, count, mean and
+                std.
+        """
+        tables = []
+        for column_name in self.column_names:
+            count, mean, std, _, _ = self.get_statistics(column_name)
+            object_ids, time_interval_indices = np.meshgrid(
+                self.object_ids, self.time_interval_indices, indexing="ij")
+            tables.append(pd.DataFrame({
+                "metric": column_name,
+                "object_id": object_ids.reshape(-1),
+                "time_interval": time_interval_indices.reshape(-1),
+                "count": count.reshape(-1),
+                "mean": mean.reshape(-1),
+                "std": std.reshape(-1),
+            }))
+        return pd.concat(tables, ignore_index=True)
+
+    def save(self):
+        """Store the statistics in the directory. The file is replaced
+        atomically, so an interrupted save keeps the previous statistics."""
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f"{self.state_path}.tmp.npz"
+        np.savez(
+            temporary_path,
+            table_name=self.table_name,
+            column_names=np.array(self.column_names, dtype=str),
+            vehicle_type=self.vehicle_type,
+            replication_ids=np.array(self.replication_ids, dtype=np.int64),
+            object_ids=self.object_ids,
+            time_interval_indices=self.time_interval_indices,
+            count=self.__count,
+            mean=self.__mean,
+            squared_deviation=self.__squared_deviation,
+        )
+        os.replace(temporary_path, self.state_path)
+
+    def __load(self):
+        """Load the statistics stored in the directory, if any.
+
+        Raises:
+            ValueError: If the stored statistics were computed with another
+                table, columns or vehicle type.
+        """
+        if not os.path.isfile(self.state_path):
+            return
+        with np.load(self.state_path) as state:
+            settings = (str(state["table_name"]),
+                        state["column_names"].tolist(),
+                        int(state["vehicle_type"]))
+            if settings != (self.table_name, self.column_names,
+                            self.vehicle_type):
+                raise ValueError(
+                    f"The statistics in {self.directory} were computed with "
+                    f"table, columns and vehicle type {settings}.")
+            self.replication_ids = state["replication_ids"].tolist()
+            self.object_ids = state["object_ids"]
+            self.time_interval_indices = state["time_interval_indices"]
+            self.__count = state["count"]
+            self.__mean = state["mean"]
+            self.__squared_deviation = state["squared_deviation"]
+
+    def __extend_axis(self, axis_name: str, keys: np.ndarray) -> np.ndarray:
+        """Add the keys missing from one axis of the statistics, keeping it
+        sorted, and get the position of each key along the axis.
+
+        Args:
+            axis_name: "object_ids" or "time_interval_indices".
+            keys: Keys found in a database.
+        Returns:
+            index: Position of each key along the extended axis.
+        """
+        old_keys = getattr(self, axis_name)
+        new_keys = np.union1d(old_keys, keys)
+        if len(new_keys) > len(old_keys):
+            axis = 1 if axis_name == "object_ids" else 2
+            _, old_index = get_axis_index(old_keys, new_keys)
+            arrays = {}
+            for name, array in [("count", self.__count), ("mean", self.__mean),
+                                ("squared_deviation",
+                                 self.__squared_deviation)]:
+                shape = list(array.shape)
+                shape[axis] = len(new_keys)
+                arrays[name] = np.zeros(shape, dtype=array.dtype)
+                slots = [slice(None)] * 3
+                slots[axis] = old_index
+                arrays[name][tuple(slots)] = array
+            self.__count, self.__mean, self.__squared_deviation = \
+                arrays["count"], arrays["mean"], arrays["squared_deviation"]
+            setattr(self, axis_name, new_keys)
+        return get_axis_index(keys, new_keys)[1]
@@ -0,0 +1,137 @@
+"""Tests for replication_aggregation_util."""
+
+import os
+import unittest
+
+import numpy as np
+
+from calibration.output_database_test_util import (
+    DETECTOR_EXTERNAL_IDS,
+    REPLICATION_IDS,
+    OutputDatabaseTestCase,
+)
+from calibration.postprocessing_util import (
+    AimsunMicroOutputDatabase,
+    MiDetColumns,
+    compute_replication_statistics,
+)
+from calibration.replication_aggregation_util import (
+    ReplicationAggregator,
+    compute_moments,
+    merge_moments,
+)
+
+COLUMN_NAMES = [MiDetColumns.FLOW.value, MiDetColumns.SPEED.value]
+
+
+class TestMoments(unittest.TestCase):
+    """Test merging the moments of parts of a set of values."""
+
+    def test_merge_moments(self):
+        """Test that merging the moments of chunks gives the moments of all
+        values, with missing values."""
+        data = np.random.default_rng(0).normal(1000, 10, (7, 3, 2))
+        data[:5, 0, 0] = np.nan
+        data[:, 1, 1] = np.nan
+        expected = compute_moments(data)
+        moments = compute_moments(data[:0])
+        for chunk in [data[:1], data[1:4], data[4:]]:
+            moments = merge_moments(*moments, *compute_moments(chunk))
+        for actual_array, expected_array in zip(moments, expected):
+            np.testing.assert_allclose(actual_array, expected_array)
+        self.assertEqual(moments[0][1, 1], 0)
+        self.assertTrue(np.isnan(moments[1][1, 1]))
+
+
+class TestReplicationAggregator(OutputDatabaseTestCase):
+    """Test folding replications into the statistics one database at a
+    time."""
+
+    def setUp(self):
+        super().setUp()
+        self.full_database_path = self.create_database("all.sqlite")
+        # One database per replication. The second one has one more detector
+        # and one more time interval than the first one.
+        self.database_paths = []
+        for replication_id in REPLICATION_IDS:
+            queries = [("DELETE FROM MIDETEC WHERE did != ?",
+                        (replication_id,))]
+            if not self.database_paths:
+                queries.append(("DELETE FROM MIDETEC WHERE eid = ? OR ent = 4",
+                                (DETECTOR_EXTERNAL_IDS[-1],)))
+            self.database_paths.append(self.create_database(
+                f"{replication_id}.sqlite", queries))
+        self.state_directory = os.path.join(self.directory.name, "aggregates")
+
+    def __get_aggregator(self):
+        return ReplicationAggregator(
+            self.state_directory, "MIDETEC", COLUMN_NAMES)
+
+    def __get_expected_statistics(self, column_name):
+        database = AimsunMicroOutputDatabase(self.full_database_path)
+        data, _, detector_external_ids, _ = \
+            database.get_detectors_data_by_replication(MiDetColumns(
+                column_name))
+        database.close()
+        data[0, -1] = np.nan
+        data[0, :, -1] = np.nan
+        np.testing.assert_array_equal(detector_external_ids,
+                                      DETECTOR_EXTERNAL_IDS)
+        return compute_replication_statistics(data)
+
+    def test_add_databases(self):
+        """Test that the statistics match the ones computed from all
+        replications at once."""
+        aggregator = self.__get_aggregator()
+        self.assertEqual(aggregator.add_databases(self.database_paths),
+                         REPLICATION_IDS)
+        self.assertEqual(list(aggregator.object_ids), DETECTOR_EXTERNAL_IDS)
+        np.testing.assert_array_equal(aggregator.time_interval_indices,
+                                      [0, 1, 2, 3, 4])
+        for column_name in COLUMN_NAMES:
+            count, mean, std, ci_lower, ci_upper = \
+                aggregator.get_statistics(column_name)
+            # The statistics by replication do not include time interval 0.
+            np.testing.assert_array_equal(count[:-1, 1:-1], 2)
+            np.testing.assert_array_equal(count[-1], 1)
+            for actual, expected in zip(
+                    (mean, std, ci_lower, ci_upper),
+                    self.__get_expected_statistics(column_name)):
+                np.testing.assert_allclose(actual[:, 1:], expected)
+
+        table = aggregator.to_table()
+        self.assertEqual(len(table), 2 * len(DETECTOR_EXTERNAL_IDS) * 5)
+        self.assertEqual(list(table.columns), [
+            "metric", "object_id", "time_interval", "count", "mean", "std"])
+
+    def test_persisted_statistics(self):
+        """Test that the statistics are stored, and that replications already
+        folded in are skipped."""
+        aggregator = self.__get_aggregator()
+        aggregator.add_database(self.database_paths[0])
+        aggregator = self.__get_aggregator()
+        self.assertEqual(aggregator.replication_ids, REPLICATION_IDS[:1])
+        self.assertEqual(aggregator.add_databases(self.database_paths),
+                         REPLICATION_IDS[1:])
+        _, mean, std, _, _ = aggregator.get_statistics(
+            MiDetColumns.FLOW.value)
+
+        aggregator = self.__get_aggregator()
+        self.assertEqual(aggregator.add_database(self.database_paths[1]), [])
+        _, stored_mean, stored_std, _, _ = aggregator.get_statistics(
+            MiDetColumns.FLOW.value)
+        np.testing.assert_array_equal(stored_mean, mean)
+        np.testing.assert_array_equal(stored_std, std)
+
+    def test_different_settings(self):
+        """Test that statistics computed with other settings are rejected."""
+        self.__get_aggregator().add_database(self.database_paths[0])
+        with self.assertRaises(ValueError):
+            ReplicationAggregator(self.state_directory, "MIDETEC",
+                                  COLUMN_NAMES[:1])
+        with self.assertRaises(ValueError):
+            ReplicationAggregator(self.state_directory, "MISYS", COLUMN_NAMES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,593 @@
+"""Generate the tables of the report of a set of Aimsun Microsimulation
+scenarios.
+
+Each scenario output database is read once: one grouped query per output table
+(MISECT, MISYS and RGap) loads all the metrics of the report into memory, and
+every table of the report is computed from these arrays. The arrays of each
+database are cached in the output directory along with the fingerprint of the
+database, so regenerating the report only reads the databases that changed:
+    >>> report = ScenarioReport(
+    ...     {"System Fully Coordinated": "coordinated.sqlite",
+    ...      "System Fully Uncoordinated": "uncoordinated.sqlite"},
+    ...     "data/lv",
+    ...     road_groups={("Northbound", "Mission Boulevard"): [1053, 1054]})
+    >>> written_paths = report.generate()
+
+The tables follow the layout of data/lv: metric-by-road/<metric>,
+sys-hcm/all, emissions/emissions, rgap/rgap, section-ratio/mean-std and
+section-ratio/stat-test, each written as csv, md and tex. pandas needs the
+package tabulate to write md tables, and jinja2 to write tex tables from
+pandas 2.0 on.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import importlib.util
+import itertools
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calibration.emissions_util import EMISSION_METRICS, get_emissions_table
+from calibration.postprocessing_cache_util import get_file_fingerprint
+from calibration.postprocessing_util import (
+    ALL_VEHICLE_TYPES,
+    AimsunMicroOutputDatabase,
+    MiSectColumns,
+    MiSysColumns,
+    TotalRgapColumns,
+)
+from calibration.scenario_analysis_util import (
+    ScenarioSet,
+    compute_group_statistics,
+    compute_welch_t_tests,
+    get_section_group_masks,
+    stack_aligned_arrays,
+)
+from utils.aimsun_input_utils import InternalId
+
+OUTPUT_FORMATS = ("csv", "md", "tex")
+# Optional packages pandas needs to write each format. DataFrame.to_latex()
+# renders through Styler, which needs jinja2, since pandas 2.0.
+OUTPUT_FORMAT_PACKAGES = {
+    "csv": (),
+    "md": ("tabulate",),
+    "tex": ("jinja2",) if int(pd.__version__.split(".")[0]) >= 2 else (),
+}
+REPORT_MANIFEST_FILENAME = "report_manifest.json"
+REPORT_ARRAYS_DIRECTORY = ".report_arrays"
+
+# Columns of the MISECT table with one metric-by-road table each.
+METRIC_BY_ROAD_COLUMNS = (
+    "count", "density", "dtime", "flow", "speed", "travel", "ttime")
+# Label of the metrics of the section-ratio tables, with their MISECT column.
+SECTION_RATIO_METRICS = {
+    "Mean Flow (veh/h)": MiSectColumns.MEAN_FLOW.value,
+    "Mean Travel Time (s)": MiSectColumns.MEAN_TRAVEL_TIME.value,
+    "Mean Delay Time (s)": MiSectColumns.MEAN_DELAY_TIME.value,
+    "Mean Speed (km/h)": MiSectColumns.MEAN_SPEED.value,
+    "Density by Lane (veh/km)": MiSectColumns.DENSITY.value,
+}
+# Columns of the MISYS table in the sys-hcm table.
+SYSTEM_METRIC_COLUMNS = (
+    "density", "flow", "ttime", "dtime", "speed", "fuelc", "batteryc",
+    "travel", "queue_delay", "queue_length", "queued_vehicles", "nbstops",
+    "input_count", "totalWaitingTime", "vWait")
+# Label of the metrics of the rgap table, with their RGap column.
+RGAP_METRICS = {
+    "Instantaneous Relative Gap": TotalRgapColumns.RGAP_INSTANT.value,
+    "Experienced Relative Gap": TotalRgapColumns.RGAP_EXPERIENCED.value,
+}
+
+
+def get_missing_packages(formats: Sequence[str]) -> List[str]:
+    """Get the optional packages that are needed to write some formats but
+    are not installed.
+
+    Args:
+        formats: Formats among OUTPUT_FORMATS.
+    Returns:
+        packages: Sorted names of the missing packages.
+    """
+    return sorted({package for output_format in formats
+                   for package in OUTPUT_FORMAT_PACKAGES[output_format]
+                   if importlib.util.find_spec(package) is None})
+
+
+def extract_report_arrays(
+    database: AimsunMicroOutputDatabase,
+    section_column_names: Sequence[str],
+    system_column_names: Sequence[str],
+    rgap_column_names: Sequence[str],
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+) -> Dict[str, np.ndarray]:
+    """Load all the data of a report from one output database, with a single
+    query per output table. Can be passed to ScenarioSet.extract() to read
+    every database in its own worker.
+
+    Args:
+        database: Output database of the scenario.
+        section_column_names: Columns of the MISECT table to load.
+        system_column_names: Columns of the MISYS table to load.
+        rgap_column_names: Columns of the RGap table to load.
+        vehicle_type: Type of vehicles included in the data.
+    Returns:
+        arrays: Arrays keyed by name:
+            sections: Array of shape (section columns, road sections, time
+                intervals).
+            section_internal_ids: Internal ID of each road section.
+            system: Array of shape (system columns, time intervals).
+            rgap: Array of shape (rgap columns, time intervals).
+            time_interval_indices: Index in the simulation output database of
+                each time interval.
+        Columns missing from the database are filled with NaN.
+    """
+    _, _, num_time_intervals = database.get_time_interval_settings()
+    time_interval_indices = np.arange(1, num_time_intervals + 1)
+    arrays = {"time_interval_indices": time_interval_indices}
+    for name, table, column_names, axis_column_names in [
+        ("sections", database.sections_table, section_column_names,
+         [MiSectColumns.SECTION_INTERNAL_ID.value,
+          MiSectColumns.TIME_INTERVAL.value]),
+        ("system", database.system_table, system_column_names,
+         [MiSysColumns.TIME_INTERVAL.value]),
+        ("rgap", database.total_rgap_table, rgap_column_names,
+         [TotalRgapColumns.TIME_INTERVAL.value]),
+    ]:
+        available = database.schema.get(table.table_name, [])
+        found = [i for i, column_name in enumerate(column_names)
+                 if column_name in available]
+        axis_values = [None] * (len(axis_column_names) - 1) \
+            + [time_interval_indices]
+        if found:
+            # All output tables name the vehicle type column "sid".
+            data, all_axis_values = table.get_dense_arrays(
+                [column_names[i] for i in found], axis_column_names,
+                {MiSectColumns.VEHICLE_TYPE.value: vehicle_type}, axis_values)
+        else:
+            all_axis_values = [np.array([], dtype=int)] * (
+                len(axis_column_names) - 1) + [time_interval_indices]
+            data = np.empty((0,) + tuple(
+                len(values) for values in all_axis_values))
+        arrays[name] = np.full(
+            (len(column_names),) + data.shape[1:], np.nan)
+        arrays[name][found] = data
+        if name == "sections":
+            arrays["section_internal_ids"] = all_axis_values[0]
+    return arrays
+
+
+class ReportTable:
+    """Data class for one table of a report.
+
+    Attributes:
+        data: Content of the table. Tables with mean and std columns are
+            rendered with a single "mean ± 2 std" interval column in the md
+            and tex formats.
+        index_column_names: Columns used as (multirow) index in the tex
+            format.
+    """
+
+    data: pd.DataFrame
+    index_column_names: List[str]
+
+    def __init__(self, data: pd.DataFrame, index_column_names: List[str]):
+        self.data = data
+        self.index_column_names = list(index_column_names)
+
+    def to_display_table(self, plus_minus: str) -> pd.DataFrame:
+        """Replace the mean and std columns with an interval column.
+
+        Args:
+            plus_minus: Symbol between the mean and twice the std.
+        Returns:
+            table: Table to render in the md and tex formats.
+        """
+        if not {"mean", "std"} <= set(self.data.columns):
+            return self.data
+        table = self.data.drop(columns=["mean", "std"])
+        table["Interval"] = [
+            f"{mean:.2f} {plus_minus} {2 * std:.2f}"
+            for mean, std in zip(self.data["mean"], self.data["std"])]
+        return table
+
+    def to_csv(self) -> str:
+        """Render the table in csv format."""
+        return self.data.to_csv(index=False)
+
+    def to_md(self) -> str:
+        """Render the table in markdown format."""
+        return self.to_display_table("±").rename(
+            columns=str.capitalize).to_markdown(index=False)
+
+    def to_tex(self) -> str:
+        """Render the table in LaTeX format."""
+        return self.to_display_table(r"$\pm$").set_index(
+            self.index_column_names).rename(
+            columns=lambda name: name.replace("_", " ").capitalize()
+        ).to_latex(multirow=True, escape=False)
+
+
+def _get_mean_std_table(
+    key_columns: Dict[str, Sequence[Any]], mean: np.ndarray, std: np.ndarray
+) -> ReportTable:
+    """Build a table with one row per item of mean and std, whose axes are
+    indexed by key_columns in order."""
+    grids = np.meshgrid(*[np.arange(len(values))
+                          for values in key_columns.values()], indexing="ij")
+    data = pd.DataFrame({
+        name: [values[i] for i in grid.reshape(-1)]
+        for (name, values), grid in zip(key_columns.items(), grids)})
+    data["mean"] = mean.reshape(-1)
+    data["std"] = std.reshape(-1)
+    return ReportTable(data, list(key_columns))
+
+
+def compute_report_tables(
+    scenario_arrays: Dict[str, Dict[str, np.ndarray]],
+    road_groups: Dict[Tuple[str, str], Sequence[InternalId]] = None,
+    metric_by_road_columns: Sequence[str] = METRIC_BY_ROAD_COLUMNS,
+    section_ratio_metrics: Dict[str, str] = None,
+    system_metric_columns: Sequence[str] = SYSTEM_METRIC_COLUMNS,
+    rgap_metrics: Dict[str, str] = None,
+    emission_metrics: Dict[str, str] = None,
+) -> Dict[str, ReportTable]:
+    """Compute all the tables of a report from the arrays loaded by
+    extract_report_arrays().
+
+    Args:
+        scenario_arrays: Arrays of each scenario, keyed by scenario name. The
+            section columns must be the union of metric_by_road_columns and
+            the columns of section_ratio_metrics, in order, and the system
+            columns those given by get_system_column_names().
+        road_groups: Internal IDs of the road sections of each road, keyed by
+            (direction, road). If None, no metric-by-road table is computed.
+        metric_by_road_columns: MISECT columns with a metric-by-road table.
+        section_ratio_metrics: MISECT column of each metric of the
+            section-ratio tables, keyed by label. Defaults to
+            SECTION_RATIO_METRICS.
+        system_metric_columns: MISYS columns of the sys-hcm table.
+        rgap_metrics: RGap column of each metric of the rgap table, keyed by
+            label. Defaults to RGAP_METRICS.
+        emission_metrics: MISYS column of each metric of the emissions table,
+            keyed by label. Defaults to EMISSION_METRICS.
+    Returns:
+        tables: Tables keyed by path relative to the output directory,
+            without extension, e.g. "metric-by-road/flow".
+    """
+    if section_ratio_metrics is None:
+        section_ratio_metrics = SECTION_RATIO_METRICS
+    if rgap_metrics is None:
+        rgap_metrics = RGAP_METRICS
+    if emission_metrics is None:
+        emission_metrics = EMISSION_METRICS
+    section_column_names = get_section_column_names(
+        metric_by_road_columns, section_ratio_metrics)
+    scenario_names = list(scenario_arrays)
+    sections, (_, section_internal_ids, _) = stack_aligned_arrays([
+        (arrays["sections"], np.arange(len(section_column_names)),
+         arrays["section_internal_ids"], arrays["time_interval_indices"])
+        for arrays in scenario_arrays.values()])
+    tables = {}
+
+    if road_groups is not None:
+        _, road_masks = get_section_group_masks(
+            section_internal_ids, road_groups)
+        mean, std = compute_group_statistics(sections, road_masks)
+        directions = list(dict.fromkeys(key[0] for key in road_groups))
+        roads = list(dict.fromkeys(key[1] for key in road_groups))
+        for column_name in metric_by_road_columns:
+            column_index = section_column_names.index(column_name)
+            # Rows are ordered by direction, then road, then scenario.
+            rows = [(direction, road, scenario_index, group_index)
+                    for direction in directions for road in roads
+                    for group_index, key in enumerate(road_groups)
+                    if key == (direction, road)
+                    for scenario_index in range(len(scenario_names))]
+            data = pd.DataFrame({
+                "direction": [row[0] for row in rows],
+                "road": [row[1] for row in rows],
+                "scenario": [scenario_names[row[2]] for row in rows],
+                "mean": [mean[row[2], column_index, row[3]] for row in rows],
+                "std": [std[row[2], column_index, row[3]] for row in rows],
+            })
+            tables[f"metric-by-road/{column_name}"] = ReportTable(
+                data, ["direction", "road", "scenario"])
+
+    all_sections = np.ones((1, len(section_internal_ids)), dtype=bool)
+    ratio_index = [section_column_names.index(column_name)
+                   for column_name in section_ratio_metrics.values()]
+    ratio_data = sections[:, ratio_index]
+    mean, std = compute_group_statistics(ratio_data, all_sections)
+    metric_names = list(section_ratio_metrics)
+    tables["section-ratio/mean-std"] = _get_mean_std_table(
+        {"metric": metric_names, "scenario": scenario_names},
+        mean[..., 0].T, std[..., 0].T)
+    pairs = list(itertools.combinations(range(len(scenario_names)), 2))
+    if pairs:
+        t_statistic, p_value, _ = compute_welch_t_tests(
+            ratio_data, all_sections, np.array(pairs))
+        tables["section-ratio/stat-test"] = ReportTable(pd.DataFrame({
+            "metric": np.repeat(metric_names, len(pairs)),
+            "scenario_1": [scenario_names[pair[0]]
+                           for pair in pairs] * len(metric_names),
+            "scenario_2": [scenario_names[pair[1]]
+                           for pair in pairs] * len(metric_names),
+            "t_statistic": t_statistic[..., 0].T.reshape(-1),
+            "p_value": p_value[..., 0].T.reshape(-1),
+        }), ["metric"])
+
+    # The system-wide tables have no road section axis: use one section.
+    system_column_names = get_system_column_names(
+        system_metric_columns, emission_metrics)
+    for path, key, metric_names, index in [
+        ("sys-hcm/all", "system", list(system_metric_columns),
+         [system_column_names.index(column_name)
+          for column_name in system_metric_columns]),
+        ("rgap/rgap", "rgap", list(rgap_metrics),
+         list(range(len(rgap_metrics)))),
+    ]:
+        data, _ = stack_aligned_arrays([
+            (arrays[key][index], np.arange(len(metric_names)),
+             arrays["time_interval_indices"])
+            for arrays in scenario_arrays.values()])
+        mean, std = compute_group_statistics(
+            data[:, :, np.newaxis, :], np.ones((1, 1), dtype=bool))
+        tables[path] = _get_mean_std_table(
+            {"metric": metric_names, "scenario": scenario_names},
+            mean[..., 0].T, std[..., 0].T)
+    tables["emissions/emissions"] = ReportTable(get_emissions_table(
+        {name: arrays["system"] for name, arrays in scenario_arrays.items()},
+        emission_metrics, system_column_names), ["metric", "scenario"])
+    return tables
+
+
+def get_section_column_names(
+    metric_by_road_columns: Sequence[str], section_ratio_metrics: Dict[str, str]
+) -> List[str]:
+    """Get the MISECT columns needed by all the tables of a report, without
+    duplicates."""
+    return list(dict.fromkeys(
+        list(metric_by_road_columns) + list(section_ratio_metrics.values())))
+
+
+def get_system_column_names(
+    system_metric_columns: Sequence[str], emission_metrics: Dict[str, str]
+) -> List[str]:
+    """Get the MISYS columns needed by all the tables of a report, without
+    duplicates."""
+    return list(dict.fromkeys(
+        list(system_metric_columns) + list(emission_metrics.values())))
+
+
+def _write_if_changed(path: str, render: Callable[[], str]) -> Optional[str]:
+    """Render a table and write it unless the file already has this content,
+    so that unchanged outputs keep their modification time.
+
+    Returns:
+        path: Path of the file if it was written, None otherwise.
+    """
+    content = render()
+    if os.path.isfile(path):
+        with open(path, encoding="utf-8") as file:
+            if file.read() == content:
+                return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(content)
+    return path
+
+
+class ScenarioReport:
+    """Data class for the report of a set of scenarios.
+
+    Attributes:
+        scenario_database_paths: Path to the output database of each scenario,
+            keyed by scenario name, in the order of the rows of the tables.
+        output_directory: Directory where the tables are written.
+        road_groups: Internal IDs of the road sections of each road, keyed by
+            (direction, road). If None, no metric-by-road table is written.
+        metric_by_road_columns: MISECT columns with a metric-by-road table.
+        section_ratio_metrics: MISECT column of each metric of the
+            section-ratio tables, keyed by label.
+        system_metric_columns: MISYS columns of the sys-hcm table.
+        rgap_metrics: RGap column of each metric of the rgap table, keyed by
+            label.
+        emission_metrics: MISYS column of each metric of the emissions table,
+            keyed by label.
+        vehicle_type: Type of vehicles included in the data.
+        formats: Formats each table is written in, among OUTPUT_FORMATS.
+        max_workers: Maximum number of worker processes reading databases.
+    """
+
+    scenario_database_paths: Dict[str, str]
+    output_directory: str
+    road_groups: Optional[Dict[Tuple[str, str], List[InternalId]]]
+    metric_by_road_columns: List[str]
+    section_ratio_metrics: Dict[str, str]
+    system_metric_columns: List[str]
+    rgap_metrics: Dict[str, str]
+    emission_metrics: Dict[str, str]
+    vehicle_type: int
+    formats: List[str]
+    max_workers: Optional[int]
+
+    def __init__(
+        self,
+        scenario_database_paths: Dict[str, str],
+        output_directory: str,
+        road_groups: Dict[Tuple[str, str], Sequence[InternalId]] = None,
+        metric_by_road_columns: Sequence[str] = METRIC_BY_ROAD_COLUMNS,
+        section_ratio_metrics: Dict[str, str] = None,
+        system_metric_columns: Sequence[str] = SYSTEM_METRIC_COLUMNS,
+        rgap_metrics: Dict[str, str] = None,
+        emission_metrics: Dict[str, str] = None,
+        vehicle_type: int = ALL_VEHICLE_TYPES,
+        formats: Sequence[str] = OUTPUT_FORMATS,
+        max_workers: int = None,
+    ):
+        unknown_formats = set(formats) - set(OUTPUT_FORMATS)
+        if unknown_formats:
+            raise ValueError(
+                f"Unknown formats {sorted(unknown_formats)}. Available "
+                f"formats: {list(OUTPUT_FORMATS)}.")
+        missing_packages = get_missing_packages(formats)
+        if missing_packages:
+            raise ValueError(
+                f"Writing the formats {list(formats)} requires the packages "
+                f"{missing_packages}, which are not installed.")
+        self.scenario_database_paths = dict(scenario_database_paths)
+        self.output_directory = output_directory
+        self.road_groups = None if road_groups is None else {
+            tuple(key): list(section_ids)
+            for key, section_ids in road_groups.items()}
+        self.metric_by_road_columns = list(metric_by_road_columns)
+        self.section_ratio_metrics = dict(
+            SECTION_RATIO_METRICS if section_ratio_metrics is None
+            else section_ratio_metrics)
+        self.system_metric_columns = list(system_metric_columns)
+        self.rgap_metrics = dict(
+            RGAP_METRICS if rgap_metrics is None else rgap_metrics)
+        self.emission_metrics = dict(
+            EMISSION_METRICS if emission_metrics is None
+            else emission_metrics)
+        self.vehicle_type = vehicle_type
+        self.formats = list(formats)
+        self.max_workers = max_workers
+
+    def generate(self, force: bool = False) -> List[str]:
+        """Generate the tables of the report.
+
+        Only the databases that changed since the last generation are read,
+        each with one query per output table. The tables are then computed
+        from the arrays of all scenarios and written in all formats in
+        parallel. Files whose content is unchanged are not rewritten.
+
+        Args:
+            force: Whether to read all databases and render all tables even if
+                nothing changed.
+        Returns:
+            written_paths: Paths of the files that were written.
+        """
+        manifest = self.__read_manifest()
+        extraction_settings = self.__get_extraction_settings()
+        settings = self.__get_settings()
+        arrays_directory = os.path.join(
+            self.output_directory, REPORT_ARRAYS_DIRECTORY)
+
+        scenarios = {}
+        stale_database_paths = {}
+        for i, (name, database_path) in enumerate(
+                self.scenario_database_paths.items()):
+            arrays_path = os.path.join(arrays_directory, f"{i}.npz")
+            scenarios[name] = {
+                "database_path": os.path.abspath(database_path),
+                "fingerprint": get_file_fingerprint(
+                    database_path, with_hash=False),
+                "arrays_path": arrays_path,
+            }
+            if force or manifest.get("extraction_settings") \
+                    != extraction_settings \
+                    or manifest.get("scenarios", {}).get(name) \
+                    != scenarios[name] \
+                    or not os.path.isfile(arrays_path):
+                stale_database_paths[name] = database_path
+        output_paths = [
+            os.path.join(self.output_directory, f"{path}.{output_format}")
+            for path in self.__get_table_paths()
+            for output_format in self.formats]
+        if not stale_database_paths and manifest.get("settings") == settings \
+                and all(os.path.isfile(path) for path in output_paths):
+            return []
+
+        # Read the databases that changed, each once, in parallel.
+        extracted = ScenarioSet(stale_database_paths, self.max_workers).extract(
+            extract_report_arrays,
+            get_section_column_names(self.metric_by_road_columns,
+                                     self.section_ratio_metrics),
+            get_system_column_names(self.system_metric_columns,
+                                    self.emission_metrics),
+            list(self.rgap_metrics.values()),
+            self.vehicle_type) if stale_database_paths else {}
+        os.makedirs(arrays_directory, exist_ok=True)
+        scenario_arrays = {}
+        for name, scenario in scenarios.items():
+            if name in extracted:
+                scenario_arrays[name] = extracted[name]
+                np.savez(scenario["arrays_path"], **extracted[name])
+            else:
+                with np.load(scenario["arrays_path"]) as arrays:
+                    scenario_arrays[name] = dict(arrays)
+
+        tables = compute_report_tables(
+            scenario_arrays, self.road_groups, self.metric_by_road_columns,
+            self.section_ratio_metrics, self.system_metric_columns,
+            self.rgap_metrics, self.emission_metrics)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(
+                    _write_if_changed,
+                    os.path.join(self.output_directory,
+                                 f"{path}.{output_format}"),
+                    getattr(table, f"to_{output_format}"))
+                for path, table in tables.items()
+                for output_format in self.formats]
+            written_paths = [future.result() for future in futures]
+
+        # Written last, so an interrupted generation is redone entirely.
+        with open(os.path.join(self.output_directory,
+                               REPORT_MANIFEST_FILENAME), "w") as file:
+            json.dump({"extraction_settings": extraction_settings,
+                       "settings": settings, "scenarios": scenarios},
+                      file, indent=2)
+        return [path for path in written_paths if path is not None]
+
+    def __get_table_paths(self) -> List[str]:
+        """Get the path of each table relative to the output directory, without
+        extension."""
+        paths = []
+        if self.road_groups is not None:
+            paths += [f"metric-by-road/{column_name}"
+                      for column_name in self.metric_by_road_columns]
+        paths.append("section-ratio/mean-std")
+        if len(self.scenario_database_paths) > 1:
+            paths.append("section-ratio/stat-test")
+        return paths + ["sys-hcm/all", "rgap/rgap", "emissions/emissions"]
+
+    def __get_extraction_settings(self) -> Dict[str, Any]:
+        """Get the settings that determine the arrays read from a database."""
+        return {
+            "section_column_names": get_section_column_names(
+                self.metric_by_road_columns, self.section_ratio_metrics),
+            "system_column_names": get_system_column_names(
+                self.system_metric_columns, self.emission_metrics),
+            "rgap_column_names": list(self.rgap_metrics.values()),
+            "vehicle_type": self.vehicle_type,
+        }
+
+    def __get_settings(self) -> Dict[str, Any]:
+        """Get the settings that determine the tables computed from the
+        arrays."""
+        return {
+            "scenario_names": list(self.scenario_database_paths),
+            "road_groups": None if self.road_groups is None else [
+                [list(key), [int(section_id) for section_id in section_ids]]
+                for key, section_ids in self.road_groups.items()],
+            "section_ratio_metrics": self.section_ratio_metrics,
+            "rgap_metrics": self.rgap_metrics,
+            "emission_metrics": self.emission_metrics,
+            "formats": self.formats,
+        }
+
+    def __read_manifest(self) -> Dict[str, Any]:
+        """Read the manifest of the last generation, or return an empty one."""
+        manifest_path = os.path.join(
+            self.output_directory, REPORT_MANIFEST_FILENAME)
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path) as file:
+            return json.load(file)
@@ -0,0 +1,146 @@
+"""Tests for report_util."""
+
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from calibration import report_util
+from calibration.output_database_test_util import (
+    SECTION_INTERNAL_IDS,
+    OutputDatabaseTestCase,
+)
+from calibration.report_util import ScenarioReport
+
+SCENARIO_NAMES = ["Fully Coordinated", "Fully Uncoordinated"]
+ROAD_GROUPS = {("Northbound", "Road A"): [SECTION_INTERNAL_IDS[0]],
+               ("Southbound", "Road A"): [SECTION_INTERNAL_IDS[1]]}
+
+
+class TestScenarioReport(OutputDatabaseTestCase):
+    """Test the generation of the report tables from scenario databases."""
+
+    def setUp(self):
+        super().setUp()
+        self.output_directory = os.path.join(self.directory.name, "report")
+        self.scenario_database_paths = {
+            scenario_name: self.create_database(f"{i}.sqlite", [(
+                "UPDATE MISYS SET flow = flow + ?", (10 * i,))])
+            for i, scenario_name in enumerate(SCENARIO_NAMES)}
+
+    @staticmethod
+    def __execute(database_path, query, parameters=()):
+        database = sqlite3.connect(database_path)
+        database.execute(query, parameters)
+        database.commit()
+        database.close()
+
+    def __get_report(self, formats=("csv",)):
+        return ScenarioReport(
+            self.scenario_database_paths, self.output_directory, ROAD_GROUPS,
+            formats=formats, max_workers=1)
+
+    def __read_csv(self, path):
+        return pd.read_csv(os.path.join(self.output_directory, f"{path}.csv"))
+
+    def test_generate(self):
+        """Test that all tables are computed from the databases."""
+        written_paths = self.__get_report().generate()
+        self.assertEqual(len(written_paths), 12)
+
+        # MISYS flow is 1000 + interval (+ 10 in the second scenario).
+        table = self.__read_csv("sys-hcm/all")
+        flow = table[table["metric"] == "flow"]
+        self.assertEqual(list(flow["scenario"]), SCENARIO_NAMES)
+        np.testing.assert_allclose(flow["mean"], [1002.5, 1012.5])
+        np.testing.assert_allclose(
+            flow["std"], np.std([1, 2, 3, 4], ddof=1))
+        # Columns missing from the database are left empty.
+        self.assertTrue(table[table["metric"] == "fuelc"]["mean"].isna().all())
+
+        # MISECT flow is 100 * section + interval.
+        table = self.__read_csv("metric-by-road/flow")
+        self.assertEqual(list(table.columns),
+                         ["direction", "road", "scenario", "mean", "std"])
+        self.assertEqual(list(table["direction"]),
+                         ["Northbound"] * 2 + ["Southbound"] * 2)
+        np.testing.assert_allclose(table["mean"],
+                                   [2.5, 2.5, 102.5, 102.5])
+
+        table = self.__read_csv("rgap/rgap")
+        np.testing.assert_allclose(table["mean"], [0.025] * 2 + [0.05] * 2)
+
+        table = self.__read_csv("section-ratio/mean-std")
+        self.assertEqual(table["metric"][0], "Mean Flow (veh/h)")
+        np.testing.assert_allclose(table["mean"][0], 52.5)
+
+        # The scenarios only differ in MISYS, so no section metric differs.
+        table = self.__read_csv("section-ratio/stat-test")
+        self.assertEqual(len(table), len(report_util.SECTION_RATIO_METRICS))
+        self.assertEqual(list(table["scenario_1"].unique()),
+                         [SCENARIO_NAMES[0]])
+        np.testing.assert_allclose(table["t_statistic"][:-1], 0.0)
+        # Density is constant, so its test is undefined.
+        self.assertTrue(np.isnan(table["t_statistic"].iloc[-1]))
+
+    def test_generate_only_reads_changed_databases(self):
+        """Test that regenerating the report only reads the databases that
+        changed, and only rewrites the tables whose content changed."""
+        report = self.__get_report()
+        report.generate()
+        with mock.patch.object(
+                report_util, "extract_report_arrays",
+                wraps=report_util.extract_report_arrays) as extract:
+            self.assertEqual(report.generate(), [])
+            extract.assert_not_called()
+
+            self.__execute(
+                self.scenario_database_paths[SCENARIO_NAMES[1]],
+                "UPDATE RGap SET rgapinstantaneous = 1.0 WHERE sid = 0")
+            written_paths = report.generate()
+            self.assertEqual(extract.call_count, 1)
+        self.assertEqual(written_paths, [
+            os.path.join(self.output_directory, "rgap/rgap.csv")])
+        table = self.__read_csv("rgap/rgap")
+        np.testing.assert_allclose(table["mean"], [0.025, 1.0, 0.05, 0.05])
+
+    def test_generate_force(self):
+        """Test that force reads every database again."""
+        report = self.__get_report()
+        report.generate()
+        with mock.patch.object(
+                report_util, "extract_report_arrays",
+                wraps=report_util.extract_report_arrays) as extract:
+            self.assertEqual(report.generate(force=True), [])
+            self.assertEqual(extract.call_count, len(SCENARIO_NAMES))
+
+    def test_unknown_format(self):
+        """Test that unknown formats are rejected."""
+        with self.assertRaises(ValueError):
+            self.__get_report(formats=("csv", "xlsx"))
+
+    def test_missing_package(self):
+        """Test that formats whose packages are not installed are rejected
+        before any database is read."""
+        with mock.patch.object(report_util.importlib.util, "find_spec",
+                               return_value=None):
+            with self.assertRaisesRegex(ValueError, "tabulate"):
+                ScenarioReport(self.scenario_database_paths,
+                               self.output_directory, ROAD_GROUPS)
+            self.__get_report(formats=("csv",))
+
+    def test_generate_md_tex(self):
+        """Test the interval column of the md and tex tables."""
+        self.__get_report(formats=("md", "tex")).generate()
+        with open(os.path.join(self.output_directory, "rgap/rgap.md")) as file:
+            self.assertIn("0.03 ± 0.03", file.read())
+        with open(os.path.join(self.output_directory,
+                               "rgap/rgap.tex")) as file:
+            self.assertIn(r"0.03 $\pm$ 0.03", file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
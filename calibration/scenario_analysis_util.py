@@ -0,0 +1,639 @@
+"""Helper functions to analyze many Aimsun Microsimulation scenarios at once.
+
+Each scenario (e.g. a signal coordination strategy) is simulated into its own
+output database. A ScenarioSet extracts the same metrics from all of them in
+parallel, with one worker process per database, and stacks the results into a
+single array whose first axis is the scenario:
+    >>> scenario_set = ScenarioSet({
+    ...     "System Fully Coordinated": "coordinated.sqlite",
+    ...     "System Fully Uncoordinated": "uncoordinated.sqlite"})
+    >>> speed, scenario_names, replication_ids, section_ids, \
+    ...     time_interval_indices = scenario_set.extract_array(
+    ...     "get_sections_data_by_replication", MiSectColumns.MEAN_SPEED)
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import datetime
+import enum
+import itertools
+import os
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from calibration.postprocessing_util import (
+    ALL_VEHICLE_TYPES,
+    AimsunMicroOutputDatabase,
+    MiSectColumns,
+    get_axis_index,
+)
+from utils.aimsun_input_utils import InternalId
+
+
+def _extract_from_database(
+    database_path: str, method: Union[str, Callable[..., Any]],
+    args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> Any:
+    """Open one output database and extract data from it. Runs inside the
+    worker processes of a ScenarioSet.
+
+    Args:
+        database_path: Path to the Aimsun output sqlite file.
+        method: Name of the AimsunMicroOutputDatabase method to call, or a
+            module-level function called with the database as first argument.
+        args: Positional arguments of the method.
+        kwargs: Keyword arguments of the method.
+    Returns:
+        Value returned by the method.
+    """
+    database = AimsunMicroOutputDatabase(database_path)
+    try:
+        if isinstance(method, str):
+            return getattr(database, method)(*args, **kwargs)
+        return method(database, *args, **kwargs)
+    finally:
+        database.close()
+
+
+class ScenarioSet:
+    """Data class for a set of scenarios, each with its own Aimsun
+    Microsimulation output database.
+
+    Attributes:
+        scenario_database_paths: Path to the output database of each scenario,
+            keyed by scenario name. The order of the scenarios is kept in all
+            results.
+        max_workers: Maximum number of worker processes. Defaults to one per
+            database, bounded by the number of CPUs.
+    """
+
+    scenario_database_paths: Dict[str, str]
+    max_workers: int
+
+    def __init__(
+        self, scenario_database_paths: Dict[str, str], max_workers: int = None
+    ):
+        self.scenario_database_paths = dict(scenario_database_paths)
+        if max_workers is None:
+            max_workers = min(len(self.scenario_database_paths),
+                              os.cpu_count() or 1)
+        self.max_workers = max(max_workers, 1)
+
+    @property
+    def scenario_names(self) -> List[str]:
+        """Names of the scenarios, in order."""
+        return list(self.scenario_database_paths)
+
+    def extract(
+        self, method: Union[str, Callable[..., Any]], *args, **kwargs
+    ) -> Dict[str, Any]:
+        """Extract data from every scenario database concurrently.
+
+        Args:
+            method: Name of the AimsunMicroOutputDatabase method to call on
+                every database, e.g. "get_detectors_flow". A module-level
+                function taking the database as first argument can be given
+                instead to extract several metrics in the same worker.
+            *args: Positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+        Returns:
+            results: Value returned by the method for each scenario, keyed by
+                scenario name.
+        """
+        if self.max_workers == 1:
+            return {name: _extract_from_database(path, method, args, kwargs)
+                    for name, path in self.scenario_database_paths.items()}
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers) \
+                as executor:
+            futures = {
+                name: executor.submit(
+                    _extract_from_database, path, method, args, kwargs)
+                for name, path in self.scenario_database_paths.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    def extract_array(
+        self, method: Union[str, Callable[..., Any]], *args, **kwargs
+    ) -> Tuple[Any, ...]:
+        """Extract an array from every scenario database concurrently and stack
+        the results along a new first axis.
+
+        The method must return a tuple (data, axis_values_0, axis_values_1,
+        ...) like the bulk getters of AimsunMicroOutputDatabase, where
+        axis_values_i indexes axis i of data. The arrays of all scenarios are
+        aligned on the union of their axis values, with NaN where a scenario
+        has no data.
+
+        Args:
+            method: Method to call on every database. See extract().
+            *args: Positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+        Returns:
+            data: Array of shape (scenarios, ...).
+            scenario_names: Name of the scenario of each item of the first
+                axis.
+            *axis_values: Values indexing each other axis of data.
+        """
+        results = self.extract(method, *args, **kwargs)
+        data, axis_values = stack_aligned_arrays(list(results.values()))
+        return (data, np.array(list(results))) + tuple(axis_values)
+
+
+def stack_aligned_arrays(
+    results: Sequence[Tuple[Any, ...]]
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Stack arrays whose axes are indexed by possibly different values.
+
+    Args:
+        results: Tuples (data, axis_values_0, axis_values_1, ...) where
+            axis_values_i indexes axis i of data.
+    Returns:
+        data: Stacked array of shape (len(results), ...), with NaN where an
+            array has no data for the axis values.
+        axis_values: Values indexing each axis of data after the first one.
+            Equal to the axis values of the inputs if they all match, to their
+            sorted union otherwise.
+    """
+    num_axes = len(results[0]) - 1
+    axis_values = []
+    for axis in range(num_axes):
+        values = [np.asarray(result[axis + 1]) for result in results]
+        if all(np.array_equal(values[0], other) for other in values[1:]):
+            axis_values.append(values[0])
+        else:
+            axis_values.append(np.unique(np.concatenate(values)))
+    data = np.full((len(results),) + tuple(len(values)
+                                           for values in axis_values), np.nan)
+    for i, result in enumerate(results):
+        indices = [get_axis_index(np.asarray(result[axis + 1]),
+                                  axis_values[axis])[1]
+                   for axis in range(num_axes)]
+        data[(i,) + np.ix_(*indices)] = result[0]
+    return data, axis_values
+
+
+def to_tidy_table(
+    data: np.ndarray, axis_names: Sequence[str],
+    axis_values: Sequence[Sequence[Any]], value_name: str = "value"
+) -> pd.DataFrame:
+    """Convert a dense array into a tidy table with one row per item.
+
+    Args:
+        data: Array to convert.
+        axis_names: Name of the column holding the index of each axis.
+        axis_values: Values indexing each axis of data.
+        value_name: Name of the column holding the data.
+    Returns:
+        table: Table with one column per axis and one column for the data.
+    """
+    assert len(axis_names) == len(axis_values) == data.ndim
+    grids = np.meshgrid(*[np.asarray(values) for values in axis_values],
+                        indexing="ij")
+    table = pd.DataFrame({
+        name: grid.reshape(-1) for name, grid in zip(axis_names, grids)})
+    table[value_name] = data.reshape(-1)
+    return table
+
+
+def get_sections_metrics(
+    database: AimsunMicroOutputDatabase, metrics: Sequence[MiSectColumns],
+    section_internal_ids: Sequence[InternalId] = None,
+    time_intervals: Sequence[datetime.time] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Get several metrics of many road sections at many time intervals, all
+    aligned on the same sections and time intervals. Can be passed to
+    ScenarioSet.extract_array() to get all metrics of a scenario in one worker.
+
+    Args:
+        database: Output database of the scenario.
+        metrics: Columns of the MISECT table to get.
+        section_internal_ids: Internal IDs of the road sections. If None, all
+            road sections of the table are used.
+        time_intervals: Time intervals of when we want the data from. If None,
+            all time intervals of the simulation are used.
+        vehicle_type: Type of vehicles included in the data.
+    Returns:
+        data: Array of shape (metrics, road sections, time intervals).
+        metric_indices: Index of the metric of each item of the first axis.
+        section_internal_ids: Internal ID of the road section of each row.
+        time_interval_indices: Index in the simulation output database of the
+            time interval of each column.
+    """
+    results = [database.get_sections_data(
+        metric, section_internal_ids, time_intervals, vehicle_type)
+        for metric in metrics]
+    data, (section_internal_ids, time_interval_indices) = \
+        stack_aligned_arrays(results)
+    return data, np.arange(len(metrics)), section_internal_ids, \
+        time_interval_indices
+
+
+def get_section_group_masks(
+    section_internal_ids: Sequence[InternalId],
+    section_groups: Dict[str, Sequence[InternalId]] = None
+) -> Tuple[List[str], np.ndarray]:
+    """Convert groups of road sections (e.g. the sections of one road and
+    direction) into boolean masks over an axis of road sections.
+
+    Args:
+        section_internal_ids: Internal IDs of the road sections of the axis.
+        section_groups: Internal IDs of the road sections of each group, keyed
+            by group name. If None, a single group "All" holds all sections.
+    Returns:
+        group_names: Name of each group.
+        group_masks: Boolean array of shape (groups, road sections).
+    """
+    if section_groups is None:
+        return ["All"], np.ones((1, len(section_internal_ids)), dtype=bool)
+    group_masks = np.zeros((len(section_groups), len(section_internal_ids)),
+                           dtype=bool)
+    for i, group_section_ids in enumerate(section_groups.values()):
+        _, index = get_axis_index(np.asarray(group_section_ids),
+                                  np.asarray(section_internal_ids))
+        group_masks[i, index[index >= 0]] = True
+    return list(section_groups), group_masks
+
+
+def compute_group_statistics(
+    data: np.ndarray, group_masks: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the mean and standard deviation of data over the road sections
+    and time intervals of each group, ignoring NaN.
+
+    Args:
+        data: Array of shape (..., road sections, time intervals).
+        group_masks: Boolean array of shape (groups, road sections).
+    Returns:
+        mean: Array of shape (..., groups).
+        std: Standard deviation (with one degree of freedom) of shape
+            (..., groups). NaN for groups with less than two values.
+    """
+    _, mean, variance = _compute_group_moments(data, group_masks)
+    return mean, np.sqrt(variance)
+
+
+def _compute_group_moments(
+    data: np.ndarray, group_masks: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the number of values, mean and variance (with one degree of
+    freedom) of data over the road sections and time intervals of each group,
+    ignoring NaN. See compute_group_statistics()."""
+    valid = ~np.isnan(data)
+    # Center the data before summing squares to avoid cancellation.
+    num_valid = valid.sum(axis=(-2, -1), keepdims=True)
+    center = np.where(valid, data, 0.0).sum(axis=(-2, -1), keepdims=True) \
+        / np.maximum(num_valid, 1)
+    centered = np.where(valid, data - center, 0.0)
+    # Sum over time intervals first, then over the sections of each group
+    # with a single matrix product.
+    masks = group_masks.T.astype(float)
+    count = valid.sum(axis=-1) @ masks
+    total = centered.sum(axis=-1) @ masks
+    total_squares = (centered ** 2).sum(axis=-1) @ masks
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered_mean = np.where(count > 0, total / count, np.nan)
+        variance = np.where(
+            count > 1,
+            (total_squares - count * centered_mean ** 2) / (count - 1),
+            np.nan)
+    mean = centered_mean + center[..., 0]
+    return count, mean, np.maximum(variance, 0.0)
+
+
+class PValueCorrection(enum.Enum):
+    """Methods to correct p-values for multiple comparisons.
+
+    Attributes:
+        NONE: No correction.
+        BONFERRONI: Bonferroni correction, controlling the family-wise error
+            rate.
+        HOLM: Holm-Bonferroni step-down correction, controlling the
+            family-wise error rate. Uniformly more powerful than BONFERRONI.
+        BENJAMINI_HOCHBERG: Benjamini-Hochberg correction, controlling the
+            false discovery rate.
+    """
+
+    NONE = "none"
+    BONFERRONI = "bonferroni"
+    HOLM = "holm"
+    BENJAMINI_HOCHBERG = "benjamini_hochberg"
+
+
+def correct_p_values(
+    p_values: np.ndarray, correction: PValueCorrection = PValueCorrection.HOLM
+) -> np.ndarray:
+    """Correct p-values for multiple comparisons. All p-values of the array
+    form one family of tests. NaN p-values (tests that could not be run) are
+    left out of the family.
+
+    Args:
+        p_values: Array of p-values of any shape.
+        correction: Correction method.
+    Returns:
+        corrected_p_values: Array of corrected p-values, with the same shape
+            as p_values and capped at 1.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    corrected = np.full(p_values.shape, np.nan)
+    valid = ~np.isnan(p_values)
+    values = p_values[valid]
+    num_tests = len(values)
+    if correction == PValueCorrection.NONE or num_tests == 0:
+        corrected[valid] = values
+        return corrected
+    if correction == PValueCorrection.BONFERRONI:
+        corrected[valid] = np.minimum(values * num_tests, 1.0)
+        return corrected
+    order = np.argsort(values, kind="stable")
+    ranks = np.arange(1, num_tests + 1)
+    if correction == PValueCorrection.HOLM:
+        adjusted = np.maximum.accumulate(
+            values[order] * (num_tests - ranks + 1))
+    elif correction == PValueCorrection.BENJAMINI_HOCHBERG:
+        adjusted = np.minimum.accumulate(
+            (values[order] * num_tests / ranks)[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown p-value correction {correction}.")
+    sorted_corrected = np.empty(num_tests)
+    sorted_corrected[order] = np.minimum(adjusted, 1.0)
+    corrected[valid] = sorted_corrected
+    return corrected
+
+
+def compute_welch_t_tests(
+    data: np.ndarray, group_masks: np.ndarray, pair_indices: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run Welch's unequal variances t-test between pairs of scenarios for all
+    metrics and groups of road sections at once. The samples of a test are
+    the values of all road sections and time intervals of the group.
+
+    Args:
+        data: Array of shape (scenarios, metrics, road sections, time
+            intervals).
+        group_masks: Boolean array of shape (groups, road sections).
+        pair_indices: Integer array of shape (pairs, 2) with the index of the
+            two scenarios of each pair.
+    Returns:
+        t_statistic: Array of shape (pairs, metrics, groups). Positive when
+            the mean of the first scenario is larger.
+        p_value: Two-sided p-value of each test. NaN where a sample has less
+            than two values.
+        degrees_of_freedom: Welch-Satterthwaite degrees of freedom of each
+            test.
+    """
+    count, mean, variance = _compute_group_moments(data, group_masks)
+    pair_indices = np.asarray(pair_indices).reshape(-1, 2)
+    first, second = pair_indices[:, 0], pair_indices[:, 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        standard_error_1 = variance[first] / count[first]
+        standard_error_2 = variance[second] / count[second]
+        standard_error = standard_error_1 + standard_error_2
+        t_statistic = (mean[first] - mean[second]) / np.sqrt(standard_error)
+        degrees_of_freedom = standard_error ** 2 / (
+            standard_error_1 ** 2 / (count[first] - 1)
+            + standard_error_2 ** 2 / (count[second] - 1))
+    p_value = 2 * stats.t.sf(np.abs(t_statistic), degrees_of_freedom)
+    return t_statistic, p_value, degrees_of_freedom
+
+
+def welch_t_test_scenario_set(
+    scenario_set: ScenarioSet,
+    metrics: Sequence[MiSectColumns],
+    scenario_pairs: Sequence[Tuple[str, str]] = None,
+    section_groups: Dict[str, Sequence[InternalId]] = None,
+    time_intervals: Sequence[datetime.time] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+    correction: PValueCorrection = PValueCorrection.HOLM,
+) -> pd.DataFrame:
+    """Test whether road section metrics differ between pairs of scenarios,
+    for all metrics, pairs and groups of road sections in one batched
+    computation. All tests form one family for the multiple-comparison
+    correction.
+
+    Args:
+        scenario_set: Scenarios to compare.
+        metrics: Columns of the MISECT table to test.
+        scenario_pairs: Names of the scenarios of each pair. If None, all
+            pairs of scenarios are tested, in the order of the scenario set.
+        section_groups: Internal IDs of the road sections of each group, keyed
+            by group name. If None, all sections form one group.
+        time_intervals: Time intervals to include. If None, all time intervals
+            of the simulations are used.
+        vehicle_type: Type of vehicles included in the data.
+        correction: Correction of the p-values for multiple comparisons.
+    Returns:
+        table: Table with one row per metric, group and pair of scenarios,
+            and columns metric, group, scenario_1, scenario_2, t_statistic,
+            p_value and p_value_corrected.
+    """
+    data, scenario_names, _, section_internal_ids, _ = \
+        scenario_set.extract_array(get_sections_metrics, list(metrics), None,
+                                   time_intervals, vehicle_type)
+    scenario_names = list(scenario_names)
+    if scenario_pairs is None:
+        scenario_pairs = list(itertools.combinations(scenario_names, 2))
+    pair_indices = np.array([[scenario_names.index(name) for name in pair]
+                             for pair in scenario_pairs], dtype=int)
+    group_names, group_masks = get_section_group_masks(
+        section_internal_ids, section_groups)
+    t_statistic, p_value, _ = compute_welch_t_tests(
+        data, group_masks, pair_indices)
+    p_value_corrected = correct_p_values(p_value, correction)
+
+    # Rows are ordered by metric, then group, then pair.
+    metric_index, group_index, pair_index = np.meshgrid(
+        np.arange(len(metrics)), np.arange(len(group_names)),
+        np.arange(len(scenario_pairs)), indexing="ij")
+    index = (pair_index.reshape(-1), metric_index.reshape(-1),
+             group_index.reshape(-1))
+    return pd.DataFrame({
+        "metric": [metrics[i].name for i in index[1]],
+        "group": [group_names[i] for i in index[2]],
+        "scenario_1": [scenario_pairs[i][0] for i in index[0]],
+        "scenario_2": [scenario_pairs[i][1] for i in index[0]],
+        "t_statistic": t_statistic[index],
+        "p_value": p_value[index],
+        "p_value_corrected": p_value_corrected[index],
+    })
+
+
+class ScenarioComparison:
+    """Data class for the differences of road section metrics between pairs
+    of scenarios. For each pair (scenario_1, scenario_2), the difference is
+    scenario_2 - scenario_1 and the ratio is scenario_2 / scenario_1.
+
+    Attributes:
+        scenario_pairs: Names of the scenarios of each pair.
+        metrics: Compared columns of the MISECT table.
+        section_internal_ids: Internal ID of each road section.
+        time_interval_indices: Index in the simulation output database of each
+            time interval.
+        group_names: Name of each group of road sections.
+        group_masks: Boolean array of shape (groups, road sections).
+        difference: Array of shape (pairs, metrics, road sections, time
+            intervals).
+        ratio: Array of the same shape as difference. NaN where the metric of
+            scenario_1 is 0.
+        difference_mean: Mean of the differences over the road sections and
+            time intervals of each group, of shape (pairs, metrics, groups).
+        difference_std: Standard deviation of the differences, with the same
+            shape as difference_mean.
+        ratio_mean: Mean of the ratios, with the same shape as
+            difference_mean.
+        ratio_std: Standard deviation of the ratios, with the same shape as
+            difference_mean.
+    """
+
+    scenario_pairs: List[Tuple[str, str]]
+    metrics: List[MiSectColumns]
+    section_internal_ids: np.ndarray
+    time_interval_indices: np.ndarray
+    group_names: List[str]
+    group_masks: np.ndarray
+    difference: np.ndarray
+    ratio: np.ndarray
+    difference_mean: np.ndarray
+    difference_std: np.ndarray
+    ratio_mean: np.ndarray
+    ratio_std: np.ndarray
+
+    def __init__(
+        self, data: np.ndarray, scenario_names: Sequence[str],
+        scenario_pairs: Sequence[Tuple[str, str]],
+        metrics: Sequence[MiSectColumns], section_internal_ids: np.ndarray,
+        time_interval_indices: np.ndarray,
+        section_groups: Dict[str, Sequence[InternalId]] = None
+    ):
+        """Compare all pairs of scenarios at once.
+
+        Args:
+            data: Array of shape (scenarios, metrics, road sections, time
+                intervals).
+            scenario_names: Name of the scenario of each item of the first
+                axis of data.
+            scenario_pairs: Names of the scenarios to compare.
+            metrics: Column of the metric of each item of the second axis.
+            section_internal_ids: Internal ID of each road section.
+            time_interval_indices: Index of each time interval.
+            section_groups: Internal IDs of the road sections of each group,
+                keyed by group name. If None, all sections form one group.
+        """
+        scenario_names = list(scenario_names)
+        self.scenario_pairs = [tuple(pair) for pair in scenario_pairs]
+        self.metrics = list(metrics)
+        self.section_internal_ids = np.asarray(section_internal_ids)
+        self.time_interval_indices = np.asarray(time_interval_indices)
+        self.group_names, self.group_masks = get_section_group_masks(
+            self.section_internal_ids, section_groups)
+        first = [scenario_names.index(pair[0]) for pair in self.scenario_pairs]
+        second = [scenario_names.index(pair[1])
+                  for pair in self.scenario_pairs]
+        self.difference = data[second] - data[first]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.ratio = np.where(data[first] != 0,
+                                  data[second] / data[first], np.nan)
+        self.difference_mean, self.difference_std = compute_group_statistics(
+            self.difference, self.group_masks)
+        self.ratio_mean, self.ratio_std = compute_group_statistics(
+            self.ratio, self.group_masks)
+
+    def to_table(self) -> pd.DataFrame:
+        """Summarize the comparison in a table with one row per pair of
+        scenarios, metric and group of road sections.
+
+        Returns:
+            table: Table with columns metric, group, scenario_1, scenario_2,
+                difference_mean, difference_std, ratio_mean and ratio_std.
+        """
+        pair_index, metric_index, group_index = np.meshgrid(
+            np.arange(len(self.scenario_pairs)), np.arange(len(self.metrics)),
+            np.arange(len(self.group_names)), indexing="ij")
+        pair_index, metric_index, group_index = (
+            pair_index.reshape(-1), metric_index.reshape(-1),
+            group_index.reshape(-1))
+        return pd.DataFrame({
+            "metric": [self.metrics[i].name for i in metric_index],
+            "group": [self.group_names[i] for i in group_index],
+            "scenario_1": [self.scenario_pairs[i][0] for i in pair_index],
+            "scenario_2": [self.scenario_pairs[i][1] for i in pair_index],
+            "difference_mean": self.difference_mean.reshape(-1),
+            "difference_std": self.difference_std.reshape(-1),
+            "ratio_mean": self.ratio_mean.reshape(-1),
+            "ratio_std": self.ratio_std.reshape(-1),
+        })
+
+
+def compare_scenarios(
+    database_1: AimsunMicroOutputDatabase,
+    database_2: AimsunMicroOutputDatabase,
+    metrics: Sequence[MiSectColumns],
+    section_groups: Dict[str, Sequence[InternalId]] = None,
+    time_intervals: Sequence[datetime.time] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+    scenario_names: Tuple[str, str] = ("scenario_1", "scenario_2"),
+) -> ScenarioComparison:
+    """Compare road section metrics between two scenarios. Road sections and
+    time intervals are aligned by index, with NaN where one scenario has no
+    data.
+
+    Args:
+        database_1: Output database of the reference scenario.
+        database_2: Output database of the compared scenario.
+        metrics: Columns of the MISECT table to compare.
+        section_groups: Internal IDs of the road sections of each group (e.g.
+            each road and direction), keyed by group name. If None, all
+            sections form one group.
+        time_intervals: Time intervals to compare. If None, all time
+            intervals of the simulations are used.
+        vehicle_type: Type of vehicles included in the data.
+        scenario_names: Names of the two scenarios.
+    Returns:
+        comparison: Differences and ratios of the metrics, with their
+            statistics per group.
+    """
+    data, (_, section_internal_ids, time_interval_indices) = \
+        stack_aligned_arrays([
+            get_sections_metrics(database, metrics, None, time_intervals,
+                                 vehicle_type)
+            for database in (database_1, database_2)])
+    return ScenarioComparison(
+        data, scenario_names, [tuple(scenario_names)], metrics,
+        section_internal_ids, time_interval_indices, section_groups)
+
+
+def compare_scenario_set(
+    scenario_set: ScenarioSet,
+    scenario_pairs: Sequence[Tuple[str, str]],
+    metrics: Sequence[MiSectColumns],
+    section_groups: Dict[str, Sequence[InternalId]] = None,
+    time_intervals: Sequence[datetime.time] = None,
+    vehicle_type: int = ALL_VEHICLE_TYPES,
+) -> ScenarioComparison:
+    """Compare road section metrics between many pairs of scenarios. The
+    metrics of every scenario are extracted once, in parallel, and all pairs
+    are then compared with array operations.
+
+    Args:
+        scenario_set: Scenarios to compare.
+        scenario_pairs: Names of the scenarios of each pair, reference first.
+        metrics: Columns of the MISECT table to compare.
+        section_groups: Internal IDs of the road sections of each group, keyed
+            by group name. If None, all sections form one group.
+        time_intervals: Time intervals to compare. If None, all time
+            intervals of the simulations are used.
+        vehicle_type: Type of vehicles included in the data.
+    Returns:
+        comparison: Differences and ratios of the metrics, with their
+            statistics per group.
+    """
+    data, scenario_names, _, section_internal_ids, time_interval_indices = \
+        scenario_set.extract_array(get_sections_metrics, list(metrics), None,
+                                   time_intervals, vehicle_type)
+    return ScenarioComparison(
+        data, scenario_names, scenario_pairs, metrics, section_internal_ids,
+        time_interval_indices, section_groups)
@@ -0,0 +1,241 @@
+"""Tests for scenario_analysis_util."""
+
+import unittest
+
+import numpy as np
+from scipy import stats
+
+from calibration.output_database_test_util import (
+    REPLICATION_IDS,
+    SECTION_INTERNAL_IDS,
+    OutputDatabaseTestCase,
+)
+from calibration.postprocessing_util import (
+    AimsunMicroOutputDatabase,
+    MiSectColumns,
+)
+from calibration.scenario_analysis_util import (
+    ScenarioSet,
+    compare_scenario_set,
+    compare_scenarios,
+    compute_group_statistics,
+    get_section_group_masks,
+    compute_welch_t_tests,
+    correct_p_values,
+    PValueCorrection,
+    stack_aligned_arrays,
+    to_tidy_table,
+    welch_t_test_scenario_set,
+)
+
+SCENARIO_NAMES = ["Fully Coordinated", "Fully Uncoordinated"]
+
+
+class TestScenarioSet(OutputDatabaseTestCase):
+    """Test the extraction of metrics from several scenario databases."""
+
+    def setUp(self):
+        super().setUp()
+        self.scenario_database_paths = {
+            scenario_name: self.create_database(f"{i}.sqlite", [(
+                "UPDATE MISECT SET speed = speed + ?", (10 * i,))])
+            for i, scenario_name in enumerate(SCENARIO_NAMES)}
+
+    def test_extract_array(self):
+        """Test that the process pool returns one array per scenario."""
+        for max_workers in [1, 2]:
+            scenario_set = ScenarioSet(self.scenario_database_paths,
+                                       max_workers)
+            speed, scenario_names, replication_ids, section_ids, _ = \
+                scenario_set.extract_array(
+                    "get_sections_data_by_replication",
+                    MiSectColumns.MEAN_SPEED)
+            self.assertEqual(list(scenario_names), SCENARIO_NAMES)
+            self.assertEqual(replication_ids.tolist(), REPLICATION_IDS)
+            self.assertEqual(section_ids.tolist(), SECTION_INTERNAL_IDS)
+            self.assertEqual(speed.shape[:3], (2, 2, 2))
+            np.testing.assert_allclose(speed[1] - speed[0], 10.0)
+
+    def test_compare_scenarios(self):
+        """Test differences and ratios between two scenarios per group of
+        road sections."""
+        databases = [AimsunMicroOutputDatabase(path)
+                     for path in self.scenario_database_paths.values()]
+        metrics = [MiSectColumns.MEAN_SPEED, MiSectColumns.MEAN_FLOW]
+        section_groups = {"First": SECTION_INTERNAL_IDS[:1],
+                          "All": SECTION_INTERNAL_IDS + [99]}
+        comparison = compare_scenarios(
+            databases[0], databases[1], metrics, section_groups,
+            scenario_names=tuple(SCENARIO_NAMES))
+        for database in databases:
+            database.close()
+        self.assertEqual(comparison.difference.shape,
+                         (1, 2, len(SECTION_INTERNAL_IDS), 4))
+        np.testing.assert_allclose(comparison.difference[0, 0], 10.0)
+        np.testing.assert_allclose(comparison.difference[0, 1], 0.0)
+        np.testing.assert_allclose(comparison.difference_mean[0],
+                                   [[10.0, 10.0], [0.0, 0.0]])
+        np.testing.assert_allclose(comparison.difference_std[0], 0.0,
+                                   atol=1e-6)
+        # Speed is 60 - interval in the reference scenario.
+        ratio = (70.0 - np.arange(1, 5)) / (60.0 - np.arange(1, 5))
+        np.testing.assert_allclose(comparison.ratio_mean[0, 0],
+                                   np.mean(ratio))
+        np.testing.assert_allclose(comparison.ratio_std[0, 0],
+                                   [np.std(ratio, ddof=1),
+                                    np.std(np.tile(ratio, 2), ddof=1)])
+        table = comparison.to_table()
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table["scenario_2"].iloc[0], SCENARIO_NAMES[1])
+        self.assertEqual(table["group"].tolist(),
+                         ["First", "All", "First", "All"])
+
+    def test_compare_scenario_set(self):
+        """Test that many pairs are compared from one extraction."""
+        scenario_set = ScenarioSet(self.scenario_database_paths, 2)
+        comparison = compare_scenario_set(
+            scenario_set, [SCENARIO_NAMES, SCENARIO_NAMES[::-1]],
+            [MiSectColumns.MEAN_SPEED])
+        self.assertEqual(comparison.group_names, ["All"])
+        np.testing.assert_allclose(comparison.difference_mean[:, 0, 0],
+                                   [10.0, -10.0])
+        np.testing.assert_array_equal(comparison.section_internal_ids,
+                                      SECTION_INTERNAL_IDS)
+
+    def test_welch_t_test_scenario_set(self):
+        """Test the table of t-tests between all pairs of scenarios."""
+        scenario_set = ScenarioSet(self.scenario_database_paths, 1)
+        table = welch_t_test_scenario_set(
+            scenario_set, [MiSectColumns.MEAN_SPEED, MiSectColumns.MEAN_FLOW],
+            section_groups={"First": SECTION_INTERNAL_IDS[:1],
+                            "Second": SECTION_INTERNAL_IDS[1:]},
+            correction=PValueCorrection.BONFERRONI)
+        self.assertEqual(list(table.columns)[2:6],
+                         ["scenario_1", "scenario_2", "t_statistic",
+                          "p_value"])
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table["metric"].tolist(),
+                         ["MEAN_SPEED", "MEAN_SPEED", "MEAN_FLOW",
+                          "MEAN_FLOW"])
+        self.assertEqual(table["scenario_1"].iloc[0], SCENARIO_NAMES[0])
+        # Speed is 60 - interval in the first scenario, 10 more in the other.
+        expected = stats.ttest_ind(60.0 - np.arange(1, 5),
+                                   70.0 - np.arange(1, 5), equal_var=False)
+        np.testing.assert_allclose(table["t_statistic"].iloc[:2],
+                                   expected.statistic)
+        np.testing.assert_allclose(table["p_value"].iloc[:2], expected.pvalue)
+        # Flows are identical in both scenarios.
+        np.testing.assert_allclose(table["t_statistic"].iloc[2:], 0.0)
+        np.testing.assert_allclose(table["p_value"].iloc[2:], 1.0)
+        np.testing.assert_allclose(table["p_value_corrected"].iloc[:2],
+                                   expected.pvalue * 4)
+
+
+class TestStatisticalTests(unittest.TestCase):
+    """Test the batched t-tests and the multiple-comparison corrections."""
+
+    def test_compute_welch_t_tests(self):
+        """Test against scipy for every pair, metric and group."""
+        generator = np.random.default_rng(1)
+        data = generator.normal(50.0, 5.0, (3, 2, 5, 8))
+        data[1] += np.linspace(0, 3, 5)[:, None]
+        data[2, 0, 0, :4] = np.nan
+        group_masks = np.array([[True, True, True, False, False],
+                                [False, True, False, True, True]])
+        pair_indices = np.array([[0, 1], [0, 2], [2, 1]])
+        t_statistic, p_value, _ = compute_welch_t_tests(
+            data, group_masks, pair_indices)
+        self.assertEqual(t_statistic.shape, (3, 2, 2))
+        for p, (i, j) in enumerate(pair_indices):
+            for metric in range(2):
+                for group, mask in enumerate(group_masks):
+                    sample_1 = data[i, metric, mask].reshape(-1)
+                    sample_2 = data[j, metric, mask].reshape(-1)
+                    expected = stats.ttest_ind(
+                        sample_1[~np.isnan(sample_1)],
+                        sample_2[~np.isnan(sample_2)], equal_var=False)
+                    np.testing.assert_allclose(
+                        t_statistic[p, metric, group], expected.statistic)
+                    np.testing.assert_allclose(
+                        p_value[p, metric, group], expected.pvalue)
+
+    def test_correct_p_values(self):
+        """Test the corrections against hand-computed values."""
+        p_values = np.array([[0.01, 0.04], [0.03, 0.005]])
+        np.testing.assert_allclose(
+            correct_p_values(p_values, PValueCorrection.BONFERRONI),
+            [[0.04, 0.16], [0.12, 0.02]])
+        np.testing.assert_allclose(
+            correct_p_values(p_values, PValueCorrection.HOLM),
+            [[0.03, 0.06], [0.06, 0.02]])
+        np.testing.assert_allclose(
+            correct_p_values(p_values, PValueCorrection.BENJAMINI_HOCHBERG),
+            [[0.02, 0.04], [0.04, 0.02]])
+        corrected = correct_p_values(np.array([0.5, np.nan, 0.9]),
+                                     PValueCorrection.HOLM)
+        np.testing.assert_allclose(corrected, [1.0, np.nan, 1.0])
+
+
+class TestComputeGroupStatistics(unittest.TestCase):
+    """Test the vectorized statistics per group of road sections."""
+
+    def test_compute_group_statistics(self):
+        """Test against a direct computation, with missing values."""
+        generator = np.random.default_rng(0)
+        data = generator.normal(1000.0, 5.0, (3, 4, 6))
+        data[0, 1, 2] = np.nan
+        data[2, 3] = np.nan
+        group_masks = np.array([[True, True, False, False],
+                                [False, False, True, True],
+                                [False, False, False, False]])
+        mean, std = compute_group_statistics(data, group_masks)
+        self.assertEqual(mean.shape, (3, 3))
+        for i in range(3):
+            for j, mask in enumerate(group_masks[:2]):
+                values = data[i, mask].reshape(-1)
+                np.testing.assert_allclose(mean[i, j], np.nanmean(values))
+                np.testing.assert_allclose(std[i, j],
+                                           np.nanstd(values, ddof=1))
+        self.assertTrue(np.all(np.isnan(mean[:, 2])))
+        self.assertTrue(np.all(np.isnan(std[:, 2])))
+
+
+class TestGetSectionGroupMasks(unittest.TestCase):
+    """Test the conversion of groups of road sections into masks."""
+
+    def test_get_section_group_masks(self):
+        """Test groups that are not a prefix of the section axis, with
+        sections missing from the axis."""
+        group_names, group_masks = get_section_group_masks(
+            [11, 12, 13, 14], {"Last": [14, 12], "Other": [99, 13]})
+        self.assertEqual(group_names, ["Last", "Other"])
+        np.testing.assert_array_equal(group_masks, [
+            [False, True, False, True],
+            [False, False, True, False]])
+
+        group_names, group_masks = get_section_group_masks([11, 12])
+        self.assertEqual(group_names, ["All"])
+        np.testing.assert_array_equal(group_masks, [[True, True]])
+
+
+class TestStackAlignedArrays(unittest.TestCase):
+    """Test the alignment of arrays indexed by different values."""
+
+    def test_stack_aligned_arrays(self):
+        """Test that missing axis values are filled with NaN."""
+        data, (axis_values,) = stack_aligned_arrays([
+            (np.array([1.0, 2.0]), np.array([10, 20])),
+            (np.array([3.0, 4.0]), np.array([30, 10])),
+        ])
+        self.assertEqual(axis_values.tolist(), [10, 20, 30])
+        np.testing.assert_array_equal(
+            data, [[1.0, 2.0, np.nan], [4.0, np.nan, 3.0]])
+        table = to_tidy_table(data, ["scenario", "section"],
+                              [SCENARIO_NAMES, axis_values], "speed")
+        self.assertEqual(list(table.columns), ["scenario", "section", "speed"])
+        self.assertEqual(len(table), 6)
+        self.assertEqual(table["speed"].iloc[5], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
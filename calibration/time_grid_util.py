@@ -0,0 +1,231 @@
+"""Integer-indexed grid of the time intervals of a study.
+
+Time is represented in three ways throughout the repository: as the
+datetime.time start of each interval (metadata_settings.get_time_intervals()),
+as datetime.timedelta keys marking the end of each interval in
+FlowRealData.flow_data, and as 1-based time interval indices (the `ent` column)
+in the simulation output databases. A TimeGrid converts between all three and
+0-based positions on the grid, so data can be stored in NumPy arrays indexed by
+position instead of dictionaries keyed by time objects:
+    >>> time_grid = TimeGrid.from_metadata_settings()
+    >>> positions = time_grid.get_positions_of_times(time_list)
+    >>> flow = time_grid.convert_count_to_hourly_flow(count[:, positions])
+
+Times that do not fall on the grid get position -1, like keys missing from an
+axis in get_axis_index().
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import List, Sequence
+
+import numpy as np
+
+from utils import metadata_settings
+
+SECONDS_PER_HOUR = 3600
+
+
+def _get_seconds(times: Sequence[datetime.time]) -> np.ndarray:
+    """Get the number of seconds since midnight of each time."""
+    return np.array([time.hour * 3600 + time.minute * 60 + time.second
+                     for time in times], dtype=np.int64)
+
+
+class TimeGrid:
+    """Data class for consecutive time intervals of the same length.
+
+    Attributes:
+        start_time_seconds: Time in seconds since midnight of when the first
+            time interval starts.
+        time_step: Length of one time interval in seconds.
+        num_time_intervals: Number of time intervals.
+    """
+
+    start_time_seconds: int
+    time_step: int
+    num_time_intervals: int
+
+    def __init__(
+        self, start_time_seconds: int, time_step: int, num_time_intervals: int
+    ):
+        if time_step <= 0:
+            raise ValueError(f"Invalid time step {time_step}.")
+        self.start_time_seconds = int(start_time_seconds)
+        self.time_step = int(time_step)
+        self.num_time_intervals = int(num_time_intervals)
+
+    @classmethod
+    def from_metadata_settings(cls) -> TimeGrid:
+        """Create the time grid of the study set in metadata_settings."""
+        start_hour, end_hour, timestep_minutes = \
+            metadata_settings.get_time_interval_settings()
+        time_step = timestep_minutes * 60
+        return cls(start_hour * SECONDS_PER_HOUR, time_step,
+                   (end_hour - start_hour) * SECONDS_PER_HOUR // time_step)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TimeGrid):
+            return NotImplemented
+        return (self.start_time_seconds, self.time_step,
+                self.num_time_intervals) == (
+                    other.start_time_seconds, other.time_step,
+                    other.num_time_intervals)
+
+    def __repr__(self) -> str:
+        return (f"TimeGrid(start_time_seconds={self.start_time_seconds}, "
+                f"time_step={self.time_step}, "
+                f"num_time_intervals={self.num_time_intervals})")
+
+    @property
+    def hourly_flow_factor(self) -> float:
+        """Factor converting a number of vehicles per time interval to a flow
+        in vehicles per hour, e.g. 4 for 15-minute intervals."""
+        return SECONDS_PER_HOUR / self.time_step
+
+    def get_times(self, positions: Sequence[int] = None) -> List[datetime.time]:
+        """Get the start time of time intervals.
+
+        Args:
+            positions: Positions of the time intervals on the grid. If None,
+                all time intervals are used.
+        Returns:
+            times: Start time of each time interval.
+        """
+        seconds = self.__get_start_seconds(positions)
+        return [datetime.time(second // 3600, second // 60 % 60, second % 60)
+                for second in seconds.tolist()]
+
+    def get_timedeltas(
+        self, positions: Sequence[int] = None, interval_end: bool = True
+    ) -> List[datetime.timedelta]:
+        """Get the time of time intervals as time since midnight, the format of
+        the keys of FlowRealData.flow_data.
+
+        Args:
+            positions: Positions of the time intervals on the grid. If None,
+                all time intervals are used.
+            interval_end: Whether to get the end of each time interval, as in
+                real flow data, instead of its start.
+        Returns:
+            timedeltas: Start or end of each time interval.
+        """
+        seconds = self.__get_start_seconds(positions) \
+            + (self.time_step if interval_end else 0)
+        return [datetime.timedelta(seconds=second)
+                for second in seconds.tolist()]
+
+    def get_time_interval_indices(
+        self, positions: Sequence[int] = None
+    ) -> np.ndarray:
+        """Get the index of time intervals in the simulation output databases.
+
+        Args:
+            positions: Positions of the time intervals on the grid. If None,
+                all time intervals are used.
+        Returns:
+            time_interval_indices: 1-based index of each time interval.
+        """
+        return self.__get_positions(positions) + 1
+
+    def get_positions_of_times(
+        self, times: Sequence[datetime.time]
+    ) -> np.ndarray:
+        """Get the position on the grid of the time intervals containing the
+        given times.
+
+        Args:
+            times: Times within the time intervals, usually their start.
+        Returns:
+            positions: 0-based position of the time interval of each time. -1
+                for times outside of the grid.
+        """
+        return self.__get_positions_of_seconds(_get_seconds(times))
+
+    def get_positions_of_timedeltas(
+        self, timedeltas: Sequence[datetime.timedelta],
+        interval_end: bool = True
+    ) -> np.ndarray:
+        """Get the position on the grid of time intervals given as time since
+        midnight, e.g. the keys of FlowRealData.flow_data.
+
+        Args:
+            timedeltas: Time since midnight of each time interval.
+            interval_end: Whether timedeltas mark the end of each time interval
+                instead of its start.
+        Returns:
+            positions: 0-based position of each time interval. -1 for times
+                outside of the grid.
+        """
+        seconds = np.array([timedelta.total_seconds()
+                            for timedelta in timedeltas], dtype=float)
+        if interval_end:
+            seconds -= self.time_step
+        return self.__get_positions_of_seconds(seconds)
+
+    def get_positions_of_time_interval_indices(
+        self, time_interval_indices: Sequence[int]
+    ) -> np.ndarray:
+        """Get the position on the grid of time intervals of the simulation
+        output databases.
+
+        Args:
+            time_interval_indices: 1-based index of each time interval, e.g.
+                the `ent` column of an output table.
+        Returns:
+            positions: 0-based position of each time interval. -1 for the
+                aggregate of all time intervals (index 0) and indices outside
+                of the grid.
+        """
+        positions = np.asarray(time_interval_indices, dtype=np.int64) - 1
+        return np.where((positions >= 0)
+                        & (positions < self.num_time_intervals), positions, -1)
+
+    def get_interval_end_timedeltas(
+        self, times: Sequence[datetime.time]
+    ) -> List[datetime.timedelta]:
+        """Get the end of the time intervals starting at the given times, the
+        key of their data in FlowRealData.flow_data. The times do not need to
+        be on the grid.
+
+        Args:
+            times: Start time of each time interval.
+        Returns:
+            timedeltas: End of each time interval, as time since midnight.
+        """
+        return [datetime.timedelta(seconds=second)
+                for second in (_get_seconds(times) + self.time_step).tolist()]
+
+    def convert_count_to_hourly_flow(self, count: np.ndarray) -> np.ndarray:
+        """Convert numbers of vehicles per time interval to flows in vehicles
+        per hour.
+
+        Args:
+            count: Number of vehicles per time interval.
+        Returns:
+            flow: Flow in vehicles per hour.
+        """
+        return np.asarray(count, dtype=float) * self.hourly_flow_factor
+
+    def __get_positions(self, positions: Sequence[int] = None) -> np.ndarray:
+        """Get positions as an array, defaulting to all time intervals when
+        positions is None."""
+        if positions is None:
+            return np.arange(self.num_time_intervals)
+        return np.asarray(positions, dtype=np.int64)
+
+    def __get_start_seconds(
+        self, positions: Sequence[int] = None
+    ) -> np.ndarray:
+        """Get the start of time intervals in seconds since midnight."""
+        return self.start_time_seconds \
+            + self.__get_positions(positions) * self.time_step
+
+    def __get_positions_of_seconds(self, seconds: np.ndarray) -> np.ndarray:
+        """Get the position of the time intervals containing times given in
+        seconds since midnight, -1 outside of the grid."""
+        positions = np.floor_divide(
+            seconds - self.start_time_seconds, self.time_step).astype(np.int64)
+        return np.where((positions >= 0)
+                        & (positions < self.num_time_intervals), positions, -1)
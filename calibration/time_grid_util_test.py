@@ -0,0 +1,90 @@
+"""Tests for time_grid_util."""
+
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from calibration.output_database_test_util import (
+    NUM_TIME_INTERVALS,
+    START_TIME_SECONDS,
+    TIME_LIST,
+    TIME_STEP_SECONDS,
+    create_micro_output_database,
+)
+from calibration.postprocessing_util import AimsunMicroOutputDatabase
+from calibration.time_grid_util import TimeGrid
+from utils import metadata_settings
+
+
+class TestTimeGrid(unittest.TestCase):
+    """Test the conversions between the representations of time."""
+
+    def setUp(self):
+        self.time_grid = TimeGrid.from_metadata_settings()
+
+    def test_from_metadata_settings(self):
+        """Test that the grid matches the time intervals of the study."""
+        time_intervals = metadata_settings.get_time_intervals()
+        self.assertEqual(self.time_grid.num_time_intervals,
+                         len(time_intervals))
+        self.assertEqual(self.time_grid.get_times(), time_intervals)
+        np.testing.assert_array_equal(
+            self.time_grid.get_positions_of_times(time_intervals),
+            np.arange(len(time_intervals)))
+        self.assertEqual(self.time_grid.hourly_flow_factor, 4)
+
+    def test_timedeltas(self):
+        """Test the conversion of the keys of real flow data."""
+        timedeltas = self.time_grid.get_timedeltas([0, 5])
+        self.assertEqual(timedeltas, [datetime.timedelta(hours=14, minutes=15),
+                                      datetime.timedelta(hours=15, minutes=30)])
+        np.testing.assert_array_equal(
+            self.time_grid.get_positions_of_timedeltas(timedeltas), [0, 5])
+        np.testing.assert_array_equal(
+            self.time_grid.get_positions_of_timedeltas(
+                timedeltas, interval_end=False), [1, 6])
+        self.assertEqual(self.time_grid.get_timedeltas([0], False),
+                         [datetime.timedelta(hours=14)])
+        self.assertEqual(
+            self.time_grid.get_interval_end_timedeltas(
+                [datetime.time(1, 1)]),
+            [datetime.timedelta(hours=1, minutes=16)])
+
+    def test_positions(self):
+        """Test that times within an interval map to it, and times outside of
+        the grid to -1."""
+        np.testing.assert_array_equal(
+            self.time_grid.get_positions_of_times([
+                datetime.time(14, 14, 59), datetime.time(19, 59),
+                datetime.time(13, 59), datetime.time(20, 0)]),
+            [0, 23, -1, -1])
+        np.testing.assert_array_equal(
+            self.time_grid.get_positions_of_time_interval_indices(
+                [0, 1, 24, 25]), [-1, 0, 23, -1])
+        np.testing.assert_array_equal(
+            self.time_grid.get_time_interval_indices([0, 23]), [1, 24])
+        np.testing.assert_array_equal(
+            self.time_grid.convert_count_to_hourly_flow([10, 11.5]),
+            [40.0, 46.0])
+
+    def test_output_database_time_grid(self):
+        """Test the time grid of a simulation output database."""
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "output.sqlite")
+            create_micro_output_database(database_path)
+            database = AimsunMicroOutputDatabase(database_path)
+            time_grid = database.get_time_grid()
+            np.testing.assert_array_equal(
+                time_grid.get_time_interval_indices(
+                    time_grid.get_positions_of_times(TIME_LIST)),
+                database.convert_times_to_int(TIME_LIST))
+            database.close()
+        self.assertEqual(time_grid, TimeGrid(
+            START_TIME_SECONDS, TIME_STEP_SECONDS, NUM_TIME_INTERVALS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 """Initializes global variables throughout the simulation process."""
 
 import datetime
-from typing import List
+from typing import List, Tuple
 
 # Set path to data folder. Default set for fremont example.
 __DATA_FOLDER_PATH = (
@@ -35,6 +35,12 @@ def get_simulation_year() -> int:
     return __YEAR_OF_SIMULATION
 
 
+def get_time_interval_settings() -> Tuple[int, int, int]:
+    """Return start hour, end hour and length in minutes of the time intervals
+    used within the study."""
+    return __START_HOUR, __END_HOUR, __TIMESTEP_MINUTES
+
+
 def get_time_intervals() -> List[datetime.time]:
     """Return time intervals used within the study."""
     time_intervals = []